@@ -0,0 +1,262 @@
+#aggregation_plan.py
+import numpy as np
+import pandas as pd
+
+from helper_funcs import SHUTDOWN_DATE_FORMATS, parse_date_column, validate_columns
+from stage_trace import span
+from tp_3_1 import aggregate_data_3_1
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Per-employee identity columns kept in the roster (first non-empty value of each employee)
+ROSTER_COLUMNS = ["FIRSTNAME", "LASTNAME", "EMPLOYMENTSTARTDATE", "MONTHLY_SALARY"]
+
+# Per-employee totals used by TP2.1: column -> aggregation over the employee's rows
+TOTALS_AGGREGATIONS = {
+    "TERMINATIONDATE": "min",
+    "BANK_PAY_AMOUNT": "sum",
+    "LEAVE_INCOME": "sum",
+}
+
+# Number of claimed-amount period columns on TP3.2 (G to V)
+CLAIMED_PERIOD_CAPACITY = 16
+
+
+def parse_amounts(amounts):
+    """
+    Convert BANK_PAY_AMOUNT values to floats.
+
+    Numbers are used as they are and strings may contain thousands separators.
+    Missing, blank or unparseable values become 0.
+
+    Args:
+        amounts (Series): The raw BANK_PAY_AMOUNT values.
+
+    Returns:
+        Series: The amounts as floats.
+    """
+    parsed = pd.to_numeric(amounts, errors="coerce").astype(float)
+
+    # Retry the values that did not convert directly without separators and padding
+    retry = parsed.isna() & amounts.notna()
+    if retry.any():
+        cleaned = amounts[retry].astype(str).str.replace(",", "", regex=False).str.strip()
+        parsed[retry] = pd.to_numeric(cleaned, errors="coerce")
+
+    return parsed.fillna(0.0)
+
+
+def format_period_column(from_dates, till_dates):
+    """
+    Build the "dd Month yyyy to dd Month yyyy" period string for each row.
+
+    Each distinct date is formatted once.
+
+    Args:
+        from_dates (Series): Parsed SHUTDOWN_FROM dates.
+        till_dates (Series): Parsed SHUTDOWN_TILL dates.
+
+    Returns:
+        Series: The period strings, None where either date is missing.
+    """
+    def date_labels(dates):
+        codes, uniques = pd.factorize(dates)
+        labels = np.append(np.asarray(pd.DatetimeIndex(uniques).strftime("%d %B %Y"), dtype=object), None)
+        return codes, labels[codes]  # code -1 (missing) picks the trailing None
+
+    from_codes, from_labels = date_labels(from_dates)
+    till_codes, till_labels = date_labels(till_dates)
+
+    present = (from_codes >= 0) & (till_codes >= 0)
+    periods = np.full(len(from_dates), None, dtype=object)
+    periods[present] = from_labels[present] + " to " + till_labels[present]
+    return pd.Series(periods, index=from_dates.index, dtype=object)
+
+
+class AggregationPlan:
+    """
+    Per-employee aggregates of a data file, computed once and shared by every TP sheet.
+
+    IDNUMBER is factorized once (rows without one are left out). A single groupby over the
+    employee codes builds the roster, one row per employee with the first non-empty
+    ROSTER_COLUMNS values, and every employee sheet (TP2.1, TP2.2, TP3.2, TP3.3) is a view of it.
+    Views are built on first use and cached, so a "Generate ALL" run aggregates each file once.
+
+    Args:
+        data (pd.DataFrame): The filtered source data. It is never modified.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        with span("aggregate", rows=len(data)):
+            self.employee_codes, self.employee_ids = pd.factorize(data["IDNUMBER"], sort=True)
+        self._views = {}
+
+    def _view(self, name, build):
+        """Return the cached view `name`, building it with `build` on first use (timed as an "aggregate" stage)."""
+        if name not in self._views:
+            with span("aggregate") as aggregate_span:
+                view = build()
+                if isinstance(view, pd.DataFrame):
+                    aggregate_span.count(rows=len(view))
+            self._views[name] = view
+        return self._views[name]
+
+    @property
+    def _employee_groups(self):
+        """DataFrameGroupBy: The rows with an IDNUMBER, grouped by employee code."""
+        def build():
+            has_id = self.employee_codes >= 0
+            return self.data[has_id].groupby(self.employee_codes[has_id], sort=True)
+        return self._view("employee_groups", build)
+
+    @property
+    def roster_by_id(self):
+        """
+        DataFrame: One row per employee in IDNUMBER order, with IDNUMBER and the ROSTER_COLUMNS present.
+
+        Each column holds the employee's first non-empty value, taken column by column as the
+        TP sheets always have, so a name missing on the first row is filled from a later row
+        rather than left blank. The values in one roster row may therefore come from different rows.
+        """
+        def build():
+            columns = [column for column in ROSTER_COLUMNS if column in self.data.columns]
+            roster = self._employee_groups[columns].first()
+            roster.insert(0, "IDNUMBER", self.employee_ids[roster.index])
+            return roster.reset_index(drop=True)
+        return self._view("roster_by_id", build)
+
+    @property
+    def roster(self):
+        """DataFrame: The roster sorted by LASTNAME; employees with the same surname stay in IDNUMBER order."""
+        return self._view("roster", lambda: self.roster_by_id.sort_values(by="LASTNAME", kind="stable"))
+
+    def employees_2_1(self):
+        """
+        The TP2.1 view: the roster with each employee's termination date and totals.
+
+        Returns:
+            DataFrame: IDNUMBER, FIRSTNAME, LASTNAME, EMPLOYMENTSTARTDATE, TERMINATIONDATE,
+            BANK_PAY_AMOUNT, LEAVE_INCOME and MONTHLY_SALARY, sorted by LASTNAME.
+
+        Raises:
+            KeyError: If a required column is missing in the data.
+        """
+        def build():
+            validate_columns(self.data, ["IDNUMBER", *ROSTER_COLUMNS, *TOTALS_AGGREGATIONS])
+            totals = self._employee_groups.agg(TOTALS_AGGREGATIONS).reset_index(drop=True)
+            view = self.roster.join(totals)
+            return view[[
+                "IDNUMBER", "FIRSTNAME", "LASTNAME", "EMPLOYMENTSTARTDATE", "TERMINATIONDATE",
+                "BANK_PAY_AMOUNT", "LEAVE_INCOME", "MONTHLY_SALARY"
+            ]]
+        return self._view("employees_2_1", build)
+
+    def employees_2_2(self):
+        """
+        The TP2.2 view of the roster.
+
+        Returns:
+            DataFrame: IDNUMBER, LASTNAME, FIRSTNAME and EMPLOYMENTSTARTDATE, sorted by LASTNAME.
+
+        Raises:
+            KeyError: If a required column is missing in the data.
+        """
+        def build():
+            validate_columns(self.data, ["IDNUMBER", "LASTNAME", "FIRSTNAME", "EMPLOYMENTSTARTDATE"])
+            return self.roster[["IDNUMBER", "LASTNAME", "FIRSTNAME", "EMPLOYMENTSTARTDATE"]]
+        return self._view("employees_2_2", build)
+
+    def employees_3_3(self):
+        """
+        The TP3.3 view of the roster.
+
+        Returns:
+            DataFrame: IDNUMBER, FIRSTNAME and LASTNAME, sorted by LASTNAME.
+
+        Raises:
+            KeyError: If a required column is missing in the data.
+        """
+        def build():
+            validate_columns(self.data, ["IDNUMBER", "FIRSTNAME", "LASTNAME"])
+            return self.roster[["IDNUMBER", "FIRSTNAME", "LASTNAME"]]
+        return self._view("employees_3_3", build)
+
+    def payments_3_1(self):
+        """
+        The TP3.1 view: payments grouped by PAY_REF_ITR_1 (see `aggregate_data_3_1`).
+
+        Returns:
+            DataFrame: PAY_REF_ITR_1, Month, PaymentDate and TotalBankPayAmount.
+
+        Raises:
+            KeyError: If a required column is missing in the data.
+        """
+        def build():
+            columns = ["PAYMENTDATE", "PAY_REF_ITR_1", "BANK_PAY_AMOUNT"]
+            validate_columns(self.data, columns)
+            # aggregate_data_3_1 rewrites PAYMENTDATE, so it works on a copy of the columns it needs
+            return aggregate_data_3_1(self.data[columns].copy())
+        return self._view("payments_3_1", build)
+
+    def claims_3_2(self):
+        """
+        The TP3.2 view: the amount claimed per employee and lockdown period.
+
+        Only employees with at least one valid shutdown period are included, in IDNUMBER order.
+        The periods are ordered by start date and at most CLAIMED_PERIOD_CAPACITY get a column.
+
+        Returns:
+            DataFrame: IDNUMBER, FIRSTNAME, LASTNAME, TERMINATION_STATUS ("IN SERVICE") and one
+            column of BANK_PAY_AMOUNT totals per period.
+
+        Raises:
+            KeyError: If a required column is missing in the data.
+        """
+        return self._view("claims_3_2", self._build_claims_3_2)
+
+    def _build_claims_3_2(self):
+        validate_columns(self.data, ["IDNUMBER", "FIRSTNAME", "LASTNAME", "BANK_PAY_AMOUNT", "SHUTDOWN_FROM", "SHUTDOWN_TILL"])
+
+        # 1. Parse the amounts and the period of every row (same parsing as the TP3.2 headings)
+        amounts = parse_amounts(self.data["BANK_PAY_AMOUNT"]).to_numpy()
+        from_dates, _ = parse_date_column(self.data["SHUTDOWN_FROM"], SHUTDOWN_DATE_FORMATS)
+        till_dates, _ = parse_date_column(self.data["SHUTDOWN_TILL"], SHUTDOWN_DATE_FORMATS)
+        periods = format_period_column(from_dates, till_dates).to_numpy()
+
+        # 2. Keep the rows that have both an employee and a period
+        has_claim = (self.employee_codes >= 0) & pd.notna(periods)
+        codes, periods = self.employee_codes[has_claim], periods[has_claim]
+        amounts, from_dates = amounts[has_claim], from_dates.to_numpy()[has_claim]
+
+        # 3. Periods in chronological order; for a shared start date the first employee's period wins
+        candidates = pd.DataFrame({"order": from_dates, "code": codes, "period": periods})
+        period_names = (
+            candidates.sort_values(["order", "code", "period"], kind="stable")
+            .drop_duplicates(subset=["order"])
+            .drop_duplicates(subset=["period"])["period"]
+            .tolist()
+        )
+        claimed_periods = period_names[:CLAIMED_PERIOD_CAPACITY]
+        logger.debug("Total periods to process: %d", len(period_names))
+        for period in period_names[CLAIMED_PERIOD_CAPACITY:]:
+            logger.debug("Ignoring period %s - exceeds available columns", period)
+
+        # 4. Sum the amounts per (employee, period) and scatter them into the employee x period matrix
+        employees = np.unique(codes)
+        period_columns = pd.Index(claimed_periods).get_indexer(periods)
+        claimed = period_columns >= 0
+        sums = pd.Series(amounts[claimed]).groupby([codes[claimed], period_columns[claimed]]).sum()
+        matrix = np.zeros((len(employees), len(claimed_periods)))
+        matrix[
+            np.searchsorted(employees, sums.index.get_level_values(0)),
+            sums.index.get_level_values(1)
+        ] = 0.0 + sums.to_numpy()
+
+        # 5. One row per employee, all "IN SERVICE", followed by the claimed amounts
+        aggregated_data = self.roster_by_id.loc[employees, ["IDNUMBER", "FIRSTNAME", "LASTNAME"]].reset_index(drop=True)
+        aggregated_data["TERMINATION_STATUS"] = "IN SERVICE"
+        for i, period in enumerate(claimed_periods):
+            aggregated_data[period] = matrix[:, i]
+        return aggregated_data
@@ -8,29 +8,25 @@ import shutil
 from datetime import datetime
 
 # Import existing logic
-from helper_funcs import get_company_info, create_folder_structure_for_all_working_papers
-from helper_funcs import load_data_file
-from tp_1 import process_files as process_tp1, process_files_for_all_processing as process_tp1_all
-from tp_2 import process_files as process_tp2, process_files_for_all_processing as process_tp2_all
-from tp_3 import process_files as process_tp3, process_files_for_all_processing as process_tp3_all
-from tp_4 import process_files as process_tp4, process_files_for_all_processing as process_tp4_all
-
-
-def get_template_paths() -> List[str]:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    templates_dir = os.path.join(script_dir, "TEMPLATES", "Working_Papers_Templates")
-    if not os.path.exists(templates_dir):
-        raise FileNotFoundError(
-            f"Working_Papers_Templates folder not found in {os.path.join(script_dir, 'TEMPLATES')}"
-        )
-    templates = sorted([
-        os.path.join(templates_dir, f) for f in os.listdir(templates_dir) if f.endswith(".xlsx")
-    ])
-    if len(templates) < 4:
-        raise FileNotFoundError(
-            "Not enough template files found. Ensure there are at least 4 templates in the Working_Papers_Templates folder."
-        )
-    return templates
+from helper_funcs import get_company_info
+from helper_funcs import probe_data_file_header
+from data_cache import load_cached_data_file_context
+from log_utils import configure_logging
+from batch import (
+    default_worker_count,
+    format_duration,
+    format_memory,
+    format_stages,
+    get_batch_pool,
+    get_template_paths,
+    run_batch,
+)
+
+
+@st.cache_resource
+def start_worker_pool():
+    """Start the worker pool shared by every session of this server, so its workers warm up before the first job."""
+    return get_batch_pool()
 
 
 def persist_uploaded_files(uploaded_files: List[Any]) -> List[str]:
@@ -64,8 +60,8 @@ REQUIRED_COLUMNS = [
 def check_required_columns(file_path: str) -> List[str]:
     """Return list of missing required columns for the given Excel file."""
     try:
-        _, sheet = load_data_file(file_path)
-        headers = [cell.value for cell in sheet[1]]
+        # Only the header row is read, the rest of the workbook is never parsed
+        headers, _ = probe_data_file_header(file_path)
         missing = [c for c in REQUIRED_COLUMNS if c not in headers]
         return missing
     except Exception as e:
@@ -77,7 +73,9 @@ def show_company_overview(file_paths: List[str]) -> None:
     st.subheader("Review extracted details")
     for fp in file_paths:
         try:
-            company_name, uif_ref, periods_claimed, number_of_employees, total_amount_claimed = get_company_info(fp)
+            company_name, uif_ref, periods_claimed, number_of_employees, total_amount_claimed = get_company_info(
+                load_cached_data_file_context(fp)
+            )
             periods_list = periods_claimed.split(",") if isinstance(periods_claimed, str) and periods_claimed else []
 
             with st.container(border=True):
@@ -109,23 +107,9 @@ def validate_ready(files: List[str], consultant: str, templates: List[str]) -> T
     return (len(issues) == 0, issues)
 
 
-def process_single_wp(wp_index: int, name: str, file_path: str, template_paths: List[str], consultant: str, outdir: str):
-    funcs = [process_tp1, process_tp2, process_tp3, process_tp4]
-    return funcs[wp_index](file_path, template_paths[wp_index], consultant, outdir)
-
-
-def process_all_for_file(file_path: str, template_paths: List[str], consultant: str, outdir: str):
-    # Create structure once per file
-    company_name, uif_ref, periods_claimed, number_of_employees, total_amount_claimed = get_company_info(file_path)
-    audit_working_papers_folder = create_folder_structure_for_all_working_papers(
-        outdir, company_name, uif_ref, file_path, template_paths
-    )
-    funcs_all = [process_tp1_all, process_tp2_all, process_tp3_all, process_tp4_all]
-    for i in range(4):
-        funcs_all[i](file_path, template_paths[i], consultant, audit_working_papers_folder)
-
-
 def main():
+    # Log to the server's stderr at AUDITFLOW_LOG_LEVEL (INFO by default), before the worker pool starts
+    configure_logging()
     st.set_page_config(page_title="AuditFlow Working Paper Generator", page_icon="📄", layout="wide")
     st.title("AuditFlow Working Paper Generator")
     st.markdown(
@@ -146,6 +130,16 @@ def main():
         uploaded = st.file_uploader(
             "Upload UIF Excel data files (.xlsx)", type=["xlsx"], accept_multiple_files=True
         )
+        workers = st.number_input(
+            "Parallel workers",
+            min_value=1,
+            max_value=max(os.cpu_count() or 1, default_worker_count()),
+            value=default_worker_count(),
+            key="batch_workers",
+            help="Number of data files processed at the same time.",
+        )
+        # Start the shared worker pool on the server's first page load
+        start_worker_pool()
         # Auto-load templates on first launch
         if "template_paths" not in st.session_state:
             try:
@@ -213,37 +207,22 @@ def main():
             st.session_state.output_dir = tempfile.mkdtemp(prefix="auditflow_out_")
         outdir = st.session_state.output_dir
 
+        wp_indexes = [i for i, pressed in enumerate([btn_tp1, btn_tp2, btn_tp3, btn_tp4]) if pressed]
+        completed = []
+
+        def show_progress(index, result):
+            # Files finish in any order when they run in parallel
+            completed.append(index)
+            status_area.info(f"Processed: {result['File']} ({len(completed)}/{len(files)})")
+            progress.progress(int((len(completed) / len(files)) * 100))
+
         try:
-            for idx, fp in enumerate(files):
-                file_name = os.path.basename(fp)
-                status_area.info(f"Processing: {file_name} ({idx+1}/{len(files)})")
-                start = time.time()
-                try:
-                    if btn_all:
-                        process_all_for_file(fp, template_paths, consultant, outdir)
-                    else:
-                        if btn_tp1:
-                            process_single_wp(0, "TP.1", fp, template_paths, consultant, outdir)
-                        if btn_tp2:
-                            process_single_wp(1, "TP.2", fp, template_paths, consultant, outdir)
-                        if btn_tp3:
-                            process_single_wp(2, "TP.3", fp, template_paths, consultant, outdir)
-                        if btn_tp4:
-                            process_single_wp(3, "TP.4", fp, template_paths, consultant, outdir)
-                    duration = time.time() - start
-                    results.append({
-                        "File": file_name,
-                        "Status": "Success",
-                        "Time": f"{int(duration//60)}m {int(duration%60)}s {int((duration%1)*1000)}ms",
-                    })
-                except Exception as e:
-                    duration = time.time() - start
-                    results.append({
-                        "File": file_name,
-                        "Status": f"Failed: {e}",
-                        "Time": f"{int(duration//60)}m {int(duration%60)}s {int((duration%1)*1000)}ms",
-                    })
-                progress.progress(int(((idx + 1) / len(files)) * 100))
+            status_area.info(f"Processing {len(files)} file(s) with up to {int(workers)} worker(s)")
+            results = run_batch(
+                files, template_paths, consultant, outdir,
+                wp_indexes=wp_indexes, generate_all=btn_all,
+                max_workers=int(workers), on_result=show_progress,
+            )
         finally:
             total = time.time() - overall_start
             progress.progress(100)
@@ -251,8 +230,22 @@ def main():
 
         st.success("Processing complete")
         st.subheader("Results")
-        st.dataframe(results, use_container_width=True, hide_index=True)
-        st.info(f"Total time: {int(total//60)}m {int(total%60)}s {int((total%1)*1000)}ms")
+        st.dataframe(
+            [
+                {
+                    "File": row["File"],
+                    "Status": row["Status"],
+                    "Time": row["Time"],
+                    # Where the time went: load / convert / aggregate / insert / format / populate / save
+                    "Stages": format_stages(row["Stages"]),
+                    # Memory high-water marks, when AUDITFLOW_TRACE_MEMORY is set
+                    "Peak memory": format_memory(row["Memory"]),
+                }
+                for row in results
+            ],
+            use_container_width=True, hide_index=True
+        )
+        st.info(f"Total time: {format_duration(total)}")
 
         # Zip the output folder and provide download with dynamic date and company count
         date_str = datetime.now().strftime("%Y-%m-%d")
@@ -0,0 +1,379 @@
+#batch.py
+import collections
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from helper_funcs import (
+    DataFileContext,
+    create_folder_structure_for_all_working_papers,
+    get_company_folder_name,
+    get_working_paper_path_for_all_processing
+)
+from data_cache import load_cached_data_file_context
+from memory_monitor import MemoryCeilingExceeded
+from shared_frame import share_data_file_context
+from stage_trace import StageTrace, add_span, span, traced_call
+from template_manifest import load_template_manifest
+from worker_pool import WorkerPool, get_worker_pool, in_worker
+from xlsx_stream import preload_template
+from tp_1 import process_files as process_tp1, process_files_for_all_processing as process_tp1_all
+from tp_2 import process_files as process_tp2, process_files_for_all_processing as process_tp2_all
+from tp_3 import process_files as process_tp3, process_files_for_all_processing as process_tp3_all
+from tp_4 import process_files as process_tp4, process_files_for_all_processing as process_tp4_all
+from log_utils import configure_logging, configured_log_level, get_logger
+
+logger = get_logger(__name__)
+
+# Environment variable setting the default number of batch worker processes
+BATCH_WORKERS_ENV = "AUDITFLOW_BATCH_WORKERS"
+
+WP_NAMES = ["TP.1", "TP.2", "TP.3", "TP.4"]
+
+# Suffix of the stage trace written next to each company's output folder
+TRACE_FILE_SUFFIX = ".trace.json"
+
+# Order in which the working papers of one file are handed to workers, TP.3 takes the longest
+WP_SUBMIT_ORDER = [2, 1, 0, 3]
+
+# Every batch (and every file fanned out to workers) is its own client of the shared worker pool
+_client_ids = itertools.count()
+
+# (templates folder, folder mtime) -> sorted template paths, so reruns do not re-list the folder
+_template_paths_memo = {}
+
+
+def get_template_paths() -> List[str]:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    templates_dir = os.path.join(script_dir, "TEMPLATES", "Working_Papers_Templates")
+    if not os.path.exists(templates_dir):
+        raise FileNotFoundError(
+            f"Working_Papers_Templates folder not found in {os.path.join(script_dir, 'TEMPLATES')}"
+        )
+    memo_key = (templates_dir, os.stat(templates_dir).st_mtime_ns)
+    templates = _template_paths_memo.get(memo_key)
+    if templates is None:
+        templates = sorted([
+            os.path.join(templates_dir, f) for f in os.listdir(templates_dir) if f.endswith(".xlsx")
+        ])
+        _template_paths_memo.clear()
+        _template_paths_memo[memo_key] = templates
+    templates = list(templates)
+    if len(templates) < 4:
+        raise FileNotFoundError(
+            "Not enough template files found. Ensure there are at least 4 templates in the Working_Papers_Templates folder."
+        )
+    return templates
+
+
+def process_single_wp(wp_index: int, name: str, file_path: Any, template_paths: List[str], consultant: str, outdir: str):
+    # file_path may also be an already parsed DataFileContext
+    funcs = [process_tp1, process_tp2, process_tp3, process_tp4]
+    return funcs[wp_index](file_path, template_paths[wp_index], consultant, outdir)
+
+
+def warm_up_worker(template_paths: List[str], log_level: Optional[int] = None):
+    """
+    Prepare a worker of the batch pool before its first job.
+
+    Importing this module already imports pandas, openpyxl and the working paper modules; the
+    templates and their layout manifests are read here.
+
+    Args:
+        template_paths (list): The working paper template paths (TP.1 - TP.4).
+        log_level (int): The log level of the process starting the pool (see `configure_logging`).
+    """
+    # Spawned workers start with logging unconfigured
+    configure_logging(log_level)
+    for wp_index, template_path in enumerate(template_paths[:len(WP_NAMES)]):
+        load_template_manifest(template_path, wp_n=wp_index + 1)
+        preload_template(template_path)
+
+
+def get_batch_pool(max_workers: Optional[int] = None) -> WorkerPool:
+    """
+    Return the process-wide worker pool running batch jobs, starting it on first use.
+
+    The workers are warmed up with `warm_up_worker`. The pool is shared by every batch (and every
+    Streamlit session) of this process.
+
+    Args:
+        max_workers (int): Number of workers, if the pool is started by this call. Defaults to
+            `default_worker_count()`.
+
+    Returns:
+        WorkerPool: The batch pool.
+    """
+    try:
+        template_paths = get_template_paths()
+    except FileNotFoundError:
+        template_paths = []
+    return get_worker_pool(
+        max_workers or default_worker_count(), initializer=warm_up_worker, initargs=(template_paths, configured_log_level())
+    )
+
+
+def _failed_future(error: Exception) -> Future:
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+def run_on_pool(calls: Sequence[tuple], max_in_flight: int, on_done: Callable[[int, Future], None]):
+    """
+    Run calls on the batch pool as one client, keeping at most `max_in_flight` of them running.
+
+    Args:
+        calls (Sequence[tuple]): The `(fn, args)` to run.
+        max_in_flight (int): Maximum number of calls queued or running at the same time.
+        on_done (callable): Called as `on_done(index, future)` as each call completes, in
+            completion order. A call that could not be sent to a worker gets a failed future.
+    """
+    pool = get_batch_pool()
+    client = next(_client_ids)
+    pending = collections.deque(enumerate(calls))
+    in_flight = {}
+    while pending or in_flight:
+        while pending and len(in_flight) < max_in_flight:
+            index, (fn, args) = pending.popleft()
+            try:
+                in_flight[pool.submit(client, fn, *args)] = index
+            except Exception as e:
+                on_done(index, _failed_future(e))
+        if in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                on_done(in_flight.pop(future), future)
+
+
+def process_all_for_file(file_path: Any, template_paths: List[str], consultant: str, outdir: str, max_workers: int = 1) -> str:
+    # file_path may also be an already parsed DataFileContext; returns the AUDIT WORKING PAPERS folder
+    # Parse the data file once and share it across TP.1 - TP.4
+    if isinstance(file_path, DataFileContext):
+        data_context = file_path
+    else:
+        data_context = load_cached_data_file_context(file_path)
+    # Create structure once per file
+    with span("folders"):
+        audit_working_papers_folder = create_folder_structure_for_all_working_papers(
+            outdir, data_context.tradename, data_context.uif_reference, data_context.data_file_path, template_paths
+        )
+    funcs_all = [process_tp1_all, process_tp2_all, process_tp3_all, process_tp4_all]
+    if max_workers <= 1 or in_worker():
+        for i in range(4):
+            with span(WP_NAMES[i]):
+                funcs_all[i](data_context, template_paths[i], consultant, audit_working_papers_folder)
+        return audit_working_papers_folder
+
+    # The working papers are independent, generate them side by side. The parsed data file is
+    # exported once into shared memory, so no worker reads the xlsx again or unpickles the data.
+    # Each worker records its working paper's stages in a span of its own.
+    wp_spans = {}
+    errors = {}  # working paper index -> the error it failed with
+
+    def collect(index, future):
+        try:
+            _, wp_spans[WP_SUBMIT_ORDER[index]] = future.result()
+        except (Exception, MemoryCeilingExceeded) as e:
+            logger.error("%s failed - %s", WP_NAMES[WP_SUBMIT_ORDER[index]], e)
+            errors[WP_SUBMIT_ORDER[index]] = e
+
+    with share_data_file_context(data_context) as shared_context:
+        run_on_pool(
+            [(traced_call, (WP_NAMES[i], funcs_all[i], shared_context, template_paths[i], consultant, audit_working_papers_folder)) for i in WP_SUBMIT_ORDER],
+            max_workers,
+            collect,
+        )
+    # Add the working papers to the trace in order rather than in completion order
+    for wp_index in sorted(wp_spans):
+        add_span(wp_spans[wp_index])
+    if len(errors) == 1:
+        raise next(iter(errors.values()))
+    if errors:
+        # Report every working paper that failed, not only the first one
+        message = "; ".join(f"{WP_NAMES[wp_index]}: {errors[wp_index]}" for wp_index in sorted(errors))
+        first_error = errors[min(errors)]
+        if any(isinstance(e, MemoryCeilingExceeded) for e in errors.values()):
+            raise MemoryCeilingExceeded(message) from first_error
+        raise RuntimeError(message) from first_error
+    return audit_working_papers_folder
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration as shown in the results table (e.g. "1m 5s 250ms")."""
+    return f"{int(seconds//60)}m {int(seconds%60)}s {int((seconds%1)*1000)}ms"
+
+
+def format_stages(stages: Dict[str, float]) -> str:
+    """Format the seconds spent per stage, e.g. "load 0.12s, convert 0.30s"."""
+    return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stages.items())
+
+
+def format_memory(memory: Dict[str, Any]) -> str:
+    """Format the memory peaks of a job, e.g. "RSS 812.4 MB (convert), Python 301.2 MB", or "" when not recorded."""
+    if not memory:
+        return ""
+    text = f"RSS {memory['rss_peak_mb']:.1f} MB"
+    if "peak_stage" in memory:
+        text += f" ({memory['peak_stage']})"
+    if "py_peak_mb" in memory:
+        text += f", Python {memory['py_peak_mb']:.1f} MB"
+    return text
+
+
+def default_worker_count() -> int:
+    """
+    Return the default number of batch worker processes.
+
+    `AUDITFLOW_BATCH_WORKERS` overrides the default, which is the number of CPUs.
+    """
+    value = os.environ.get(BATCH_WORKERS_ENV)
+    if value:
+        return max(1, int(value))
+    return os.cpu_count() or 1
+
+
+def process_file(file_path: str, template_paths: List[str], consultant: str, outdir: str,
+                 wp_indexes: Sequence[int] = (), generate_all: bool = False, wp_workers: int = 1) -> Dict[str, Any]:
+    """
+    Generate the selected working papers for one data file.
+
+    This is the unit of work of a batch; it runs in a worker process and never raises, so one
+    bad file cannot stop the others.
+
+    The job is traced (see `stage_trace`): the time spent per stage is returned with the result,
+    and the full trace (wall and CPU time, row/cell counts per stage per working paper) is written
+    next to the company's output folder as "<company folder>.trace.json". With memory accounting
+    on (see `memory_monitor`), the trace also holds the memory peaks of every stage, and a job
+    going over the memory ceiling is aborted and reported as failed.
+
+    Args:
+        file_path (str): Path to the data file.
+        template_paths (list): The working paper template paths (TP.1 - TP.4).
+        consultant (str): Name of the consultant.
+        outdir (str): The output directory.
+        wp_indexes (Sequence[int]): The working papers to generate (0 - 3), when not generating all.
+        generate_all (bool): Generate TP.1 - TP.4 in one folder structure (`process_all_for_file`).
+        wp_workers (int): Number of processes generating TP.1 - TP.4 side by side when generating all.
+
+    Returns:
+        dict: The results table row ({"File", "Status", "Time"}), with the wall seconds spent per
+        stage under "Stages", the memory peaks under "Memory" (see `StageTrace.memory_peaks`), the
+        path of the trace under "Trace" (None if none was written) and the paths of the working
+        papers written under "Outputs". The status is "Success" only if every working paper was written.
+    """
+    start = time.time()
+    trace = StageTrace(os.path.basename(file_path))
+    data_context = None
+    outputs = {}  # working paper name -> path of the working paper written (None if none was)
+    try:
+        with trace.activate():
+            data_context = load_cached_data_file_context(file_path)
+            if generate_all:
+                audit_working_papers_folder = process_all_for_file(data_context, template_paths, consultant, outdir, max_workers=wp_workers)
+                for wp_index, name in enumerate(WP_NAMES):
+                    outputs[name] = get_working_paper_path_for_all_processing(
+                        audit_working_papers_folder, data_context.tradename, wp_n=wp_index + 1, uif_reference=data_context.uif_reference
+                    )
+            else:
+                for wp_index in wp_indexes:
+                    with span(WP_NAMES[wp_index]):
+                        outputs[WP_NAMES[wp_index]] = process_single_wp(wp_index, WP_NAMES[wp_index], data_context, template_paths, consultant, outdir)
+        # Only a job that wrote every working paper succeeded
+        missing = [name for name, path in outputs.items() if not path or not os.path.isfile(path)]
+        if missing:
+            raise RuntimeError(f"{', '.join(missing)} not written")
+        status = "Success"
+    except (Exception, MemoryCeilingExceeded) as e:
+        status = f"Failed: {e}"
+
+    trace_path = None
+    if data_context is not None:
+        # Next to the company folder rather than in it, so the folder only holds the audit files
+        company_folder = get_company_folder_name(data_context.tradename, data_context.uif_reference)
+        trace_path = os.path.join(outdir, f"{company_folder}{TRACE_FILE_SUFFIX}")
+        try:
+            trace.write(trace_path, data_file=os.path.abspath(file_path), status=status)
+        except Exception as e:
+            # The trace is only a diagnostic, never fail a job because of it
+            logger.warning("Could not write the stage trace of %s: %s", os.path.basename(file_path), e)
+            trace_path = None
+    return {
+        "File": os.path.basename(file_path),
+        "Status": status,
+        "Time": format_duration(time.time() - start),
+        "Stages": trace.stage_seconds(),
+        "Memory": trace.memory_peaks(),
+        "Trace": trace_path,
+        "Outputs": [path for path in outputs.values() if path and os.path.isfile(path)],
+    }
+
+
+def run_batch(files: List[str], template_paths: List[str], consultant: str, outdir: str,
+              wp_indexes: Sequence[int] = (), generate_all: bool = False, max_workers: Optional[int] = None,
+              on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Generate working papers for a batch of data files, spreading the files across worker processes.
+
+    Each file is one job (see `process_file`), run on the shared batch pool (see `get_batch_pool`)
+    with at most `max_workers` files in progress. With one worker, or one file, the batch runs in
+    the calling process; a single file generating all working papers spreads TP.1 - TP.4 across
+    the pool instead.
+
+    Args:
+        files (list): Paths to the data files.
+        template_paths (list): The working paper template paths (TP.1 - TP.4).
+        consultant (str): Name of the consultant.
+        outdir (str): The output directory.
+        wp_indexes (Sequence[int]): The working papers to generate (0 - 3), when not generating all.
+        generate_all (bool): Generate TP.1 - TP.4 for every file.
+        max_workers (int): Maximum number of files (or working papers) in progress at the same time.
+            Defaults to `default_worker_count()`.
+        on_result (callable): Called as `on_result(index, result)` in the calling process as each
+            file completes, in completion order.
+
+    Returns:
+        list: The results table rows, in the order of `files`.
+    """
+    results = [None] * len(files)
+    max_workers_requested = max_workers or default_worker_count()
+    max_workers = min(max_workers_requested, len(files))
+
+    def record(index, result):
+        results[index] = result
+        if on_result is not None:
+            on_result(index, result)
+
+    if max_workers <= 1:
+        # One file: its working papers get the workers (the file count caps max_workers above)
+        wp_workers = max_workers_requested if len(files) == 1 else 1
+        for index, file_path in enumerate(files):
+            record(index, process_file(file_path, template_paths, consultant, outdir, wp_indexes, generate_all, wp_workers))
+        return results
+
+    start = time.time()
+
+    def record_future(index, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            # The worker process died (process_file itself never raises)
+            result = {
+                "File": os.path.basename(files[index]),
+                "Status": f"Failed: {e}",
+                "Time": format_duration(time.time() - start),
+                "Stages": {},
+                "Memory": {},
+                "Trace": None,
+                "Outputs": [],
+            }
+        record(index, result)
+
+    run_on_pool(
+        [(process_file, (file_path, template_paths, consultant, outdir, tuple(wp_indexes), generate_all)) for file_path in files],
+        max_workers,
+        record_future,
+    )
+    return results
@@ -0,0 +1,6 @@
+#benchmarks/__init__.py
+# Benchmarks of the working paper pipeline, run from the repository root:
+#
+#   python -m benchmarks.synthetic_data data.xlsx --employees 100   # write one synthetic data file
+#   python -m benchmarks.pipeline                                   # time TP.1 - TP.4 and "Generate ALL"
+#   python -m benchmarks.primitives                                 # time the workbook primitives, kept as JSON history
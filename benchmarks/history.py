@@ -0,0 +1,115 @@
+#benchmarks/history.py
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+# Benchmark histories are kept next to the benchmarks, outside version control (see .gitignore)
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".history")
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_revision():
+    """Return the short commit id of the repository, with "+" when there are uncommitted changes, or None outside git."""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True, timeout=10
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True, check=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return f"{revision}+" if changes else revision
+
+
+def new_run(parameters, results, label=None):
+    """
+    Build a history entry for one benchmark run.
+
+    Args:
+        parameters (dict): The settings of the run (row counts, repeats...).
+        results (list): The result records.
+        label (str): Optional description of the run (e.g. "before the stamping rewrite").
+
+    Returns:
+        dict: The entry, with the time, commit and platform of the run.
+    """
+    return {
+        "recorded": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_revision(),
+        "label": label,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": parameters,
+        "results": results,
+    }
+
+
+def load_history(path):
+    """
+    Read a benchmark history.
+
+    Returns:
+        list: The runs, oldest first (empty if the file does not exist yet).
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["runs"]
+
+
+def append_run(path, run):
+    """
+    Add a run to a benchmark history, replacing the file atomically.
+
+    Args:
+        path (str): The history file, created with its directory if missing.
+        run (dict): The entry (see `new_run`).
+
+    Returns:
+        list: The runs of the history, `run` last.
+    """
+    runs = load_history(path) + [run]
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"runs": runs}, f, indent=1)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return runs
+
+
+def previous_results(runs, key):
+    """
+    Index the results of the latest run in `runs` by `key`.
+
+    Args:
+        runs (list): The runs to look in (e.g. the history before the current run).
+        key (callable): Maps a result record to its identity (e.g. benchmark, target and rows).
+
+    Returns:
+        tuple: (the run or None, {key: record})
+    """
+    if not runs:
+        return None, {}
+    run = runs[-1]
+    return run, {key(record): record for record in run["results"]}
+
+
+def format_change(seconds, previous_seconds):
+    """Format the change of a timing against the previous run, e.g. "-12.5%", or "" without one."""
+    if not previous_seconds:
+        return ""
+    return f"{(seconds - previous_seconds) / previous_seconds * 100:+.1f}%"
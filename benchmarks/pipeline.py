@@ -0,0 +1,206 @@
+#benchmarks/pipeline.py
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Run as `python -m benchmarks.pipeline` from the repository root, or as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import WP_NAMES, format_stages, get_template_paths, process_file
+from benchmarks.history import HISTORY_DIR, append_run, new_run
+from benchmarks.synthetic_data import MAX_PERIODS, cached_data_file, shape_for_rows
+from data_cache import CACHE_MAX_MB_ENV
+from log_utils import configure_logging
+from memory_monitor import MEMORY_TRACE_ENV, MEMORY_TRACE_FULL, MEMORY_TRACE_RSS
+
+# The working papers timed on their own, then all four together ("Generate ALL")
+ALL_CASE = "ALL"
+CASES = WP_NAMES + [ALL_CASE]
+
+DEFAULT_ROWS = [100, 1000, 10000, 100000]
+DEFAULT_PERIODS = 5
+DEFAULT_PAYMENTS = 2
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "auditflow_benchmarks")
+DEFAULT_HISTORY = os.path.join(HISTORY_DIR, "pipeline.json")
+
+RESULTS_HEADER = f"{'rows':>8} {'case':<5} {'seconds':>9} {'rows/s':>11} {'papers/min':>10} {'us/row':>9} {'RSS MB':>8}  {'peak in':<9}"
+
+
+def _run_case(data_path, case, outdir, wp_workers):
+    """Generate the working papers of one case for one data file, in a fresh process. Returns (seconds, result)."""
+    template_paths = get_template_paths()
+    wp_indexes = () if case == ALL_CASE else (WP_NAMES.index(case),)
+    start = time.perf_counter()
+    result = process_file(
+        data_path, template_paths, "Benchmark", outdir,
+        wp_indexes=wp_indexes, generate_all=case == ALL_CASE, wp_workers=wp_workers,
+    )
+    return time.perf_counter() - start, result
+
+
+def run_case(data_path, case, outdir, wp_workers=1):
+    """
+    Time one case in a new process, so every measurement starts cold and its memory peak is its own.
+
+    Args:
+        data_path (str): The data file.
+        case (str): A working paper name (e.g. "TP.3"), or `ALL_CASE`.
+        outdir (str): The output directory.
+        wp_workers (int): Processes generating TP.1 - TP.4 side by side in the "Generate ALL" case.
+
+    Returns:
+        tuple: (wall seconds of `batch.process_file`, its result)
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_run_case, data_path, case, outdir, wp_workers).result()
+
+
+def benchmark(rows_list, cases=CASES, periods=DEFAULT_PERIODS, payments=DEFAULT_PAYMENTS, seed=0,
+              repeat=1, wp_workers=1, data_dir=DEFAULT_DATA_DIR, outdir=None, on_result=None):
+    """
+    Time each case against synthetic data files of each size.
+
+    Args:
+        rows_list (list): The data file sizes, in approximate data rows.
+        cases (list): The cases to time (see `CASES`).
+        periods (int): Shutdown periods per data file.
+        payments (int): Payment runs per period.
+        seed (int): Seed of the data generator.
+        repeat (int): Runs per case; the fastest one is reported, with the highest memory peak.
+        wp_workers (int): Processes generating TP.1 - TP.4 side by side in the "Generate ALL" case.
+        data_dir (str): Where the generated data files are kept between runs.
+        outdir (str): The output directory. Defaults to a temporary directory, removed afterwards.
+        on_result (callable): Called with each result as it completes.
+
+    Returns:
+        list: One dict per size and case: the data file shape, the wall seconds, rows/s, papers/min,
+        µs per row, the memory peaks and the seconds per stage.
+    """
+    results = []
+    temporary_outdir = outdir is None
+    outdir = outdir or tempfile.mkdtemp(prefix="auditflow_benchmark_")
+    try:
+        # Compile the template manifests and the like before anything is timed
+        warm_up_path = cached_data_file(data_dir, shape_for_rows(min(rows_list), periods, payments), periods, payments, seed)
+        run_case(warm_up_path, ALL_CASE, os.path.join(outdir, "warm-up"), wp_workers)
+
+        for rows in rows_list:
+            employees = shape_for_rows(rows, periods, payments)
+            data_path = cached_data_file(data_dir, employees, periods, payments, seed)
+            data_rows = employees * periods * payments
+            for case in cases:
+                runs = [run_case(data_path, case, os.path.join(outdir, f"{data_rows}-{case}-{n}"), wp_workers) for n in range(repeat)]
+                seconds, result = min(runs, key=lambda run: run[0])
+                peaks = [run_result["Memory"] for _, run_result in runs if run_result["Memory"]]
+                highest = max(peaks, key=lambda peak: peak["rss_peak_mb"], default={})
+                py_peaks = [peak["py_peak_mb"] for peak in peaks if "py_peak_mb" in peak]
+                papers = len(WP_NAMES) if case == ALL_CASE else 1
+                record = {
+                    "rows": data_rows,
+                    "employees": employees,
+                    "periods": periods,
+                    "payments": payments,
+                    "case": case,
+                    "status": result["Status"],
+                    "seconds": round(seconds, 4),
+                    "rows_per_s": round(data_rows / seconds, 1),
+                    "papers_per_min": round(papers * 60 / seconds, 2),
+                    "us_per_row": round(seconds * 1e6 / data_rows, 1),
+                    "rss_peak_mb": highest.get("rss_peak_mb"),
+                    "py_peak_mb": max(py_peaks) if py_peaks else None,
+                    "peak_stage": highest.get("peak_stage"),
+                    "stages": {stage: round(value, 4) for stage, value in result["Stages"].items()},
+                }
+                results.append(record)
+                if on_result is not None:
+                    on_result(record)
+    finally:
+        if temporary_outdir:
+            shutil.rmtree(outdir, ignore_errors=True)
+    return results
+
+
+def format_result(record):
+    """Format one benchmark result as a line of the results table."""
+    memory = f"{record['rss_peak_mb']:8.1f}" if record["rss_peak_mb"] is not None else f"{'-':>8}"
+    line = (
+        f"{record['rows']:>8} {record['case']:<5} {record['seconds']:>9.3f} {record['rows_per_s']:>11.1f} "
+        f"{record['papers_per_min']:>10.2f} {record['us_per_row']:>9.1f} {memory}  {record['peak_stage'] or '-':<9}"
+    )
+    if record["status"] != "Success":
+        line += f" {record['status']}"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.pipeline",
+        description="Time TP.1 - TP.4 and \"Generate ALL\" on synthetic UIF TERS data files of growing size.",
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Data file sizes in rows (default: %(default)s)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES, help="Cases to time (default: all)")
+    parser.add_argument("--periods", type=int, default=DEFAULT_PERIODS, help=f"Shutdown periods, 1 - {MAX_PERIODS} (default: %(default)s)")
+    parser.add_argument("--payments", type=int, default=DEFAULT_PAYMENTS, help="Payment runs per period (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data generator (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case, the fastest is reported (default: %(default)s)")
+    parser.add_argument("--wp-workers", type=int, default=1, help="Processes generating TP.1 - TP.4 side by side for ALL (default: %(default)s)")
+    parser.add_argument("--memory", choices=[MEMORY_TRACE_RSS, MEMORY_TRACE_FULL], default=MEMORY_TRACE_RSS,
+                        help="Memory accounting: RSS, or RSS and Python allocations, which slows the runs down (default: %(default)s)")
+    parser.add_argument("--cache", action="store_true", help="Let the runs use the parsed data file cache (default: every run parses the data file)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where generated data files are kept (default: %(default)s)")
+    parser.add_argument("--output", help="Keep the working papers in this directory (default: a temporary directory)")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--history", nargs="?", const=DEFAULT_HISTORY, metavar="PATH",
+                        help=f"Add the run to a JSON history (default path: {DEFAULT_HISTORY})")
+    parser.add_argument("--label", help="Description of the run kept in the history, e.g. the change being measured")
+    args = parser.parse_args(argv)
+    if args.repeat < 1 or args.wp_workers < 1:
+        parser.error("--repeat and --wp-workers must be at least 1")
+    if not 1 <= args.periods <= MAX_PERIODS:
+        parser.error(f"--periods must be 1 - {MAX_PERIODS}")
+
+    configure_logging("WARNING")
+    # Through the environment, so the processes running the cases pick the settings up
+    os.environ[MEMORY_TRACE_ENV] = args.memory
+    if not args.cache:
+        os.environ[CACHE_MAX_MB_ENV] = "0"
+
+    print(RESULTS_HEADER, flush=True)
+
+    def show(record):
+        print(format_result(record), flush=True)
+
+    results = benchmark(
+        sorted(args.rows), args.cases, args.periods, args.payments, args.seed,
+        args.repeat, args.wp_workers, args.data_dir, args.output, on_result=show,
+    )
+
+    parameters = {
+        "rows": sorted(args.rows), "periods": args.periods, "payments": args.payments, "seed": args.seed,
+        "repeat": args.repeat, "wp_workers": args.wp_workers, "memory": args.memory, "cache": args.cache,
+    }
+    run = new_run(parameters, results, args.label)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+    if args.history:
+        append_run(args.history, run)
+        print(f"Added to {args.history}")
+
+    failed = [record for record in results if record["status"] != "Success"]
+    if results:
+        slowest = max(results, key=lambda record: record["seconds"])
+        print(f"Slowest: {slowest['case']} at {slowest['rows']} rows - {format_stages(slowest['stages'])}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+#benchmarks/primitives.py
+import argparse
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Run as `python -m benchmarks.primitives` from the repository root, or as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import WP_NAMES, get_template_paths
+from benchmarks.history import HISTORY_DIR, append_run, format_change, load_history, new_run, previous_results
+from helper_funcs import (
+    apply_conditional_formatting_general,
+    column_index_to_letter,
+    column_letter_to_index,
+    copy_cell_style_and_formula,
+    copy_formatting,
+    extend_table,
+    insert_rows,
+    insert_table_rows,
+    load_working_paper,
+    reapply_merged_cells,
+    save_working_paper,
+    unmerge_cells_in_range,
+    update_formulas_after_row_insertion,
+)
+from log_utils import configure_logging
+from template_manifest import load_template_manifest
+from tp_3_2 import adjust_column_visibility
+
+# copy_cell_style_and_formula copies styles one cell at a time, 10000 rows take minutes per table
+DEFAULT_ROWS = [100, 1000]
+DEFAULT_REPEAT = 3
+DEFAULT_HISTORY = os.path.join(HISTORY_DIR, "primitives.json")
+
+# The columns and legend column TP.3 formats conditionally, per table
+CONDITIONAL_FORMATTING = {
+    "TP3.1": (["F", "G", "H"], "K"),
+    "TP3.2": ([column_index_to_letter(i) for i in range(column_letter_to_index("A"), column_letter_to_index("AO") + 1)], "AS"),
+    "TP3.3": (["F", "H"], "K"),
+}
+
+# TP3.2: the amounts claimed (G - V) and paid (Y - AN) per shutdown period, and the periods filled in
+PERIOD_COLUMNS = ("G", "V", "Y", "AN")
+FILLED_PERIODS = 5
+
+
+class Target:
+    """
+    What a primitive runs on: a table of a working paper template (e.g. "TP3.2"), or a whole template (e.g. "TP.3").
+
+    Args:
+        name (str): The table or template name.
+        template_path (str): The template file.
+        layout (dict): The table entry of the template manifest, None for a whole template.
+        tables (list): The table entries of the template manifest (for a whole template).
+    """
+
+    def __init__(self, name, template_path, layout=None, tables=()):
+        self.name = name
+        self.template_path = template_path
+        self.layout = layout
+        self.tables = list(tables)
+
+    def load(self):
+        """Return a fresh copy of the template (an openpyxl workbook) and the table's sheet (the first sheet for a template)."""
+        sheet_index = self.layout["sheet_index"] if self.layout else 0
+        return load_working_paper(self.template_path, sh_n=sheet_index)
+
+
+def load_targets(template_paths):
+    """
+    Return the tables and the templates the primitives run on.
+
+    Returns:
+        tuple: ({table name: Target}, {template name: Target})
+    """
+    tables, templates = {}, {}
+    for wp_index, template_path in enumerate(template_paths[:len(WP_NAMES)]):
+        manifest_tables = load_template_manifest(template_path, wp_n=wp_index + 1)["tables"]
+        for name, layout in manifest_tables.items():
+            tables[name] = Target(name, template_path, layout)
+        templates[WP_NAMES[wp_index]] = Target(WP_NAMES[wp_index], template_path, tables=manifest_tables.values())
+    return tables, templates
+
+
+# Each case prepares a fresh copy of the template (not timed) and returns the call to time
+
+def case_insert_rows(target, rows):
+    _, sheet = target.load()
+    return lambda: insert_rows(sheet, rows, target.layout["insert_row"])
+
+
+def case_copy_formatting(target, rows):
+    _, sheet = target.load()
+    insert_table_rows(sheet, target.layout["footer"], rows)
+    return lambda: copy_formatting(sheet, target.layout["insert_row"], rows, source_cell_n=target.layout["reference_row"])
+
+
+def case_copy_cell_style_and_formula(target, rows):
+    _, sheet = target.load()
+    insert_table_rows(sheet, target.layout["footer"], rows)
+    reference_row = target.layout["reference_row"]
+    source_cells = [cell for cell in sheet[reference_row] if cell.has_style or cell.value is not None]
+    first_row = target.layout["insert_row"]
+
+    def run():
+        for row in range(first_row, first_row + rows):
+            for source_cell in source_cells:
+                copy_cell_style_and_formula(source_cell, sheet.cell(row=row, column=source_cell.column), row)
+    return run
+
+
+def case_unmerge_cells_in_range(target, rows):
+    _, sheet = target.load()
+    extend_table(sheet, target.layout, rows)
+    return lambda: unmerge_cells_in_range(sheet, target.layout["insert_row"], sheet.max_row)
+
+
+def case_reapply_merged_cells(target, rows):
+    # As around a plain row insertion: unmerge below the insert row, insert, then merge again further down
+    _, sheet = target.load()
+    merged_cells_to_restore = unmerge_cells_in_range(sheet, target.layout["insert_row"], sheet.max_row)
+    insert_rows(sheet, rows, target.layout["insert_row"])
+    return lambda: reapply_merged_cells(sheet, merged_cells_to_restore, rows)
+
+
+def case_apply_conditional_formatting_general(target, rows):
+    _, sheet = target.load()
+    extend_table(sheet, target.layout, rows)
+    columns_to_format, legend = CONDITIONAL_FORMATTING[target.name]
+    return lambda: apply_conditional_formatting_general(sheet, target.layout["insert_row"], rows, columns_to_format, legend)
+
+
+def case_update_formulas_after_row_insertion(target, rows):
+    # As after a plain row insertion, which leaves the formulas below the insert row pointing at the old rows
+    _, sheet = target.load()
+    insert_rows(sheet, rows, target.layout["insert_row"])
+    copy_formatting(sheet, target.layout["insert_row"], rows, source_cell_n=target.layout["reference_row"])
+    return lambda: update_formulas_after_row_insertion(sheet, target.layout["insert_row"], rows)
+
+
+def case_adjust_column_visibility(target, rows):
+    _, sheet = target.load()
+    extend_table(sheet, target.layout, rows)
+    first_row = target.layout["insert_row"]
+    claimed_start, claimed_end, paid_start, paid_end = PERIOD_COLUMNS
+    # The first periods hold amounts, the other period columns stay empty and get hidden
+    first_column = column_letter_to_index(claimed_start)
+    for row in range(first_row, first_row + rows):
+        for offset in range(FILLED_PERIODS):
+            sheet.cell(row=row, column=first_column + offset, value=1000.0 + offset)
+    return lambda: adjust_column_visibility(sheet, first_row, first_row + rows - 1, claimed_start, claimed_end, paid_start, paid_end)
+
+
+def case_save_working_paper(target, rows):
+    working_paper_wb, _ = target.load()
+    for layout in target.tables:
+        extend_table(working_paper_wb.worksheets[layout["sheet_index"]], layout, rows)
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+
+    def run():
+        try:
+            save_working_paper(working_paper_wb, path)
+        finally:
+            os.remove(path)
+    return run
+
+
+# Primitive -> (which targets it runs on, case). "tables" are every template table, "templates"
+# the four templates, otherwise the listed tables.
+PRIMITIVES = {
+    "insert_rows": ("tables", case_insert_rows),
+    "copy_formatting": ("tables", case_copy_formatting),
+    "copy_cell_style_and_formula": ("tables", case_copy_cell_style_and_formula),
+    "unmerge_cells_in_range": ("tables", case_unmerge_cells_in_range),
+    "reapply_merged_cells": ("tables", case_reapply_merged_cells),
+    "apply_conditional_formatting_general": (list(CONDITIONAL_FORMATTING), case_apply_conditional_formatting_general),
+    "update_formulas_after_row_insertion": ("tables", case_update_formulas_after_row_insertion),
+    "adjust_column_visibility": (["TP3.2"], case_adjust_column_visibility),
+    "save_working_paper": ("templates", case_save_working_paper),
+}
+
+
+def time_case(case, target, rows, repeat):
+    """
+    Time a case `repeat` times, each on a fresh copy of the template, with garbage collection off while timing (as `timeit` does).
+
+    Returns:
+        list: The seconds of each run.
+    """
+    timings = []
+    for _ in range(repeat):
+        run = case(target, rows)
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    return timings
+
+
+def benchmark(primitives, rows_list, repeat=DEFAULT_REPEAT, only_targets=None, template_paths=None, on_result=None):
+    """
+    Time the workbook primitives on the working paper templates.
+
+    Args:
+        primitives (list): Names of the primitives to time (see `PRIMITIVES`).
+        rows_list (list): The row counts each primitive is timed with.
+        repeat (int): Runs per primitive, target and row count.
+        only_targets (list): Only time these tables or templates (e.g. ["TP3.2", "TP.3"]).
+        template_paths (list): The templates. Defaults to `batch.get_template_paths()`.
+        on_result (callable): Called with each result as it completes.
+
+    Returns:
+        list: One dict per primitive, target and row count: the best and median seconds, and the
+        best µs per row.
+    """
+    tables, templates = load_targets(template_paths or get_template_paths())
+    results = []
+    for primitive in primitives:
+        target_names, case = PRIMITIVES[primitive]
+        if target_names == "tables":
+            targets = list(tables.values())
+        elif target_names == "templates":
+            targets = list(templates.values())
+        else:
+            targets = [tables[name] for name in target_names if name in tables]
+        for target in targets:
+            if only_targets and target.name not in only_targets:
+                continue
+            for rows in rows_list:
+                timings = time_case(case, target, rows, repeat)
+                record = {
+                    "benchmark": primitive,
+                    "target": target.name,
+                    "rows": rows,
+                    "repeat": repeat,
+                    "best": round(min(timings), 6),
+                    "median": round(statistics.median(timings), 6),
+                    "us_per_row": round(min(timings) * 1e6 / rows, 3),
+                }
+                results.append(record)
+                if on_result is not None:
+                    on_result(record)
+    return results
+
+
+def result_key(record):
+    """The identity of a result across runs: primitive, target and row count."""
+    return record["benchmark"], record["target"], record["rows"]
+
+
+RESULTS_HEADER = f"{'benchmark':<37} {'target':<6} {'rows':>6} {'best s':>10} {'median s':>10} {'us/row':>9} {'vs last':>8}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.primitives",
+        description="Time the workbook primitives of the working papers on the real templates, and keep the results as JSON history.",
+    )
+    parser.add_argument("--only", nargs="+", choices=list(PRIMITIVES), default=list(PRIMITIVES), metavar="PRIMITIVE",
+                        help=f"Primitives to time (default: all): {', '.join(PRIMITIVES)}")
+    parser.add_argument("--targets", nargs="+", metavar="NAME", help="Only these tables or templates, e.g. TP3.2 TP.3 (default: all)")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Row counts (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per case (default: %(default)s)")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history the run is added to (default: %(default)s)")
+    parser.add_argument("--no-history", action="store_true", help="Do not add the run to the history")
+    parser.add_argument("--label", help="Description of the run kept in the history, e.g. the change being measured")
+    args = parser.parse_args(argv)
+    if args.repeat < 1 or min(args.rows) < 1:
+        parser.error("--repeat and --rows must be at least 1")
+
+    configure_logging("WARNING")
+    history = load_history(args.history)
+    previous_run, previous = previous_results(history, result_key)
+    if previous_run is not None:
+        print(f"Compared with the run of {previous_run['recorded']} (commit {previous_run['commit'] or 'unknown'})")
+    print(RESULTS_HEADER, flush=True)
+
+    def show(record):
+        earlier = previous.get(result_key(record))
+        change = format_change(record["best"], earlier["best"] if earlier else None)
+        print(
+            f"{record['benchmark']:<37} {record['target']:<6} {record['rows']:>6} {record['best']:>10.4f} "
+            f"{record['median']:>10.4f} {record['us_per_row']:>9.2f} {change:>8}",
+            flush=True,
+        )
+
+    results = benchmark(args.only, sorted(args.rows), args.repeat, args.targets, on_result=show)
+
+    if not args.no_history:
+        parameters = {"rows": sorted(args.rows), "repeat": args.repeat, "primitives": args.only, "targets": args.targets}
+        append_run(args.history, new_run(parameters, results, args.label))
+        print(f"Added to {args.history}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#benchmarks/synthetic_data.py
+import argparse
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+# Run as `python -m benchmarks.synthetic_data` from the repository root, or as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_funcs import INGESTION_COLUMNS
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# The columns of a UIF TERS payment export, in export order. Besides the columns the working papers
+# use, exports carry columns ingestion skips; two stand in for them.
+DATA_FILE_COLUMNS = INGESTION_COLUMNS + ["BANK_ACCOUNT_TYPE", "BATCH_NUMBER"]
+
+# TP3.2 has room for 16 shutdown periods
+MAX_PERIODS = 16
+
+# The first TERS period ran from the start of the lockdown to the end of April 2020, the next ones
+# a calendar month each
+FIRST_PERIOD_START = datetime(2020, 3, 27)
+
+# Date formats mixed into the date columns. Only formats `helper_funcs` parses unambiguously (no
+# day/month swaps), so every generated date reads back as the date it was written from.
+SHUTDOWN_STRING_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d-%b-%Y", "%d %B %Y"]
+PAYMENT_STRING_FORMATS = ["%d-%b-%Y", "%d-%b-%Y %I:%M:%S %p", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%d %b %Y"]
+
+# Share of date cells written as Excel dates rather than text, when mixing formats
+DATETIME_CELL_SHARE = 0.4
+
+# Share of payments the payment filter drops (PAYMENT_STATUS_ID != 3, PAYMENTMEDIUMID != 2 or
+# BANK_PAY_AMOUNT == 0), as in real exports with rejected and returned payments
+REJECTED_SHARE = 0.05
+NON_EFT_SHARE = 0.02
+ZERO_AMOUNT_SHARE = 0.01
+
+# TERS in 2020: the benefit was capped at R6,730 a month, and the salary it was based on at R17,712
+MAX_MONTHLY_BENEFIT = 6730.0
+MAX_BENEFIT_SALARY = 17712.0
+
+FIRST_NAMES = [
+    "Thabo", "Sipho", "Lerato", "Nomvula", "Johan", "Pieter", "Ayanda", "Zanele", "Bongani", "Precious",
+    "Kagiso", "Lindiwe", "Themba", "Naledi", "Mandla", "Palesa", "Riaan", "Anika", "Priya", "Rajesh",
+    "Fatima", "Yusuf", "Mpho", "Tshepo", "Busisiwe", "Sibusiso", "Karabo", "Andile", "Nadia", "Michael",
+]
+LAST_NAMES = [
+    "Dlamini", "Nkosi", "Ndlovu", "Khumalo", "Mokoena", "Mahlangu", "Botha", "Van der Merwe", "Naidoo",
+    "Pillay", "Mthembu", "Zulu", "Sithole", "Molefe", "Pretorius", "Nel", "Smith", "Jacobs", "Hendricks",
+    "Govender", "Mabaso", "Ngcobo", "Radebe", "Venter", "Coetzee", "Mkhize", "Petersen", "Adams",
+]
+COMPANY_WORDS = ["Ubuntu", "Karoo", "Highveld", "Protea", "Baobab", "Table Bay", "Drakensberg", "Limpopo", "Indaba", "Kudu"]
+COMPANY_TRADES = ["Engineering", "Logistics", "Catering", "Retail", "Textiles", "Construction", "Hospitality", "Motors"]
+
+
+def shutdown_periods(count):
+    """
+    Return the first `count` TERS shutdown periods.
+
+    Args:
+        count (int): Number of periods, at most `MAX_PERIODS`.
+
+    Returns:
+        list: (from, till) datetime pairs in chronological order.
+    """
+    periods = []
+    start = FIRST_PERIOD_START
+    for _ in range(count):
+        # Till the end of the month (of April for the first period)
+        month_start = datetime(start.year, start.month, 1) if periods else datetime(2020, 4, 1)
+        next_month = datetime(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+        till = next_month - timedelta(days=1)
+        periods.append((start, till))
+        start = next_month
+    return periods
+
+
+def luhn_check_digit(digits):
+    """Return the Luhn check digit of a string of digits, as used by South African ID numbers."""
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def id_number(rng, used):
+    """Return a new, valid South African ID number (YYMMDD SSSS C A Z) not in `used`."""
+    while True:
+        birth = datetime(1960, 1, 1) + timedelta(days=rng.randrange(16000))
+        digits = f"{birth:%y%m%d}{rng.randrange(10000):04d}08"
+        number = digits + luhn_check_digit(digits)
+        if number not in used:
+            used.add(number)
+            return number
+
+
+def format_date(rng, value, string_formats, mixed):
+    """Write a date the way exports do: as an Excel date, or as text in one of `string_formats` when mixing."""
+    if not mixed or rng.random() < DATETIME_CELL_SHARE:
+        return value
+    return value.strftime(rng.choice(string_formats))
+
+
+def data_file_rows(employees, periods=4, payments=1, seed=0, mixed_dates=True):
+    """
+    Generate the rows of a UIF TERS payment export for one company.
+
+    Each employee gets a benefit for every shutdown period, paid out in `payments` payment runs
+    (the first one pays most of it, the others the balance). Rows come in payment run order, as
+    in real exports, and a few percent are rejected, non-EFT or zero payments, which the payment
+    filter drops. The same arguments always give the same rows.
+
+    Args:
+        employees (int): Number of employees.
+        periods (int): Number of shutdown periods (1 - `MAX_PERIODS`).
+        payments (int): Number of payment runs per period.
+        seed (int): Seed of the random generator.
+        mixed_dates (bool): Mix text dates in several formats with Excel dates, as exports do.
+            If False, every date is an Excel date.
+
+    Yields:
+        list: One row of values per payment, in `DATA_FILE_COLUMNS` order.
+
+    Raises:
+        ValueError: If a count is out of range.
+    """
+    if employees < 1 or payments < 1 or not 1 <= periods <= MAX_PERIODS:
+        raise ValueError(f"Need at least one employee and payment, and 1 - {MAX_PERIODS} periods")
+    rng = random.Random(seed)
+
+    # 1. The company
+    tradename = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_TRADES)} (Pty) Ltd"
+    uif_reference = f"{rng.randrange(1000000, 10000000)}/{rng.randrange(1, 10)}"
+
+    # 2. The employees: names, start dates, salaries, and the odd employee terminated during the shutdown
+    used_ids = set()
+    staff = []
+    for _ in range(employees):
+        salary = round(min(max(rng.lognormvariate(9.2, 0.5), 3500.0), 60000.0), 2)
+        start = datetime(2005, 1, 1) + timedelta(days=rng.randrange(5500))
+        terminated = FIRST_PERIOD_START + timedelta(days=rng.randrange(60, 400)) if rng.random() < 0.03 else None
+        staff.append((id_number(rng, used_ids), rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), start, terminated, salary))
+
+    # 3. One row per employee per payment run
+    for period_number, (period_from, period_till) in enumerate(shutdown_periods(periods), start=1):
+        for payment_number in range(1, payments + 1):
+            paid_on = period_till + timedelta(days=7 * payment_number + rng.randrange(5))
+            reference = f"TERS{period_from:%y%m}-{payment_number:02d}"
+            batch_number = period_number * 100 + payment_number
+            for id_value, first_name, last_name, start, terminated, salary in staff:
+                benefit = min(min(salary, MAX_BENEFIT_SALARY) * rng.uniform(0.38, 0.6), MAX_MONTHLY_BENEFIT)
+                share = 0.8 if payment_number == 1 else 0.2 / (payments - 1)
+                amount = round(benefit * (share if payments > 1 else 1.0), 2)
+
+                status, medium = 3, 2
+                draw = rng.random()
+                if draw < REJECTED_SHARE:
+                    status = rng.choice([1, 4])
+                elif draw < REJECTED_SHARE + NON_EFT_SHARE:
+                    medium = 1
+                elif draw < REJECTED_SHARE + NON_EFT_SHARE + ZERO_AMOUNT_SHARE:
+                    amount = 0.0
+
+                yield [
+                    tradename,
+                    uif_reference,
+                    id_value,
+                    first_name,
+                    last_name,
+                    format_date(rng, start, SHUTDOWN_STRING_FORMATS, mixed_dates),
+                    terminated,
+                    salary,
+                    0.0 if rng.random() < 0.9 else round(salary * rng.uniform(0.05, 0.3), 2),
+                    amount,
+                    format_date(rng, period_from, SHUTDOWN_STRING_FORMATS, mixed_dates),
+                    format_date(rng, period_till, SHUTDOWN_STRING_FORMATS, mixed_dates),
+                    format_date(rng, paid_on + timedelta(seconds=rng.randrange(86400)), PAYMENT_STRING_FORMATS, mixed_dates),
+                    reference,
+                    status,
+                    medium,
+                    rng.choice(["CHEQUE", "SAVINGS", "TRANSMISSION"]),
+                    batch_number,
+                ]
+
+
+def shape_for_rows(rows, periods=4, payments=1):
+    """
+    Return the employee count giving about `rows` data rows with `periods` periods and `payments` payment runs.
+
+    Returns:
+        int: The number of employees (at least 1).
+    """
+    return max(1, math.ceil(rows / (periods * payments)))
+
+
+def generate_data_file(path, employees, periods=4, payments=1, seed=0, mixed_dates=True):
+    """
+    Write a synthetic UIF TERS data file (see `data_file_rows`).
+
+    Args:
+        path (str): The .xlsx file to write.
+        employees (int): Number of employees.
+        periods (int): Number of shutdown periods.
+        payments (int): Number of payment runs per period.
+        seed (int): Seed of the random generator.
+        mixed_dates (bool): Mix text dates in several formats with Excel dates.
+
+    Returns:
+        int: The number of data rows written.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(DATA_FILE_COLUMNS)
+    rows = 0
+    for row in data_file_rows(employees, periods, payments, seed, mixed_dates):
+        sheet.append(row)
+        rows += 1
+
+    # Write next to the target and rename, so an interrupted run leaves no partial file behind
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    workbook.save(temp_path)
+    os.replace(temp_path, path)
+    logger.debug("Wrote %d rows to %s", rows, path)
+    return rows
+
+
+def cached_data_file(directory, employees, periods=4, payments=1, seed=0, mixed_dates=True):
+    """
+    Return a synthetic data file with these parameters from `directory`, generating it if missing.
+
+    Returns:
+        str: The path of the data file.
+    """
+    name = f"uif_ters_{employees}e_{periods}p_{payments}x_seed{seed}{'' if mixed_dates else '_datetimes'}.xlsx"
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        generate_data_file(path, employees, periods, payments, seed, mixed_dates)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.synthetic_data",
+        description="Write a deterministic synthetic UIF TERS data file (one company).",
+    )
+    parser.add_argument("output", help="The .xlsx file to write")
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--employees", type=int, help="Number of employees")
+    size.add_argument("--rows", type=int, help="Approximate number of data rows (sets the number of employees)")
+    parser.add_argument("--periods", type=int, default=4, help=f"Shutdown periods, 1 - {MAX_PERIODS} (default: %(default)s)")
+    parser.add_argument("--payments", type=int, default=1, help="Payment runs per period (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator (default: %(default)s)")
+    parser.add_argument("--no-mixed-dates", action="store_true", help="Write every date as an Excel date")
+    args = parser.parse_args(argv)
+
+    employees = args.employees or shape_for_rows(args.rows, args.periods, args.payments)
+    try:
+        rows = generate_data_file(args.output, employees, args.periods, args.payments, args.seed, not args.no_mixed_dates)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Wrote {rows} rows ({employees} employees x {args.periods} periods x {args.payments} payments) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
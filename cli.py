@@ -0,0 +1,171 @@
+#cli.py
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+# Streamlit is never imported here, so the CLI starts as fast as the working paper modules load
+from batch import (
+    WP_NAMES,
+    default_worker_count,
+    format_duration,
+    format_memory,
+    format_stages,
+    get_batch_pool,
+    get_template_paths,
+    run_batch,
+)
+from log_utils import configure_logging
+from memory_monitor import MEMORY_CEILING_MB_ENV, MEMORY_TRACE_ENV, MEMORY_TRACE_FULL, MEMORY_TRACE_RSS
+
+
+def expand_data_files(patterns):
+    """
+    Expand data file paths and glob patterns (e.g. "data/**/*.xlsx") into a list of files.
+
+    Args:
+        patterns (list): File paths or glob patterns.
+
+    Returns:
+        tuple: The matching files in the order given, without duplicates, and the patterns that
+        matched nothing.
+    """
+    files, unmatched = [], []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            matches = [pattern] if os.path.isfile(pattern) else []
+        if not matches:
+            unmatched.append(pattern)
+        files.extend(matches)
+    return list(dict.fromkeys(files)), unmatched
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Generate audit working papers (TP.1 - TP.4) for UIF data files without the Streamlit UI.",
+    )
+    parser.add_argument("data_files", nargs="+", help="Data files (.xlsx) or glob patterns, e.g. 'incoming/*.xlsx'")
+    parser.add_argument("-o", "--output", required=True, help="Directory the working papers are written to")
+    parser.add_argument("-c", "--consultant", required=True, help="Consultant name")
+    parser.add_argument(
+        "--tp", type=int, nargs="+", choices=range(1, len(WP_NAMES) + 1), metavar="N",
+        help="Working papers to generate (1 - 4). Default: all four, in one folder structure per file",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=default_worker_count(),
+        help="Number of files processed at the same time (default: %(default)s)",
+    )
+    parser.add_argument("--results", help="Write the per-file results, stage timings and trace paths to this JSON file")
+    parser.add_argument(
+        "--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], type=str.upper,
+        help="Minimum level of the log messages (default: AUDITFLOW_LOG_LEVEL or INFO)",
+    )
+    parser.add_argument(
+        "--trace-memory", choices=[MEMORY_TRACE_RSS, MEMORY_TRACE_FULL],
+        help="Record the memory peaks of every stage: the RSS, or the RSS and Python allocations (slower). "
+             "Default: AUDITFLOW_TRACE_MEMORY",
+    )
+    parser.add_argument(
+        "--memory-ceiling", type=float, metavar="MB",
+        help="Abort a file once the RSS of the process generating it exceeds this many MB "
+             "(default: AUDITFLOW_MEMORY_CEILING_MB, no ceiling)",
+    )
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a batch from the command line.
+
+    Returns:
+        int: The exit code: 0 if every file succeeded, 1 if any failed, 2 on invalid arguments.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    configure_logging(args.log_level)
+    # Through the environment, so the worker processes started below pick the settings up too
+    if args.trace_memory:
+        os.environ[MEMORY_TRACE_ENV] = args.trace_memory
+    if args.memory_ceiling:
+        os.environ[MEMORY_CEILING_MB_ENV] = str(args.memory_ceiling)
+    files, unmatched = expand_data_files(args.data_files)
+    for pattern in unmatched:
+        print(f"Warning: No data files match {pattern}", file=sys.stderr)
+    if not files:
+        parser.error("no data files found")
+
+    try:
+        template_paths = get_template_paths()
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output, exist_ok=True)
+    generate_all = not args.tp
+    wp_indexes = sorted({n - 1 for n in args.tp}) if args.tp else []
+    if args.jobs > 1:
+        # Size the pool for this run before the batch starts it
+        get_batch_pool(args.jobs)
+
+    completed = []
+
+    def show_result(index, result):
+        completed.append(index)
+        line = f"[{len(completed)}/{len(files)}] {result['File']}: {result['Status']} ({result['Time']})"
+        if result["Stages"]:
+            line += f" - {format_stages(result['Stages'])}"
+        if result["Memory"]:
+            line += f" - peak {format_memory(result['Memory'])}"
+        print(line, flush=True)
+
+    started = datetime.now()
+    overall_start = time.time()
+    results = run_batch(
+        files, template_paths, args.consultant, args.output,
+        wp_indexes=wp_indexes, generate_all=generate_all,
+        max_workers=args.jobs, on_result=show_result,
+    )
+    total = time.time() - overall_start
+
+    failed = [result for result in results if result["Status"] != "Success"]
+    print(f"Processed {len(results)} file(s), {len(failed)} failed, in {format_duration(total)}")
+
+    if args.results:
+        report = {
+            "started": started.isoformat(timespec="seconds"),
+            "total_seconds": round(total, 3),
+            "consultant": args.consultant,
+            "output_directory": os.path.abspath(args.output),
+            "working_papers": [WP_NAMES[i] for i in wp_indexes] if wp_indexes else list(WP_NAMES),
+            "jobs": args.jobs,
+            "files": [
+                {
+                    "path": os.path.abspath(file_path),
+                    "file": result["File"],
+                    "status": result["Status"],
+                    "time": result["Time"],
+                    "stages": {name: round(seconds, 3) for name, seconds in result["Stages"].items()},
+                    "memory": result["Memory"],
+                    "trace": result["Trace"],
+                    "outputs": result["Outputs"],
+                }
+                for file_path, result in zip(files, results)
+            ],
+        }
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+#data_cache.py
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+
+import pandas as pd
+
+from helper_funcs import (
+    DataFileContext,
+    INGESTION_SCHEMA_VERSION,
+    load_data_file_context
+)
+from stage_trace import span
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Environment variables used to configure the default cache
+CACHE_DIR_ENV = "AUDITFLOW_CACHE_DIR"
+CACHE_MAX_MB_ENV = "AUDITFLOW_CACHE_MAX_MB"
+DEFAULT_CACHE_MAX_MB = 1024
+
+CACHE_FILE_SUFFIX = ".snapshot"
+
+# Snapshots are pickles, so only a directory no other user can write to is used as a cache
+CACHE_DIR_MODE = 0o700
+
+# (path, size, mtime) -> SHA-256 digest, so unchanged files are not re-hashed on every rerun
+_digest_memo = {}
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 digest of a file.
+
+    The digest is memoized on the file's path, size and modification time.
+
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    digest = _digest_memo.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+class DataFileCache:
+    """
+    Content-addressed on-disk cache of parsed data files.
+
+    Each entry is a columnar snapshot of a `DataFileContext` (one NumPy array per column plus the
+    company details), keyed by the SHA-256 of the data file and `INGESTION_SCHEMA_VERSION`.
+    The cache is bounded in size; the least recently used entries are evicted first.
+
+    Snapshots are pickles, and loading a pickle can run code: the cache directory is created
+    private to the current user, and a directory or snapshot another user owns, or a directory
+    other users have access to, is never read (see `check_private_directory`).
+
+    Args:
+        cache_dir (str): Directory holding the snapshots. Created if missing.
+        max_bytes (int): Maximum total size of the snapshots. 0 disables the cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._private = None  # Whether the directory was found private to the user, once checked
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _directory_is_private(self, create=False):
+        """Check (once) that the cache directory is private to the user, creating it if `create` is set."""
+        if self._private is None:
+            if not os.path.isdir(self.cache_dir):
+                if not create:
+                    return False
+                os.makedirs(self.cache_dir, mode=CACHE_DIR_MODE, exist_ok=True)
+            problem = check_private_directory(self.cache_dir)
+            if problem:
+                logger.warning("Not using the data file cache in %s: %s", self.cache_dir, problem)
+            self._private = not problem
+        return self._private
+
+    def entry_path(self, digest):
+        """Return the snapshot path for a data file digest."""
+        return os.path.join(self.cache_dir, f"{digest}-v{INGESTION_SCHEMA_VERSION}{CACHE_FILE_SUFFIX}")
+
+    def get(self, data_file_path):
+        """
+        Return the cached `DataFileContext` for a data file, or None on a cache miss.
+
+        Args:
+            data_file_path (str): Path to the data file.
+
+        Returns:
+            DataFileContext: The cached context bound to `data_file_path`, or None.
+        """
+        if not self.enabled or not self._directory_is_private():
+            return None
+        entry_path = self.entry_path(file_sha256(data_file_path))
+        try:
+            with open(entry_path, "rb") as f:
+                if not _owned_by_user(os.fstat(f.fileno())):
+                    logger.warning("Ignoring cache entry %s: it belongs to another user", entry_path)
+                    return None
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A corrupt or incompatible snapshot is treated as a miss and replaced
+            logger.warning("Discarding unreadable cache entry %s: %s", entry_path, e)
+            self._remove(entry_path)
+            return None
+
+        # Touch the entry so eviction sees it as recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return _context_from_snapshot(data_file_path, snapshot)
+
+    def put(self, context):
+        """
+        Store a `DataFileContext` in the cache and evict old entries if the cache is too large.
+
+        Args:
+            context (DataFileContext): The parsed data file.
+        """
+        if not self.enabled or not self._directory_is_private(create=True):
+            return
+        entry_path = self.entry_path(file_sha256(context.data_file_path))
+
+        # Write to a temporary file first so readers never see a partial snapshot
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(_snapshot_from_context(context), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry_path)
+        except Exception:
+            self._remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used snapshots until the cache fits in `max_bytes`."""
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        entries = []
+        for name in names:
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _owned_by_user(file_stat):
+    # Without POSIX user ids (Windows), a user's own profile folders are private to them
+    return not hasattr(os, "getuid") or file_stat.st_uid == os.getuid()
+
+
+def check_private_directory(path):
+    """
+    Check that a directory is private to the current user: owned by them and with no access for
+    the group or other users (mode 0700 or stricter). Not checked where the platform has no POSIX
+    user ids (Windows).
+
+    Args:
+        path (str): The directory.
+
+    Returns:
+        str: What makes the directory unsafe, or None if it is private.
+    """
+    directory_stat = os.lstat(path)
+    if stat.S_ISLNK(directory_stat.st_mode):
+        return "it is a symbolic link"
+    if not hasattr(os, "getuid"):
+        return None
+    if not _owned_by_user(directory_stat):
+        return "it belongs to another user"
+    if directory_stat.st_mode & 0o077:
+        return f"other users have access to it (mode {stat.S_IMODE(directory_stat.st_mode):o}, expected 700)"
+    return None
+
+
+def default_cache_dir():
+    """
+    Return the default cache directory, in the user's own cache folder: `$XDG_CACHE_HOME` or
+    ~/.cache (on Windows %LOCALAPPDATA%), never the shared system temp directory.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "auditflow", "data_files")
+
+
+def _snapshot_from_context(context):
+    """Convert a `DataFileContext` into a picklable columnar snapshot."""
+    data = context.data
+    return {
+        "columns": list(data.columns),
+        "arrays": [data[column].to_numpy() for column in data.columns],
+        "index": data.index.to_numpy(),
+        "headings": context.headings,
+        "tradename": context.tradename,
+        "uif_reference": context.uif_reference,
+        "periods_claimed": context.periods_claimed,
+    }
+
+
+def _context_from_snapshot(data_file_path, snapshot):
+    """Rebuild a `DataFileContext` from a columnar snapshot."""
+    data = pd.DataFrame(
+        dict(zip(snapshot["columns"], snapshot["arrays"])),
+        columns=snapshot["columns"],
+        index=snapshot["index"],
+    )
+    return DataFileContext(
+        data_file_path,
+        data,
+        snapshot["headings"],
+        snapshot["tradename"],
+        snapshot["uif_reference"],
+        snapshot["periods_claimed"],
+    )
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """
+    Return the process-wide cache configured from the environment.
+
+    `AUDITFLOW_CACHE_DIR` sets the cache directory (default: `default_cache_dir()`), which must be
+    private to the user, and `AUDITFLOW_CACHE_MAX_MB` its maximum size in MB (default: 1024, 0
+    disables the cache).
+
+    Returns:
+        DataFileCache: The default cache.
+    """
+    global _default_cache
+    if _default_cache is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV) or default_cache_dir()
+        max_mb = float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_CACHE_MAX_MB))
+        _default_cache = DataFileCache(cache_dir, int(max_mb * 1024 * 1024))
+    return _default_cache
+
+
+def load_cached_data_file_context(data_file_path, cache=None):
+    """
+    Return the parsed `DataFileContext` for a data file, using the on-disk cache when possible.
+
+    Args:
+        data_file_path (str): Path to the data file.
+        cache (DataFileCache): The cache to use. Defaults to `get_default_cache()`.
+
+    Returns:
+        DataFileContext: The parsed data file.
+    """
+    cache = cache or get_default_cache()
+    # A cache hit replaces both the "load" and the "convert" stage
+    with span("load") as load_span:
+        context = cache.get(data_file_path)
+        if context is not None:
+            load_span.count(rows=len(context.data), cells=context.data.size)
+    if context is None:
+        context = load_data_file_context(data_file_path)
+        try:
+            cache.put(context)
+        except Exception as e:
+            # The cache is only an accelerator, never fail a job because of it
+            logger.warning("Could not write data file cache entry: %s", e)
+    return context
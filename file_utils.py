@@ -0,0 +1,40 @@
+#file_utils.py
+import os
+import threading
+
+_umask = None
+_umask_lock = threading.Lock()
+
+
+def current_umask():
+    """
+    Return the file mode creation mask of the process.
+
+    Read from /proc where available; elsewhere the mask can only be read by setting it, which is
+    done once, under a lock, and the result kept.
+    """
+    global _umask
+    if _umask is None:
+        with _umask_lock:
+            if _umask is None:
+                try:
+                    with open("/proc/self/status", encoding="ascii") as f:
+                        _umask = next(int(line.split()[1], 8) for line in f if line.startswith("Umask:"))
+                except (OSError, StopIteration, ValueError, IndexError):
+                    _umask = os.umask(0o022)
+                    os.umask(_umask)
+    return _umask
+
+
+def set_default_file_mode(path):
+    """
+    Give a file the permissions `open()` would have created it with (0666 less the umask).
+
+    Files written to a `tempfile.mkstemp` file and moved into place are otherwise left readable by
+    their owner only (0600).
+
+    Args:
+        path (str): The file.
+    """
+    if os.name != "nt":
+        os.chmod(path, 0o666 & ~current_umask())
@@ -4,14 +4,29 @@ from openpyxl.utils import get_column_letter, range_boundaries
 from openpyxl.styles import Font, Alignment, Border, Protection, PatternFill
 from openpyxl.formatting.rule import CellIsRule, FormulaRule
 from openpyxl.formatting import Rule
+from openpyxl.formatting.formatting import ConditionalFormatting
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+import numpy as np
 import pandas as pd
 from copy import copy 
-from datetime import datetime
+from datetime import date, datetime
 import re
 import os
+import shutil
+import tempfile
+import zipfile
+from xml.etree import ElementTree
 
-from openpyxl.utils import get_column_letter
 from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.cell.cell import Cell
+from openpyxl.formula.tokenizer import Token, Tokenizer
+from openpyxl.styles.cell_style import StyleArray
+
+from stage_trace import span
+from log_utils import get_logger
+from memory_monitor import check_memory_ceiling
+
+logger = get_logger(__name__)
 
 def populate_underpayment_rows(lead_sheet, num_rows_to_add):
     """
@@ -38,12 +53,24 @@ def populate_underpayment_rows(lead_sheet, num_rows_to_add):
              
              lead_sheet[f'{excel_col_letter}{row}'].value = formula
 
+def _find_marker_cell(target_sheet, text, marker_cells=None):
+    """Return the first cell holding `text`, looked up in `marker_cells` when given, else by scanning the sheet."""
+    if marker_cells is not None:
+        coordinate = marker_cells.get(text)
+        return target_sheet[coordinate] if coordinate else None
+    for row in target_sheet.iter_rows():
+        for cell in row:
+            if cell.value == text:
+                return cell
+    return None
+
 def add_table_copy_formula(
     target_sheet: Worksheet,
     start_cell: str,
     table_copy_text: str,
     payments_sheet_name: str,
-    num_rows_to_add: int
+    num_rows_to_add: int,
+    marker_cells: dict = None
 ):
     """
     Inserts a formula to copy a table dynamically from `payments_sheet_2` (A:AS) to the `target_sheet`.
@@ -54,16 +81,11 @@ def add_table_copy_formula(
         table_copy_text (str): The text to search for where the table copy formula should be placed.
         payments_sheet_name (str): The name of the sheet containing the original table.
         num_rows_to_add (int): The number of rows to copy.
+        marker_cells (dict): Optional text -> coordinate map of the sheet (its template manifest `markers`),
+            used instead of scanning the sheet for `table_copy_text`.
     """
     # Step 1: Locate the cell with `table_copy_text`
-    table_copy_cell = None
-    for row in target_sheet.iter_rows():
-        for cell in row:
-            if cell.value == table_copy_text:
-                table_copy_cell = cell
-                break
-        if table_copy_cell:
-            break
+    table_copy_cell = _find_marker_cell(target_sheet, table_copy_text, marker_cells)
 
     if not table_copy_cell:
         raise ValueError(f"'{table_copy_text}' not found in the sheet.")
@@ -92,7 +114,8 @@ def add_conclusion_formula(
     true_cell: str, 
     true_cond_cell: str, 
     false_cell: str, 
-    num_rows_to_add: int
+    num_rows_to_add: int,
+    marker_cells: dict = None
 ):
     """
     Add a formula below the 'Conclusion' cell in the sheet.
@@ -110,16 +133,11 @@ def add_conclusion_formula(
         true_cond_cell (str): The cell reference to use if at least one value is "a" (e.g., "Data!B4").
         false_cell (str): The cell reference to use if no values are "a" (e.g., "Data!B5").
         num_rows_to_add (int): The number of rows added starting from `start_cell`.
+        marker_cells (dict): Optional text -> coordinate map of the sheet (its template manifest `markers`),
+            used instead of scanning the sheet for `conclusion_text`.
     """
     # Step 1: Locate the cell with "Conclusion"
-    conclusion_cell = None
-    for row in target_sheet.iter_rows():
-        for cell in row:
-            if cell.value == conclusion_text:
-                conclusion_cell = cell
-                break
-        if conclusion_cell:
-            break
+    conclusion_cell = _find_marker_cell(target_sheet, conclusion_text, marker_cells)
 
     if not conclusion_cell:
         raise ValueError(f"'{conclusion_text}' not found in the sheet.")
@@ -144,31 +162,171 @@ def add_conclusion_formula(
 
 
 
-def load_data_file(data_file_path):
+# Columns of the data file used by TP.1 - TP.4 (including the payment filter columns).
+# Streaming ingestion skips every other column of the data file.
+INGESTION_COLUMNS = [
+    "TRADENAME",
+    "UIFREFERENCENUMBER",
+    "IDNUMBER",
+    "FIRSTNAME",
+    "LASTNAME",
+    "EMPLOYMENTSTARTDATE",
+    "TERMINATIONDATE",
+    "MONTHLY_SALARY",
+    "LEAVE_INCOME",
+    "BANK_PAY_AMOUNT",
+    "SHUTDOWN_FROM",
+    "SHUTDOWN_TILL",
+    "PAYMENTDATE",
+    "PAY_REF_ITR_1",
+    "PAYMENT_STATUS_ID",
+    "PAYMENTMEDIUMID",
+]
+
+# Version of the ingestion output (columns, filter, company details). Bump it whenever
+# ingestion changes so cached snapshots of parsed data files are invalidated.
+INGESTION_SCHEMA_VERSION = 1
+
+def load_data_file(data_file_path, read_only=False):
     """
     Load the data file and return the workbook and sheet.
 
     Args:
         data_file_path (str): Path to the data file.
+        read_only (bool): If True, open the workbook in openpyxl's read-only (streaming) mode.
+            Rows can then only be iterated, and the workbook should be closed when done.
 
     Returns:
         tuple: A tuple containing the loaded workbook and the first sheet from the workbook.
     """
-    data_wb = load_workbook(data_file_path, data_only=True)
+    data_wb = load_workbook(data_file_path, data_only=True, read_only=read_only)
     data_sheet = data_wb.worksheets[0]
+    if read_only:
+        # Some exporters write a wrong <dimension>, which would truncate streamed rows
+        data_sheet.reset_dimensions()
     return data_wb, data_sheet
 
-def load_working_paper(working_paper_path, sh_n):
+def _xml_local_name(tag):
+    """Return an XML tag without its namespace (e.g. '{ns}row' -> 'row')."""
+    return tag.rsplit("}", 1)[-1]
+
+def _xlsx_first_sheet_path(archive):
+    """Return the archive path of the first worksheet of an xlsx file."""
+    workbook_root = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    first_sheet = next(el for el in workbook_root.iter() if _xml_local_name(el.tag) == "sheet")
+    relationship_id = next(value for key, value in first_sheet.attrib.items() if _xml_local_name(key) == "id")
+
+    rels_root = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels_root:
+        if rel.get("Id") == relationship_id:
+            target = rel.get("Target")
+            return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+    raise KeyError(f"Relationship {relationship_id} for the first sheet not found")
+
+def read_shared_strings(stream, last_index=None):
     """
-    Load the working paper template, unlock all sheets, and return the workbook and lead sheet.
+    Read the text of the strings of a sharedStrings part.
+
+    Rich text is joined from its runs; phonetic hints (<rPh>) are ignored.
+
+    Args:
+        stream: The part, as a binary file object.
+        last_index (int): Stop once the string at this index has been read. Default: read all of them.
+
+    Returns:
+        list: The strings, by index.
+    """
+    strings = []
+    for _, element in ElementTree.iterparse(stream):
+        if _xml_local_name(element.tag) != "si":
+            continue
+        text = []
+        for child in element:
+            child_name = _xml_local_name(child.tag)
+            if child_name == "t":
+                text.append(child.text or "")
+            elif child_name == "r":
+                text.extend(t.text or "" for t in child if _xml_local_name(t.tag) == "t")
+        strings.append("".join(text))
+        element.clear()
+        if last_index is not None and len(strings) > last_index:
+            break
+    return strings
+
+def _xlsx_shared_strings(archive, needed):
+    """Read the shared strings up to the highest index in `needed` and return them as a list."""
+    if not needed or "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    with archive.open("xl/sharedStrings.xml") as f:
+        return read_shared_strings(f, last_index=max(needed))
+
+def probe_data_file_header(data_file_path):
+    """
+    Read only the header row and the row count of the data file's first sheet.
+
+    The xlsx archive is read directly: the first worksheet's XML is streamed until the end of its
+    first row, and the shared strings are read only as far as the header needs them. This is much
+    faster than loading the workbook when only the headers have to be validated.
+
+    Args:
+        data_file_path (str): Path to the data file.
+
+    Returns:
+        tuple: The list of header values (None for empty header cells) and the number of rows
+            (header included) declared by the sheet's <dimension>, or None if it has none.
+    """
+    with zipfile.ZipFile(data_file_path) as archive:
+        sheet_path = _xlsx_first_sheet_path(archive)
+
+        row_count = None
+        header_cells = {}
+        with archive.open(sheet_path) as f:
+            for event, element in ElementTree.iterparse(f, events=("start", "end")):
+                name = _xml_local_name(element.tag)
+                if event == "start" and name == "dimension":
+                    _, min_row, _, max_row = range_boundaries(element.get("ref"))
+                    row_count = (max_row or min_row) - min_row + 1
+                elif event == "end" and name == "row":
+                    column = 0
+                    for cell in element:
+                        if _xml_local_name(cell.tag) != "c":
+                            continue
+                        reference = cell.get("r")
+                        column = column_letter_to_index(reference.rstrip("0123456789")) if reference else column + 1
+                        cell_type = cell.get("t", "n")
+                        if cell_type == "inlineStr":
+                            value = "".join(t.text or "" for t in cell.iter() if _xml_local_name(t.tag) == "t")
+                        else:
+                            value = next((v.text for v in cell if _xml_local_name(v.tag) == "v"), None)
+                        header_cells[column] = (cell_type, value)
+                    break
+
+        shared_indexes = [int(value) for cell_type, value in header_cells.values() if cell_type == "s" and value is not None]
+        shared_strings = _xlsx_shared_strings(archive, shared_indexes)
+
+    headers = [None] * max(header_cells, default=0)
+    for column, (cell_type, value) in header_cells.items():
+        if value is None:
+            continue
+        if cell_type == "s":
+            value = shared_strings[int(value)]
+        elif cell_type == "n":
+            value = float(value) if any(c in value for c in ".eE") else int(value)
+        elif cell_type == "b":
+            value = value == "1"
+        headers[column - 1] = value
+    return headers, row_count
+
+def parse_working_paper(working_paper_path):
+    """
+    Parse a working paper template from disk and unlock all sheets.
 
     Args:
         working_paper_path (str): Path to the working paper template.
-        sh_n (int): Index of the lead sheet (0-based).
-        
+
     Returns:
-        tuple: A tuple containing the loaded working paper workbook and the specified lead sheet.
-        
+        openpyxl.Workbook: The unlocked workbook.
+
     Raises:
         Exception: If the password for unlocking the sheets is incorrect or the workbook cannot be loaded.
     """
@@ -176,8 +334,6 @@ def load_working_paper(working_paper_path, sh_n):
     
     # Suppress the data validation warning by temporarily redirecting stderr
     import warnings
-    import sys
-    from io import StringIO
     
     # Temporarily suppress warnings during workbook loading
     with warnings.catch_warnings():
@@ -190,32 +346,104 @@ def load_working_paper(working_paper_path, sh_n):
         if sheet.protection.sheet:
             sheet.protection.set_password(password)  # Unlock sheet with password, if provided
             sheet.protection.sheet = False  # Disable protection
+
+    return working_paper_wb
+
+def load_working_paper(working_paper_path, sh_n):
+    """
+    Load the working paper template, unlock all sheets, and return the workbook and lead sheet.
+
+    The template is parsed and unlocked once per process (see `template_cache.TemplateCache`);
+    each call gets its own copy of the workbook.
+
+    Args:
+        working_paper_path (str): Path to the working paper template.
+        sh_n (int): Index of the lead sheet (0-based).
+        
+    Returns:
+        tuple: A tuple containing the loaded working paper workbook and the specified lead sheet.
+        
+    Raises:
+        Exception: If the password for unlocking the sheets is incorrect or the workbook cannot be loaded.
+    """
+    from template_cache import get_template_cache
+
+    working_paper_wb = get_template_cache().load(working_paper_path)
     
     # Get the specified lead sheet by index
     lead_sheet = working_paper_wb.worksheets[sh_n]
     
     return working_paper_wb, lead_sheet
 
-def convert_to_dataframe(data_sheet):
+def convert_to_dataframe(data_sheet, columns=None):
     """
     Convert the sheet data to a DataFrame, applying filtering conditions.
 
+    The filtering conditions are applied row by row while the sheet is iterated, so rejected
+    rows are never added to the DataFrame. This also works on read-only (streaming) sheets.
+
     Args:
         data_sheet (Worksheet): The sheet from which data will be extracted.
+        columns (list): Optional column names to keep. Columns not in the list are dropped while
+            iterating; names missing from the sheet are ignored. Defaults to all columns.
 
     Returns:
         pd.DataFrame: A DataFrame containing the filtered data based on predefined conditions.
     """
-    # Convert the sheet data to a DataFrame
-    df = pd.DataFrame(
-        data_sheet.iter_rows(values_only=True, min_row=2),
-        columns=[cell.value for cell in data_sheet[1]]
-    )
-    
-    # Apply the filtering conditions
-    df = df[(df['PAYMENT_STATUS_ID'] == 3) & (df['PAYMENTMEDIUMID'] == 2) & (df['BANK_PAY_AMOUNT'] != 0 )]
-    
-    return df
+    rows = data_sheet.iter_rows(values_only=True)
+    header = next(rows, ())
+    return _filter_data_rows(rows, header, columns)
+
+# Data rows converted between two checks of the memory ceiling
+MEMORY_CHECK_ROWS = 16384
+
+def _filter_data_rows(rows, header, columns=None, on_row=None):
+    """
+    Build the filtered DataFrame from data rows (header excluded).
+
+    Keeps the rows with PAYMENT_STATUS_ID == 3, PAYMENTMEDIUMID == 2 and BANK_PAY_AMOUNT != 0,
+    projected onto `columns`. The index holds each kept row's position in the sheet, as if the
+    whole sheet had been converted and then filtered.
+
+    Args:
+        rows (iterable): Tuples of cell values, one per data row.
+        header (tuple): The header row values.
+        columns (list): Optional column names to keep (defaults to all columns).
+        on_row (callable): Optional callback invoked with every row before it is filtered.
+
+    Returns:
+        pd.DataFrame: The filtered data.
+    """
+    headings = {value: idx for idx, value in enumerate(header)}
+    status_idx = headings['PAYMENT_STATUS_ID']
+    medium_idx = headings['PAYMENTMEDIUMID']
+    amount_idx = headings['BANK_PAY_AMOUNT']
+
+    if columns is None:
+        kept_columns = list(header)
+        kept_idx = list(range(len(header)))
+    else:
+        wanted = set(columns)
+        kept_columns = [value for value in header if value in wanted]
+        kept_idx = [idx for idx, value in enumerate(header) if value in wanted]
+    width = len(header)
+
+    index = []
+    records = []
+    for position, row in enumerate(rows):
+        # A large sheet can outgrow the memory ceiling before the stage ends
+        if position % MEMORY_CHECK_ROWS == 0 and position:
+            check_memory_ceiling("convert")
+        # Streamed rows stop at the last non-empty cell
+        if len(row) < width:
+            row = row + (None,) * (width - len(row))
+        if on_row is not None:
+            on_row(row)
+        if row[status_idx] == 3 and row[medium_idx] == 2 and row[amount_idx] != 0:
+            index.append(position)
+            records.append([row[idx] for idx in kept_idx])
+
+    return pd.DataFrame(records, columns=kept_columns, index=index)
 
 def get_column_indexes(data_sheet):
     """
@@ -245,6 +473,181 @@ def extract_tradename_uif(data_sheet, headings):
     uif_reference = next(data_sheet.iter_rows(min_row=2, min_col=headings["UIFREFERENCENUMBER"], max_col=headings["UIFREFERENCENUMBER"], values_only=True))[0]
     return tradename, uif_reference
 
+# Date formats tried for SHUTDOWN_FROM / SHUTDOWN_TILL, in order of preference
+SHUTDOWN_DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",  # Standard datetime format
+    "%Y-%m-%d",           # ISO date format
+    "%d/%m/%Y",           # European date format
+    "%m/%d/%Y",           # US date format
+    "%d-%b-%Y",           # Day-Month-Year with abbreviated month name
+    "%d %B %Y",           # Day-Month-Year with full month name
+]
+
+# Date formats tried for PAYMENTDATE, in order of preference
+PAYMENT_DATE_FORMATS = [
+    "%d-%b-%Y",              # Example: 28-May-2020
+    "%d-%b-%Y %I:%M:%S %p",  # Example: 28-May-2020 03:11:10 PM
+    "%Y-%m-%d %H:%M:%S",     # Example: 2020-05-28 15:11:10
+    "%d/%m/%Y",              # Example: 28/05/2020
+    "%m/%d/%Y",              # Example: 05/28/2020
+    "%d-%m-%Y",              # Example: 28-05-2020
+    "%Y/%m/%d",              # Example: 2020/05/28
+    "%d %b %Y",              # Example: 28 May 2020
+]
+
+# Number of distinct values used to infer the format of a date column
+DATE_FORMAT_SAMPLE_SIZE = 50
+
+# (formats in the order tried, raw string) -> parsed datetime64 (NaT if no format matched)
+_date_memo = {}
+_DATE_MEMO_MAX_ENTRIES = 100_000
+
+def _infer_date_format(values, date_formats, sample_size=DATE_FORMAT_SAMPLE_SIZE):
+    """
+    Pick the format that parses the most values of a sample. Ties go to the earlier format.
+
+    Args:
+        values (ndarray): Distinct date strings.
+        date_formats (list): Candidate strptime formats.
+        sample_size (int): Number of values to try each format on.
+
+    Returns:
+        str: The best format, or None if no format parses any sampled value.
+    """
+    sample = values[:sample_size]
+    best_format, best_count = None, 0
+    for fmt in date_formats:
+        count = pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()
+        if count > best_count:
+            best_format, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best_format
+
+def _parse_date_strings(strings, date_formats):
+    """
+    Parse distinct date strings, inferred format first, then each remaining format on the stragglers.
+
+    Args:
+        strings (ndarray): Distinct date strings.
+        date_formats (list): Candidate strptime formats.
+
+    Returns:
+        ndarray: datetime64[ns] values, NaT where no format matched.
+    """
+    best_format = _infer_date_format(strings, date_formats)
+    ordered_formats = tuple([best_format] + [fmt for fmt in date_formats if fmt != best_format]
+                            if best_format else date_formats)
+
+    result = np.full(len(strings), np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    # 1. Take previously parsed values from the memo
+    pending = []
+    for i, value in enumerate(strings):
+        memoized = _date_memo.get((ordered_formats, value))
+        if memoized is None:
+            pending.append(i)
+        else:
+            result[i] = memoized
+    pending = np.asarray(pending, dtype=np.intp)
+    if not len(pending):
+        return result
+    new_positions = pending
+
+    # 2. Parse the rest one format at a time, only retrying the values that did not match
+    remaining = strings[pending]
+    for fmt in ordered_formats:
+        parsed = pd.to_datetime(remaining, format=fmt, errors="coerce").to_numpy(dtype="datetime64[ns]")
+        matched = ~np.isnat(parsed)
+        result[pending[matched]] = parsed[matched]
+        pending, remaining = pending[~matched], remaining[~matched]
+        if not len(pending):
+            break
+
+    # 3. Remember the results, starting over if the memo grows too large
+    if len(_date_memo) + len(new_positions) > _DATE_MEMO_MAX_ENTRIES:
+        _date_memo.clear()
+    for i in new_positions:
+        _date_memo[(ordered_formats, strings[i])] = result[i]
+    return result
+
+def parse_date_column(values, date_formats):
+    """
+    Parse a column of dates that may be stored as datetimes or as strings in any of `date_formats`.
+
+    Each distinct value is parsed once. Datetime values are kept as they are; strings are parsed
+    with the format that fits a sample of the column best, falling back to the other formats for
+    the values it does not match.
+
+    Args:
+        values (Series | list): The raw date values.
+        date_formats (list): Candidate strptime formats, in order of preference.
+
+    Returns:
+        tuple: (Series of datetime64 values with NaT for missing or unparseable values,
+                number of non-missing values that could not be parsed)
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, 0
+
+    # 1. Reduce the column to its distinct values (missing values get code -1)
+    codes, uniques = pd.factorize(series)
+    uniques = np.asarray(uniques, dtype=object)
+    parsed = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    # 2. Datetime values need no parsing, blank strings count as missing
+    is_datetime = np.fromiter(
+        (isinstance(value, (datetime, date, np.datetime64)) for value in uniques), dtype=bool, count=len(uniques)
+    )
+    is_blank = np.fromiter(
+        (isinstance(value, str) and not value.strip() for value in uniques), dtype=bool, count=len(uniques)
+    )
+    if is_datetime.any():
+        parsed[is_datetime] = pd.to_datetime(pd.Series(uniques[is_datetime], dtype=object)).to_numpy(dtype="datetime64[ns]")
+
+    # 3. Parse everything else as strings
+    is_string = ~is_datetime & ~is_blank
+    if is_string.any():
+        strings = np.array([str(value) for value in uniques[is_string]], dtype=object)
+        parsed[is_string] = _parse_date_strings(strings, date_formats)
+
+    # 4. Map the distinct values back onto the rows
+    present = codes >= 0
+    result = np.full(len(series), np.datetime64("NaT"), dtype="datetime64[ns]")
+    result[present] = parsed[codes[present]]
+    failed_uniques = np.isnat(parsed) & is_string
+    failed = int(failed_uniques[codes[present]].sum())
+
+    return pd.Series(result, index=series.index, name=series.name), failed
+
+def format_period(from_date, till_date):
+    """Format a shutdown period as "dd Month yyyy to dd Month yyyy"."""
+    return f"{from_date.strftime('%d %B %Y')} to {till_date.strftime('%d %B %Y')}"
+
+def parse_shutdown_periods(shutdown_from, shutdown_till):
+    """
+    Parse SHUTDOWN_FROM and SHUTDOWN_TILL values into the unique shutdown periods.
+
+    Args:
+        shutdown_from (Series | list): Raw SHUTDOWN_FROM values.
+        shutdown_till (Series | list): Raw SHUTDOWN_TILL values, aligned with `shutdown_from`.
+
+    Returns:
+        tuple: (list of unique (from, till) Timestamp pairs in chronological order,
+                number of dates that could not be parsed)
+    """
+    from_dates, from_failed = parse_date_column(shutdown_from, SHUTDOWN_DATE_FORMATS)
+    till_dates, till_failed = parse_date_column(shutdown_till, SHUTDOWN_DATE_FORMATS)
+
+    periods = (
+        pd.DataFrame({"from": from_dates.to_numpy(), "till": till_dates.to_numpy()})
+        .dropna()
+        .drop_duplicates()
+        .sort_values(["from", "till"])
+    )
+    return list(zip(periods["from"], periods["till"])), from_failed + till_failed
+
 def extract_shutdown_periods(data_sheet, headings):
     """
     Extract and return unique shutdown periods as a formatted string in chronological order.
@@ -258,46 +661,198 @@ def extract_shutdown_periods(data_sheet, headings):
     """
     shutdown_from_col = headings["SHUTDOWN_FROM"]
     shutdown_till_col = headings["SHUTDOWN_TILL"]
-    periods = set()  # Use a set to store unique periods (to avoid duplicates)
-
-    # Define possible date formats for parsing
-    date_formats = [
-        "%Y-%m-%d %H:%M:%S",  # Standard datetime format
-        "%Y-%m-%d",           # ISO date format
-        "%d/%m/%Y",           # European date format
-        "%m/%d/%Y",           # US date format
-        "%d-%b-%Y",           # Day-Month-Year with abbreviated month name
-        "%d %B %Y",           # Day-Month-Year with full month name
-    ]
 
-    # Loop through each row in the data sheet and extract shutdown periods
+    # Collect the raw (from, till) pairs, each distinct pair is parsed only once
+    raw_periods = set()
     for row in data_sheet.iter_rows(min_row=2, values_only=True):
-        shutdown_from = row[shutdown_from_col - 1]
-        shutdown_till = row[shutdown_till_col - 1]
+        raw_periods.add((row[shutdown_from_col - 1], row[shutdown_till_col - 1]))
 
-        if shutdown_from and shutdown_till:
-            from_date, till_date = None, None
+    return format_shutdown_periods(raw_periods)
 
-            # Try parsing the dates using the available formats
-            for fmt in date_formats:
-                try:
-                    if not from_date:
-                        from_date = datetime.strptime(str(shutdown_from), fmt)
-                    if not till_date:
-                        till_date = datetime.strptime(str(shutdown_till), fmt)
-                except ValueError:
-                    continue
+def format_shutdown_periods(raw_periods):
+    """
+    Parse raw shutdown (from, till) values and format the unique periods in chronological order.
 
-            # If parsing was successful, add the period to the set
-            if from_date and till_date:
-                periods.add((from_date, till_date))
+    Args:
+        raw_periods (iterable): Pairs of raw SHUTDOWN_FROM and SHUTDOWN_TILL cell values.
 
-    # Sort the periods by the 'from_date'
-    sorted_periods = sorted(periods, key=lambda x: x[0])
+    Returns:
+        str: A string representing the unique shutdown periods in chronological order.
+    """
+    # Pairs with an empty side are not periods
+    raw_periods = [(shutdown_from, shutdown_till) for shutdown_from, shutdown_till in raw_periods
+                   if shutdown_from and shutdown_till]
+    periods, failed = parse_shutdown_periods(
+        [period[0] for period in raw_periods], [period[1] for period in raw_periods]
+    )
+    if failed:
+        logger.warning("%d shutdown dates could not be parsed and were ignored.", failed)
 
     # Convert the sorted periods into a string format
-    periods_str = ", ".join([f"{period[0].strftime('%d %B %Y')} to {period[1].strftime('%d %B %Y')}" for period in sorted_periods])
-    return periods_str
+    return ", ".join(format_period(from_date, till_date) for from_date, till_date in periods)
+
+class DataFileContext:
+    """
+    Parsed contents of a single UIF data file, shared by TP.1 - TP.4.
+
+    The data file is parsed once and the filtered DataFrame, headings, tradename, UIF reference
+    and company summary are kept so that every working paper generated for the file can reuse
+    them instead of loading the workbook again.
+
+    Attributes:
+        data_file_path (str): Path to the original data file.
+        data (pd.DataFrame): The filtered data (see `convert_to_dataframe`).
+        headings (dict): Column headings mapped to their 1-based indexes.
+        tradename (str): The 'TRADENAME' of the first data row.
+        uif_reference (str): The 'UIFREFERENCENUMBER' of the first data row.
+        periods_claimed (str): The unique shutdown periods in chronological order.
+    """
+
+    def __init__(self, data_file_path, data, headings, tradename, uif_reference, periods_claimed):
+        self.data_file_path = data_file_path
+        self.data = data
+        self.headings = headings
+        self.tradename = tradename
+        self.uif_reference = uif_reference
+        self.periods_claimed = periods_claimed
+        self._aggregation_plan = None
+
+    def __getstate__(self):
+        # Sent to worker processes without the aggregation plan, each worker builds only the aggregates it uses
+        state = self.__dict__.copy()
+        state["_aggregation_plan"] = None
+        return state
+
+    @property
+    def aggregation_plan(self):
+        """AggregationPlan: The per-employee aggregates of `data` shared by the TP sheets, built on first use."""
+        if self._aggregation_plan is None:
+            from aggregation_plan import AggregationPlan
+            self._aggregation_plan = AggregationPlan(self.data)
+        return self._aggregation_plan
+
+    @property
+    def number_of_employees(self):
+        """int: The number of unique ID numbers in the filtered data."""
+        return get_unique_id_count(self.data)
+
+    @property
+    def total_amount_claimed(self):
+        """float: The sum of 'BANK_PAY_AMOUNT' in the filtered data, rounded to 2 decimal points."""
+        return get_bank_pay_amount_sum(self.data)
+
+    @property
+    def company_info(self):
+        """tuple: The same tuple as returned by `get_company_info`."""
+        return (
+            self.tradename,
+            self.uif_reference,
+            self.periods_claimed,
+            self.number_of_employees,
+            self.total_amount_claimed,
+        )
+
+
+def load_data_file_context(data_file_path, streaming=True):
+    """
+    Parse the data file once and return a `DataFileContext` holding everything the TPs need.
+
+    In streaming mode the workbook is opened read-only and read in a single pass: only the
+    `INGESTION_COLUMNS` of rows passing the payment filter are kept, while the tradename,
+    UIF reference and shutdown periods are picked up from the unfiltered rows on the way.
+
+    Args:
+        data_file_path (str): Path to the data file.
+        streaming (bool): Use read-only streaming ingestion (default). If False, the workbook
+            is fully loaded and every column is kept.
+
+    Returns:
+        DataFileContext: The parsed data file.
+
+    Raises:
+        KeyError: If a column needed for the company details or the payment filter is missing.
+        ValueError: If the data file has no data rows.
+    """
+    if not streaming:
+        with span("load"):
+            data_wb, data_sheet = load_data_file(data_file_path)
+        with span("convert") as convert_span:
+            headings = get_column_indexes(data_sheet)
+            tradename, uif_reference = extract_tradename_uif(data_sheet, headings)
+            periods_claimed = extract_shutdown_periods(data_sheet, headings)
+            data = convert_to_dataframe(data_sheet)
+            convert_span.count(rows=len(data), cells=data.size)
+        data_wb.close()
+        return DataFileContext(data_file_path, data, headings, tradename, uif_reference, periods_claimed)
+
+    # The rows are read from the archive while they are converted, so "convert" includes reading them
+    with span("load"):
+        data_wb, data_sheet = load_data_file(data_file_path, read_only=True)
+    try:
+        rows = data_sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        headings = {value: idx for idx, value in enumerate(header, start=1)}
+        tradename_idx = headings["TRADENAME"] - 1
+        uif_reference_idx = headings["UIFREFERENCENUMBER"] - 1
+        shutdown_from_idx = headings["SHUTDOWN_FROM"] - 1
+        shutdown_till_idx = headings["SHUTDOWN_TILL"] - 1
+
+        first_row = []
+        raw_periods = set()
+
+        def collect_company_details(row):
+            if not first_row:
+                first_row.append(row)
+            raw_periods.add((row[shutdown_from_idx], row[shutdown_till_idx]))
+
+        with span("convert") as convert_span:
+            data = _filter_data_rows(rows, header, INGESTION_COLUMNS, on_row=collect_company_details)
+            convert_span.count(rows=len(data), cells=data.size)
+    finally:
+        data_wb.close()
+
+    if not first_row:
+        raise ValueError(f"No data rows found in {os.path.basename(data_file_path)}")
+
+    tradename = first_row[0][tradename_idx]
+    uif_reference = first_row[0][uif_reference_idx]
+    periods_claimed = format_shutdown_periods(raw_periods)
+
+    return DataFileContext(data_file_path, data, headings, tradename, uif_reference, periods_claimed)
+
+
+def ensure_data_file_context(data_file):
+    """
+    Return `data_file` unchanged if it is already a `DataFileContext`, otherwise parse it.
+
+    Args:
+        data_file (str | DataFileContext): Path to the data file or an already parsed context.
+
+    Returns:
+        DataFileContext: The parsed data file.
+    """
+    if isinstance(data_file, DataFileContext):
+        return data_file
+    return load_data_file_context(data_file)
+
+
+def get_company_folder_name(tradename, uif_reference=None):
+    """
+    Return the name of a company's folder in the output directory: "{UIF Reg Number} - {Company name/tradename}".
+
+    Args:
+        tradename (str): The tradename of the company.
+        uif_reference (str): The UIF reference number of the company.
+
+    Returns:
+        str: The folder name, with the characters not safe in file paths replaced by "_".
+    """
+    safe_tradename = "".join(c if c.isalnum() or c in (" ", "_", "-") else "_" for c in tradename).strip()
+    safe_uif_ref = "".join(c if c.isalnum() or c in (" ", "_", "-") else "_" for c in (uif_reference or "")).strip()
+    if safe_uif_ref:
+        return f"{safe_uif_ref} - {safe_tradename}"
+    return f"UIF_REF - {safe_tradename}"
+
 
 def create_output_directory(output_directory, tradename, wp_n, uif_reference=None, data_file_path=None, template_paths=None, create_folders_only=False):
     """
@@ -318,20 +873,15 @@ def create_output_directory(output_directory, tradename, wp_n, uif_reference=Non
     Raises:
         ValueError: If `wp_n` is not in the range [1, 2, 3, 4], a ValueError will be raised.
     """
-    # Ensure the tradename and UIF reference are safe for use in file paths
-    safe_tradename = "".join(c if c.isalnum() or c in (" ", "_", "-") else "_" for c in tradename).strip()
+    # Ensure the UIF reference is safe for use in file paths
     safe_uif_ref = "".join(c if c.isalnum() or c in (" ", "_", "-") else "_" for c in (uif_reference or "")).strip()
     
     # Create parent folder name: {UIF Reg Number} - {Company name/tradename}
-    if safe_uif_ref:
-        parent_folder_name = f"{safe_uif_ref} - {safe_tradename}"
-    else:
-        parent_folder_name = f"UIF_REF - {safe_tradename}"
+    parent_folder_name = get_company_folder_name(tradename, uif_reference)
     
-    # Create the main parent folder
+    # Create the main parent folder (exist_ok: several batch workers may create the same folders)
     parent_folder = os.path.join(output_directory, parent_folder_name)
-    if not os.path.exists(parent_folder):
-        os.makedirs(parent_folder)
+    os.makedirs(parent_folder, exist_ok=True)
     
     # Create the 4 subfolders
     subfolders = [
@@ -343,22 +893,19 @@ def create_output_directory(output_directory, tradename, wp_n, uif_reference=Non
     
     for subfolder in subfolders:
         subfolder_path = os.path.join(parent_folder, subfolder)
-        if not os.path.exists(subfolder_path):
-            os.makedirs(subfolder_path)
+        os.makedirs(subfolder_path, exist_ok=True)
     
     # Copy data file to UIF DATAFILE folder if provided
     if data_file_path and os.path.exists(data_file_path):
-        import shutil
         data_filename = os.path.basename(data_file_path)
         uif_datafile_path = os.path.join(parent_folder, "UIF DATAFILE", data_filename)
         try:
-            shutil.copy2(data_file_path, uif_datafile_path)
+            copy_file_atomic(data_file_path, uif_datafile_path)
         except Exception as e:
-            print(f"Warning: Could not copy data file to UIF DATAFILE folder: {e}")
+            logger.warning("Could not copy data file to UIF DATAFILE folder: %s", e)
     
     # Copy report templates to AUDIT REPORTING TEMPLATES folder with UIF reference naming
     if safe_uif_ref:
-        import shutil
         script_dir = os.path.dirname(os.path.abspath(__file__))
         report_templates_dir = os.path.join(script_dir, "TEMPLATES", "Report_Templates")
         audit_templates_path = os.path.join(parent_folder, "AUDIT REPORTING TEMPLATES")
@@ -373,9 +920,9 @@ def create_output_directory(output_directory, tradename, wp_n, uif_reference=Non
                     new_filename = f"{file_name_without_ext} - {safe_uif_ref}{file_extension}"
                     dest_path = os.path.join(audit_templates_path, new_filename)
                     try:
-                        shutil.copy2(source_path, dest_path)
+                        copy_file_atomic(source_path, dest_path)
                     except Exception as e:
-                        print(f"Warning: Could not copy report template {filename} to AUDIT REPORTING TEMPLATES folder: {e}")
+                        logger.warning("Could not copy report template %s to AUDIT REPORTING TEMPLATES folder: %s", filename, e)
     
     # If only creating folders, return the parent folder path
     if create_folders_only:
@@ -400,12 +947,76 @@ def create_output_directory(output_directory, tradename, wp_n, uif_reference=Non
     # Create the processed file path in the AUDIT WORKING PAPERS subfolder
     audit_working_papers_folder = os.path.join(parent_folder, "AUDIT WORKING PAPERS")
     tp_x_folder = os.path.join(audit_working_papers_folder, folder_name)
-    if not os.path.exists(tp_x_folder):
-        os.makedirs(tp_x_folder)
+    os.makedirs(tp_x_folder, exist_ok=True)
     processed_file_path = os.path.join(tp_x_folder, file_name)
     
     return processed_file_path
 
+
+def copy_file_atomic(source_path, dest_path):
+    """
+    Copy a file (with its metadata) so that readers of `dest_path` never see a partial copy.
+
+    The file is copied next to `dest_path` and moved into place, so concurrent copies of the same
+    file (batch workers filling the same company folder) cannot interleave.
+
+    Args:
+        source_path (str): The file to copy.
+        dest_path (str): The destination path.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copy2(source_path, temp_path)
+        os.replace(temp_path, dest_path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+# Row references in a formula (e.g. "B12", "$AS12"); every one is moved to the target row when a row is copied
+FORMULA_ROW_REFERENCE = re.compile(r'(\$?[A-Za-z]+)(\d+)')
+
+# Style ids copied from a reference cell (font, fill, border, number format, protection, alignment);
+# pivotButton, quotePrefix and the named style are left as they are
+STAMPED_STYLE_IDS = slice(0, 6)
+
+def copy_cell_style(source_cell, target_cell):
+    """
+    Copy the font, alignment, border, fill, number format and protection of a source cell to a target cell.
+
+    Args:
+        source_cell (Cell): The source cell containing the style.
+        target_cell (Cell): The target cell where the style will be copied to.
+    """
+    if source_cell.has_style:
+        target_cell.font = copy(source_cell.font) if source_cell.font else None
+        target_cell.alignment = copy(source_cell.alignment) if source_cell.alignment else None
+        target_cell.border = copy(source_cell.border) if source_cell.border else None
+        target_cell.fill = copy(source_cell.fill) if source_cell.fill else None
+        target_cell.number_format = source_cell.number_format
+        target_cell.protection = copy(source_cell.protection) if source_cell.protection else None
+
+def split_formula_at_rows(formula):
+    """
+    Split a formula at its row references, so it can be rebuilt for any row with `str(row).join(parts)`.
+
+    Args:
+        formula (str): The formula (e.g. "=SUM(J12:L12)/3").
+
+    Returns:
+        list: The formula text between the row numbers (e.g. ["=SUM(J", ":L", ")/3"]).
+    """
+    parts = []
+    last_end = 0
+    for match in FORMULA_ROW_REFERENCE.finditer(formula):
+        parts.append(formula[last_end:match.end(1)])
+        last_end = match.end()
+    parts.append(formula[last_end:])
+    return parts
+
 def copy_cell_style_and_formula(source_cell, target_cell, target_row):
     """
     Copy both the styles, formulas, and data validation from a source cell to a target cell, adjusting for row references.
@@ -423,13 +1034,7 @@ def copy_cell_style_and_formula(source_cell, target_cell, target_row):
     """
     try:
         # Copy the style
-        if source_cell.has_style:
-            target_cell.font = copy(source_cell.font) if source_cell.font else None
-            target_cell.alignment = copy(source_cell.alignment) if source_cell.alignment else None
-            target_cell.border = copy(source_cell.border) if source_cell.border else None
-            target_cell.fill = copy(source_cell.fill) if source_cell.fill else None
-            target_cell.number_format = source_cell.number_format
-            target_cell.protection = copy(source_cell.protection) if source_cell.protection else None
+        copy_cell_style(source_cell, target_cell)
 
         # Note: Data validation is handled automatically by Excel when rows are inserted
         # We don't need to manually copy data validation as it's preserved by Excel's built-in functionality
@@ -438,13 +1043,13 @@ def copy_cell_style_and_formula(source_cell, target_cell, target_row):
         if source_cell.value and isinstance(source_cell.value, str) and source_cell.value.startswith('='):
             formula = source_cell.value
             # Update the row references in the formula to match the target row
-            updated_formula = re.sub(r'(\$?[A-Za-z]+)(\d+)', lambda m: f"{m.group(1)}{target_row}" if m.group(2) != str(target_row) else m.group(0), formula)
+            updated_formula = FORMULA_ROW_REFERENCE.sub(lambda m: f"{m.group(1)}{target_row}" if m.group(2) != str(target_row) else m.group(0), formula)
             target_cell.value = updated_formula
         elif source_cell.value:
             target_cell.value = source_cell.value  # Copy value if it's not a formula
 
     except Exception as e:
-        print(f"Error copying cell style and formula: {e}")
+        logger.error("Error copying cell style and formula: %s", e)
         
 def insert_rows(employee_sheet, num_rows_to_add, insert_start_row):
     """
@@ -464,17 +1069,294 @@ def insert_rows(employee_sheet, num_rows_to_add, insert_start_row):
     try:
         employee_sheet.insert_rows(insert_start_row, amount=num_rows_to_add)
     except Exception as e:
-        print(f"Error while inserting rows: {e}")
+        logger.error("Error while inserting rows: %s", e)
 
-def copy_formatting(employee_sheet, START__ROW, num_rows_to_add, source_cell_n):
+def shift_formula_rows(formula, insert_start_row, num_rows_added, sheet_title=None):
+    """
+    Shift the row references of a formula that point at or below an insertion point, as Excel does when rows are inserted.
+
+    Only range operands are adjusted (text in quotes is left alone), and references to other sheets are kept.
+
+    Args:
+        formula (str): The formula (e.g. "=D22-H22").
+        insert_start_row (int): The row number where rows were inserted.
+        num_rows_added (int): The number of rows that were inserted.
+        sheet_title (str): The title of the sheet holding the formula; references qualified with it are shifted too.
+
+    Returns:
+        str: The formula with adjusted row references.
+    """
+    tokenizer = Tokenizer(formula)
+    changed = False
+    for token in tokenizer.items:
+        if token.type != Token.OPERAND or token.subtype != Token.RANGE:
+            continue
+        sheet_name, separator, reference = token.value.rpartition("!")
+        if separator and sheet_name.strip("'") != sheet_title:
+            continue
+        adjusted = adjust_formula_references(reference, insert_start_row, num_rows_added)
+        if adjusted != reference:
+            token.value = f"{sheet_name}{separator}{adjusted}"
+            changed = True
+    return tokenizer.render() if changed else formula
+
+def insert_table_rows(sheet, footer, num_rows_to_add):
+    """
+    Open a gap of empty rows at the top of a table's footer by moving the footer down.
+
+    The footer (the template rows from the table's insert row to the last row, see the template
+    manifest) is moved down by `num_rows_to_add` rows in one pass: its cells, its merged ranges
+    (merges reaching into it from above are extended), its row dimensions, and the row references
+    of its formulas that point into the footer. Nothing else on the sheet is visited, so the cost
+    depends on the footer size and not on the sheet size, and no merged ranges need to be undone
+    and redone around the insertion. Conditional formatting and data validation ranges are moved
+    the same way.
+
+    Args:
+        sheet (Worksheet): The worksheet where the rows will be inserted.
+        footer (dict): The `footer` entry of a manifest table.
+        num_rows_to_add (int): The number of rows to insert.
+
+    Returns:
+        None
+    """
+    if num_rows_to_add <= 0:
+        return
+
+    first_row, last_row, last_column = footer["first_row"], footer["last_row"], footer["last_column"]
+    sheet_cells = sheet._cells
+
+    # 1. Move the footer cells, bottom row first so no cell is overwritten, shifting their formulas
+    for row in range(last_row, first_row - 1, -1):
+        for column in range(1, last_column + 1):
+            cell = sheet_cells.pop((row, column), None)
+            if cell is None:
+                continue
+            cell.row = row + num_rows_to_add
+            if cell.data_type == 'f' and isinstance(cell._value, str):
+                cell._value = shift_formula_rows(cell._value, first_row, num_rows_to_add, sheet.title)
+            sheet_cells[(cell.row, column)] = cell
+
+    # 2. Move the merged ranges (re-added, since the merged cell set is keyed on the range bounds)
+    merged_ranges = {str(merged_range): merged_range for merged_range in sheet.merged_cells.ranges}
+    for coordinate in footer["merges"]:
+        merged_range = merged_ranges.get(coordinate)
+        if merged_range is None:
+            continue
+        sheet.merged_cells.remove(merged_range)
+        move_cell_range(merged_range, first_row, num_rows_to_add)
+        sheet.merged_cells.add(merged_range)
+
+    # 3. Move the row dimensions (heights, hidden rows, outline levels)
+    row_dimensions = sheet.row_dimensions
+    for row in range(last_row, first_row - 1, -1):
+        dimension = row_dimensions.pop(row, None)
+        if dimension is None:
+            continue
+        dimension.index = row + num_rows_to_add
+        row_dimensions[dimension.index] = dimension
+
+    # 4. Move the conditional formatting ranges (re-keyed, the rules are keyed on their ranges)
+    conditional_formatting = sheet.conditional_formatting
+    for existing, rules in list(conditional_formatting._cf_rules.items()):
+        sqref = shift_sqref(str(existing.sqref), first_row, num_rows_to_add)
+        if sqref != str(existing.sqref):
+            del conditional_formatting._cf_rules[existing]
+            conditional_formatting._cf_rules.setdefault(ConditionalFormatting(sqref=sqref), []).extend(rules)
+
+    # 5. Move the data validation ranges
+    for data_validation in sheet.data_validations.dataValidation:
+        sqref = shift_sqref(str(data_validation.sqref), first_row, num_rows_to_add)
+        if sqref != str(data_validation.sqref):
+            data_validation.sqref = MultiCellRange(sqref)
+
+def move_cell_range(cell_range, first_row, num_rows_to_add):
+    """
+    Move a cell range as a table's footer moves down: ranges inside the footer are shifted and
+    ranges reaching into it from above are extended.
+
+    Args:
+        cell_range (CellRange): The range, changed in place.
+        first_row (int): The first row of the footer.
+        num_rows_to_add (int): The number of rows the footer moves down.
+
+    Returns:
+        bool: Whether the range was changed.
+    """
+    if cell_range.max_row < first_row:
+        return False
+    if cell_range.min_row >= first_row:
+        cell_range.shift(row_shift=num_rows_to_add)
+    else:
+        cell_range.expand(down=num_rows_to_add)
+    return True
+
+def shift_sqref(sqref, first_row, num_rows_to_add):
+    """
+    Move the ranges of a space separated range list (e.g. "B16 C13:C15") as a table's footer moves down.
+
+    Args:
+        sqref (str): The ranges.
+        first_row (int): The first row of the footer.
+        num_rows_to_add (int): The number of rows the footer moves down.
+
+    Returns:
+        str: The moved ranges, in their original order.
+    """
+    ranges = []
+    for coordinate in sqref.split():
+        cell_range = CellRange(coordinate)
+        move_cell_range(cell_range, first_row, num_rows_to_add)
+        ranges.append(cell_range.coord)
+    return " ".join(ranges)
+
+def extend_table(sheet, layout, num_rows_to_add):
+    """
+    Grow a template table by `num_rows_to_add` rows: move its footer down and stamp its reference
+    row onto the new rows.
+
+    Sheets written by the streaming writer (`xlsx_stream.SheetPatch`) grow their tables themselves
+    while they are written.
+
+    Args:
+        sheet (Worksheet | SheetPatch): The sheet holding the table.
+        layout (dict): The table entry of the template manifest (anchor rows, footer and row prototype).
+        num_rows_to_add (int): The number of rows to insert.
+
+    Returns:
+        None
+    """
+    if not isinstance(sheet, Worksheet):
+        # Only recorded here, the rows are stamped while the sheet is written (the "save" stage)
+        with span("insert", rows=num_rows_to_add):
+            sheet.extend_table(layout, num_rows_to_add)
+        return
+
+    with span("insert", rows=num_rows_to_add):
+        insert_table_rows(sheet, layout["footer"], num_rows_to_add)
+    with span("format", rows=num_rows_to_add, cells=num_rows_to_add * len(layout["prototype"]["cells"])):
+        copy_formatting(
+            sheet, layout["insert_row"], num_rows_to_add, source_cell_n=layout["reference_row"],
+            prototype=RowPrototype.from_manifest(sheet, layout["prototype"])
+        )
+
+class RowPrototype:
+    """
+    A reference row captured once and stamped onto any number of new rows.
+
+    For each column the prototype keeps the reference cell's style ids, interned in the workbook's
+    style tables once, and its value, with formulas pre-split at their row references. Stamping a row
+    assigns the ids and joins the formula parts with the row number, so no style objects are copied
+    or looked up per cell. Each stamped cell still gets its own (9 integer) style array, because
+    openpyxl updates that array in place when a cell's style is changed later.
+
+    Args:
+        height (float): The height of the reference row.
+        cells (list): One (column, style array or None, value, formula parts or None) tuple per column.
+    """
+
+    def __init__(self, height, cells):
+        self.height = height
+        self.cells = cells
+
+    @classmethod
+    def from_row(cls, sheet, row):
+        """
+        Capture a row of a sheet (columns 1 to `max_column`).
+
+        Args:
+            sheet (Worksheet): The sheet holding the reference row.
+            row (int): The reference row.
+
+        Returns:
+            RowPrototype: The prototype of the row.
+        """
+        cells = []
+        for column in range(1, sheet.max_column + 1):
+            source_cell = sheet.cell(row=row, column=column)
+            cells.append(cls._compile_cell(sheet, column, source_cell, source_cell.value))
+        return cls(sheet.row_dimensions[row].height, cells)
+
+    @classmethod
+    def from_manifest(cls, sheet, prototype):
+        """
+        Build the prototype of a reference row from its template manifest entry, without reading the row.
+
+        Args:
+            sheet (Worksheet): The sheet the prototype will be stamped on (a copy of the manifest's template).
+            prototype (dict): The `prototype` entry of a manifest table.
+
+        Returns:
+            RowPrototype: The prototype of the row.
+        """
+        from template_manifest import decode_cell_value
+
+        cells = []
+        for entry in prototype["cells"]:
+            source_cell = Cell(sheet, style_array=entry["style"]) if entry["style"] is not None else Cell(sheet)
+            cells.append(cls._compile_cell(sheet, entry["column"], source_cell, decode_cell_value(entry)))
+        return cls(prototype["height"], cells)
+
+    @staticmethod
+    def _compile_cell(sheet, column, source_cell, value):
+        # Intern the style the same way a cell-by-cell copy does (equal styles may have several ids)
+        style_array = None
+        if source_cell.has_style:
+            stamp_cell = Cell(sheet)
+            copy_cell_style(source_cell, stamp_cell)
+            style_array = stamp_cell._style
+
+        formula_parts = None
+        if value and isinstance(value, str) and value.startswith('='):
+            formula_parts = split_formula_at_rows(value)
+            value = None
+        elif not value:
+            value = None
+        return (column, style_array, value, formula_parts)
+
+    def stamp(self, sheet, start_row, num_rows):
+        """
+        Stamp the prototype onto consecutive rows: styles, formulas adjusted to each row, values and row height.
+
+        Args:
+            sheet (Worksheet): The sheet to stamp.
+            start_row (int): The first row to stamp.
+            num_rows (int): The number of rows to stamp.
+        """
+        sheet_cells = sheet._cells
+        for row in range(start_row, start_row + num_rows):
+            row_number = str(row)
+            for column, style_array, value, formula_parts in self.cells:
+                cell = sheet_cells.get((row, column))
+                if cell is None:
+                    cell = Cell(sheet, row=row, column=column, style_array=style_array)
+                    sheet_cells[(row, column)] = cell
+                elif style_array is not None:
+                    if not cell._style:
+                        cell._style = StyleArray()
+                    cell._style[STAMPED_STYLE_IDS] = style_array[STAMPED_STYLE_IDS]
+
+                if formula_parts is not None:
+                    cell._value = row_number.join(formula_parts)
+                    cell.data_type = 'f'
+                elif value is not None:
+                    cell.value = value
+
+            sheet.row_dimensions[row].height = self.height
+
+def copy_formatting(employee_sheet, START__ROW, num_rows_to_add, source_cell_n, prototype=None):
     """
     Copy the formatting (styles, formulas, row height) from a source row to a set of target rows.
 
+    The source row is captured once as a `RowPrototype` and stamped onto the target rows.
+
     Args:
         employee_sheet (Worksheet): The worksheet where the formatting will be applied.
         START__ROW (int): The starting row to begin copying formatting from.
         num_rows_to_add (int): The number of rows that will receive the copied formatting.
         source_cell_n (int): The source row that contains the original formatting to copy.
+        prototype (RowPrototype): Optional prototype of the source row (e.g. from the template manifest).
+            Captured from `source_cell_n` when not given.
 
     Returns:
         None
@@ -484,17 +1366,12 @@ def copy_formatting(employee_sheet, START__ROW, num_rows_to_add, source_cell_n):
     """
     # Note: Data validation ranges are automatically adjusted by Excel when rows are inserted
     # We don't need to manually adjust them as Excel handles this automatically
-    
-    for row_idx in range(START__ROW, START__ROW + num_rows_to_add):
-        for col_idx in range(1, employee_sheet.max_column + 1):
-            try:
-                col_letter = get_column_letter(col_idx)
-                source_cell = employee_sheet[f"{col_letter}{source_cell_n}"]
-                target_cell = employee_sheet[f"{col_letter}{row_idx}"]
-                copy_cell_style_and_formula(source_cell, target_cell, row_idx)
-                employee_sheet.row_dimensions[row_idx].height = employee_sheet.row_dimensions[source_cell_n].height
-            except Exception as e:
-                print(f"Error while copying cell formatting and formulas: {e}")
+    try:
+        if prototype is None:
+            prototype = RowPrototype.from_row(employee_sheet, source_cell_n)
+        prototype.stamp(employee_sheet, START__ROW, num_rows_to_add)
+    except Exception as e:
+        logger.error("Error while copying cell formatting and formulas: %s", e)
 
 def reset_row_heights(sheet, reference_row, target_rows, hide_reference_row=False):
     """
@@ -543,10 +1420,40 @@ def unmerge_cells_in_range(sheet, start_row, end_row):
                 sheet.unmerge_cells(str(merged_range))
         except Exception as e:
             import traceback
-            print(f"Error in unmerge_cells_in_range: {e}")
+            logger.error("Error in unmerge_cells_in_range: %s", e)
             traceback.print_exc()
     return merged_cells_to_restore
 
+def unmerge_manifest_ranges(sheet, merges):
+    """
+    Unmerge the merged ranges listed in a template manifest and store their boundaries, styles, and row heights.
+
+    This is the manifest counterpart of `unmerge_cells_in_range`: the ranges and their row heights
+    were collected when the template was compiled, so the sheet is not scanned.
+
+    Args:
+        sheet (Worksheet): The sheet object where the unmerging will take place.
+        merges (list): The `merges` entries of a manifest table or header ({"range", "row_height"}).
+
+    Sheets written by the streaming writer (`xlsx_stream.SheetPatch`) accept values in merged
+    cells as they are, so nothing is unmerged there and nothing needs restoring.
+
+    Returns:
+        list: A list of tuples representing the original merged cell boundaries, styles, and row heights.
+    """
+    if not isinstance(sheet, Worksheet):
+        return []
+
+    merged_cells_to_restore = []
+    for merge in merges:
+        min_col, min_row, max_col, max_row = range_boundaries(merge["range"])
+        source_cell = sheet.cell(row=min_row, column=min_col)
+        merged_cells_to_restore.append(
+            (min_col, min_row, max_col, max_row, source_cell.alignment, merge["row_height"])
+        )
+        sheet.unmerge_cells(merge["range"])
+    return merged_cells_to_restore
+
 def reapply_merged_cells(sheet, merged_cells_to_restore, num_rows_to_add):
     """
     Reapply merged cells and restore their alignment and row heights after rows have been added.
@@ -578,7 +1485,7 @@ def reapply_merged_cells(sheet, merged_cells_to_restore, num_rows_to_add):
             # Reapply the row height to the adjusted minimum row
             sheet.row_dimensions[adjusted_min_row].height = row_height
         except Exception as e:
-            print(f"Error while reapplying merged cells: {e}")
+            logger.error("Error while reapplying merged cells: %s", e)
 
 def validate_columns(data, required_columns):
     """
@@ -596,10 +1503,79 @@ def validate_columns(data, required_columns):
         raise KeyError(f"Missing required columns: {', '.join(missing_columns)}")
 
 
+def _same_conditional_rule(rule, other):
+    """Check whether two conditional formatting rules format cells the same way (ignoring their priority)."""
+    return (
+        rule.type == other.type
+        and rule.operator == other.operator
+        and list(rule.formula) == list(other.formula)
+        and bool(rule.stopIfTrue) == bool(other.stopIfTrue)
+        and rule.dxf == other.dxf
+    )
+
+def _coalesce_cell_ranges(cell_ranges):
+    """Merge ranges that span the same columns and touch or overlap vertically (e.g. A15:AO20 and A21:AO30)."""
+    merged = []
+    for cell_range in sorted(cell_ranges, key=lambda r: (r.min_col, r.max_col, r.min_row)):
+        last = merged[-1] if merged else None
+        if last and (last.min_col, last.max_col) == (cell_range.min_col, cell_range.max_col) and cell_range.min_row <= last.max_row + 1:
+            last.expand(down=max(0, cell_range.max_row - last.max_row))
+        else:
+            merged.append(CellRange(cell_range.coord))
+    return merged
+
+def add_conditional_formatting_ranges(sheet, cell_ranges, rule):
+    """
+    Apply a conditional formatting rule to a set of ranges, as a single rule.
+
+    If the sheet already has an equal rule on its own (e.g. from an earlier call), the ranges are
+    added to that rule instead, so repeated calls do not multiply the rules.
+
+    Args:
+        sheet (Worksheet): The sheet to which conditional formatting will be applied.
+        cell_ranges (list): The ranges to format (e.g. ["A15:AO3014"]).
+        rule (Rule): The rule to apply (e.g. a CellIsRule).
+    """
+    conditional_formatting = sheet.conditional_formatting
+    ranges = [CellRange(cell_range) for cell_range in cell_ranges]
+
+    # openpyxl keys the rules by their ranges, so a merged rule is removed and added back under its new ranges
+    for existing, rules in list(conditional_formatting._cf_rules.items()):
+        if len(rules) == 1 and _same_conditional_rule(rules[0], rule):
+            del conditional_formatting._cf_rules[existing]
+            ranges = _coalesce_cell_ranges(list(existing.sqref.ranges) + ranges)
+            merged = ConditionalFormatting(sqref=" ".join(cell_range.coord for cell_range in ranges))
+            conditional_formatting._cf_rules[merged] = rules
+            return
+
+    conditional_formatting.add(" ".join(cell_range.coord for cell_range in _coalesce_cell_ranges(ranges)), rule)
+
+def column_runs(column_letters):
+    """
+    Group column letters into runs of adjacent columns.
+
+    Args:
+        column_letters (list): Column letters (e.g. ['F', 'G', 'H', 'K']).
+
+    Returns:
+        list: (first, last) column letter pairs (e.g. [('F', 'H'), ('K', 'K')]).
+    """
+    indexes = sorted({column_letter_to_index(column_letter) for column_letter in column_letters})
+    runs = []
+    for index in indexes:
+        if runs and index == runs[-1][1] + 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return [(column_index_to_letter(first), column_index_to_letter(last)) for first, last in runs]
+
 def apply_conditional_formatting_general(employee_sheet, start_row, num_rows_to_add, columns_to_format, legend):
     """
     Apply conditional formatting to specific columns and rows to highlight empty cells and 'r' values.
 
+    The formatting is expressed as one rule over the adjacent column ranges (e.g. A15:AO3014) and one
+    rule over the legend column, merged with the rules of earlier calls, instead of one rule per cell.
+
     Args:
         employee_sheet (openpyxl.worksheet.worksheet.Worksheet): The sheet to which conditional formatting will be applied.
         start_row (int): The starting row number for formatting.
@@ -607,18 +1583,21 @@ def apply_conditional_formatting_general(employee_sheet, start_row, num_rows_to_
         columns_to_format (list): The list of columns (letters) to apply formatting to.
         legend (str): The legend column (e.g., 'L') to apply specific formatting for 'r' values.
     """
-    red_fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-    red_fill_legend = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+    if num_rows_to_add <= 0:
+        return
 
-    for row_idx in range(start_row, start_row + num_rows_to_add):
-        for col_letter in columns_to_format:
-            cell_range = f"{col_letter}{row_idx}"
+    with span("format", rows=num_rows_to_add, cells=num_rows_to_add * (len(columns_to_format) + 1)):
+        red_fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
+        red_fill_legend = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+        end_row = start_row + num_rows_to_add - 1
+
+        if columns_to_format:
+            cell_ranges = [f"{first}{start_row}:{last}{end_row}" for first, last in column_runs(columns_to_format)]
             rule_empty = CellIsRule(operator="equal", formula=['""'], stopIfTrue=True, fill=red_fill)
-            employee_sheet.conditional_formatting.add(cell_range, rule_empty)
+            add_conditional_formatting_ranges(employee_sheet, cell_ranges, rule_empty)
 
-        cell_range_legend = f"{legend}{row_idx}"
         rule_r = CellIsRule(operator="equal", formula=['"r"'], stopIfTrue=True, fill=red_fill_legend)
-        employee_sheet.conditional_formatting.add(cell_range_legend, rule_r)
+        add_conditional_formatting_ranges(employee_sheet, [f"{legend}{start_row}:{legend}{end_row}"], rule_r)
 
 
 def column_letter_to_index(column_letter):
@@ -663,7 +1642,8 @@ def save_working_paper(working_paper_wb, processed_file_path):
         working_paper_wb (openpyxl.workbook.workbook.Workbook): The workbook object to save.
         processed_file_path (str): The file path where the workbook should be saved.
     """
-    working_paper_wb.save(processed_file_path)
+    with span("save"):
+        working_paper_wb.save(processed_file_path)
 
 
 def get_unique_id_count(datasheet, column_name="IDNUMBER"):
@@ -671,7 +1651,7 @@ def get_unique_id_count(datasheet, column_name="IDNUMBER"):
     Counts the number of unique ID numbers in the specified column of the datasheet.
 
     Args:
-        datasheet (pd.DataFrame): The input datasheet as a Pandas DataFrame.
+        datasheet (pd.DataFrame | Worksheet): The filtered data, or the data sheet to convert.
         column_name (str): The name of the column to analyze for unique ID numbers.
 
     Returns:
@@ -680,7 +1660,8 @@ def get_unique_id_count(datasheet, column_name="IDNUMBER"):
     Raises:
         ValueError: If the column does not exist in the datasheet.
     """
-    datasheet = convert_to_dataframe(datasheet)
+    if not isinstance(datasheet, pd.DataFrame):
+        datasheet = convert_to_dataframe(datasheet)
     if column_name not in datasheet.columns:
         raise ValueError(f"Column '{column_name}' not found in the datasheet.")
     
@@ -693,7 +1674,7 @@ def get_bank_pay_amount_sum(datasheet):
     Returns the sum of the 'BANK_PAY_AMOUNT' column in the specified datasheet, rounded to 2 decimal points.
 
     Args:
-        datasheet (pd.DataFrame): The input datasheet as a Pandas DataFrame.
+        datasheet (pd.DataFrame | Worksheet): The filtered data, or the data sheet to convert.
 
     Returns:
         float: The sum of the 'BANK_PAY_AMOUNT' column, rounded to 2 decimal points.
@@ -701,7 +1682,8 @@ def get_bank_pay_amount_sum(datasheet):
     Raises:
         ValueError: If the 'BANK_PAY_AMOUNT' column is missing from the datasheet.
     """
-    datasheet = convert_to_dataframe(datasheet)
+    if not isinstance(datasheet, pd.DataFrame):
+        datasheet = convert_to_dataframe(datasheet)
     if 'BANK_PAY_AMOUNT' not in datasheet.columns:
         raise ValueError("Column 'BANK_PAY_AMOUNT' not found in the datasheet.")
     
@@ -714,7 +1696,7 @@ def get_company_info(data_file_path):
     Extracts company information from the given data file.
 
     Args:
-        data_file_path (str): The file path to the data file.
+        data_file_path (str | DataFileContext): The file path to the data file, or an already parsed context.
 
     Returns:
         tuple: A tuple containing the following information:
@@ -724,15 +1706,7 @@ def get_company_info(data_file_path):
             - number_of_employees (int): The number of employees.
             - total_amount_claimed (float): The total amount claimed by the company.
     """
-    data_wb, data_sheet = load_data_file(data_file_path)
-    convert_to_dataframe(data_sheet)
-    headings = get_column_indexes(data_sheet)
-    company_name, uif_ref = extract_tradename_uif(data_sheet, headings)
-    periods_claimed = extract_shutdown_periods(data_sheet, headings)
-    number_of_employees = get_unique_id_count(data_sheet)
-    total_amount_claimed = get_bank_pay_amount_sum(data_sheet)
-    
-    return company_name, uif_ref, periods_claimed, number_of_employees, total_amount_claimed
+    return ensure_data_file_context(data_file_path).company_info
 
 def update_formulas_after_row_insertion(sheet, insert_start_row, num_rows_added):
     """
@@ -756,7 +1730,7 @@ def update_formulas_after_row_insertion(sheet, insert_start_row, num_rows_added)
                     if updated_formula != formula:
                         cell.value = updated_formula
     except Exception as e:
-        print(f"Error updating formulas after row insertion: {e}")
+        logger.error("Error updating formulas after row insertion: %s", e)
 
 def adjust_formula_references(formula, insert_start_row, num_rows_added):
     """
@@ -791,7 +1765,7 @@ def adjust_formula_references(formula, insert_start_row, num_rows_added):
         return updated_formula
     
     except Exception as e:
-        print(f"Error adjusting formula references: {e}")
+        logger.error("Error adjusting formula references: %s", e)
         return formula
 
 def adjust_single_cell_reference(cell_ref, insert_start_row, num_rows_added):
@@ -849,7 +1823,7 @@ def adjust_single_cell_reference(cell_ref, insert_start_row, num_rows_added):
             return cell_ref
     
     except Exception as e:
-        print(f"Error adjusting single cell reference: {e}")
+        logger.error("Error adjusting single cell reference: %s", e)
         return cell_ref
 
 
@@ -915,8 +1889,7 @@ def get_working_paper_path_for_all_processing(audit_working_papers_folder, trade
 
     # Create folder path within the AUDIT WORKING PAPERS folder
     tp_x_folder = os.path.join(audit_working_papers_folder, folder_name)
-    if not os.path.exists(tp_x_folder):
-        os.makedirs(tp_x_folder)
+    os.makedirs(tp_x_folder, exist_ok=True)
 
     # Create the processed file path
     processed_file_path = os.path.join(tp_x_folder, file_name)
@@ -0,0 +1,110 @@
+#log_utils.py
+import itertools
+import logging
+import os
+import sys
+import threading
+
+# Environment variables configuring the log output
+LOG_LEVEL_ENV = "AUDITFLOW_LOG_LEVEL"
+LOG_SAMPLE_ENV = "AUDITFLOW_LOG_SAMPLE"
+DEFAULT_LOG_LEVEL = "INFO"
+
+# Every module logs under this logger, e.g. "auditflow.tp_3_2"
+ROOT_LOGGER_NAME = "auditflow"
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s [%(processName)s] %(name)s: %(message)s"
+
+_configure_lock = threading.Lock()
+
+
+def get_logger(name):
+    """
+    Return the logger of a module.
+
+    Args:
+        name (str): The module name (`__name__`).
+
+    Returns:
+        logging.Logger: The "auditflow.<name>" logger.
+    """
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def parse_log_level(level):
+    """
+    Convert a level name (e.g. "debug") or number to a logging level.
+
+    Raises:
+        ValueError: If `level` is not a known level name.
+    """
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).strip().upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def configure_logging(level=None):
+    """
+    Send the log records of every module to stderr, at `level` and above.
+
+    Safe to call more than once (e.g. on every Streamlit rerun): the handler is only added once,
+    later calls only change the level. Without this call, warnings and errors still reach stderr
+    through Python's last resort handler, and debug messages are dropped.
+
+    Args:
+        level (str | int): The minimum level. Defaults to `AUDITFLOW_LOG_LEVEL`, or INFO.
+
+    Returns:
+        int: The level set.
+    """
+    level = parse_log_level(level or os.environ.get(LOG_LEVEL_ENV) or DEFAULT_LOG_LEVEL)
+    logger = logging.getLogger(ROOT_LOGGER_NAME)
+    with _configure_lock:
+        logger.setLevel(level)
+        if not any(getattr(handler, "_auditflow_handler", False) for handler in logger.handlers):
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            handler._auditflow_handler = True
+            logger.addHandler(handler)
+            # Host applications (e.g. Streamlit) may log the root logger too, don't print records twice
+            logger.propagate = False
+    return level
+
+
+def configured_log_level():
+    """Return the level set by `configure_logging`, or None if logging was not configured."""
+    level = logging.getLogger(ROOT_LOGGER_NAME).level
+    return level or None
+
+
+def debug_sampler(logger, every=None):
+    """
+    Return a gate for the debug messages of a hot loop (one message per row or per cell).
+
+    The gate is None when the logger does not log DEBUG, so the loop only pays for a None check:
+
+        sample = debug_sampler(logger)
+        for row in rows:
+            if sample is not None and sample():
+                logger.debug("Row %s: %s", row.index, row.value)
+
+    In debug mode the gate lets one message in `every` through, so a large file can be debugged
+    without logging every row.
+
+    Args:
+        logger (logging.Logger): The logger the messages go to.
+        every (int): Log one message in this many. Defaults to `AUDITFLOW_LOG_SAMPLE`, or 1 (all).
+
+    Returns:
+        callable: A function returning whether to log the next message, or None.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return None
+    every = every or int(os.environ.get(LOG_SAMPLE_ENV) or 1)
+    if every <= 1:
+        return lambda: True
+    counter = itertools.count()
+    return lambda: next(counter) % every == 0
@@ -0,0 +1,273 @@
+#memory_monitor.py
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from log_utils import get_logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = get_logger(__name__)
+
+# Environment variables configuring the memory accounting of the stage traces and the memory ceiling
+MEMORY_TRACE_ENV = "AUDITFLOW_TRACE_MEMORY"
+MEMORY_CEILING_MB_ENV = "AUDITFLOW_MEMORY_CEILING_MB"
+
+# The values of AUDITFLOW_TRACE_MEMORY: RSS only, or RSS and Python allocations (tracemalloc)
+MEMORY_TRACE_RSS = "rss"
+MEMORY_TRACE_FULL = "full"
+
+# Seconds between two RSS samples while memory accounting is on
+RSS_SAMPLE_INTERVAL = 0.02
+
+# Allocation sites logged when a job is aborted with tracemalloc running
+TOP_ALLOCATIONS = 10
+
+MB = 1024 * 1024
+
+
+class MemoryCeilingExceeded(BaseException):
+    """
+    Raised when the RSS of the process goes over the memory ceiling (`AUDITFLOW_MEMORY_CEILING_MB`).
+
+    Derives from BaseException, like KeyboardInterrupt: the TP functions re-raise what they catch,
+    but the helpers they call (the per-row loops of TP2.1, TP2.2 and TP3.3, the formula and merge
+    helpers, the data file cache) still log every Exception and carry on, which would turn the abort
+    into a partial working paper. `batch.process_file` catches it and reports the file as failed;
+    `finally` clauses and `with` blocks still clean up.
+    """
+
+
+def current_rss_bytes():
+    """
+    Return the resident set size of this process.
+
+    Returns:
+        int: The RSS in bytes (the peak RSS where the current one cannot be read), or None on
+        platforms without either.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+def memory_trace_mode():
+    """
+    Return the memory accounting mode set by `AUDITFLOW_TRACE_MEMORY`.
+
+    "rss" (or "1") samples the RSS of the process, "full" also traces Python allocations with
+    tracemalloc, which makes Python code noticeably slower. Anything else ("", "0") turns it off.
+
+    Returns:
+        str: `MEMORY_TRACE_RSS`, `MEMORY_TRACE_FULL` or None.
+    """
+    value = (os.environ.get(MEMORY_TRACE_ENV) or "").strip().lower()
+    if value in ("1", "true", "yes", MEMORY_TRACE_RSS):
+        return MEMORY_TRACE_RSS
+    if value in (MEMORY_TRACE_FULL, "python", "tracemalloc"):
+        return MEMORY_TRACE_FULL
+    return None
+
+
+def memory_ceiling_bytes():
+    """Return the memory ceiling set by `AUDITFLOW_MEMORY_CEILING_MB` in bytes, or None (no ceiling)."""
+    value = os.environ.get(MEMORY_CEILING_MB_ENV)
+    if not value:
+        return None
+    return int(float(value) * MB) or None
+
+
+def check_memory_ceiling(stage=None):
+    """
+    Abort the job if the RSS of this process is over the memory ceiling.
+
+    Called at every stage boundary of a traced job (see `stage_trace.span`) and every few thousand
+    rows while a data file is converted, so an oversized job stops with a clear message rather
+    than being killed by the host. The ceiling applies to each process on its own: with N batch
+    workers on one host, set it below 1/N of the memory available.
+
+    Args:
+        stage (str): The stage running, named in the message.
+
+    Raises:
+        MemoryCeilingExceeded: If the RSS is over the ceiling.
+    """
+    ceiling = memory_ceiling_bytes()
+    if ceiling is None:
+        return
+    rss = current_rss_bytes()
+    if rss is None or rss <= ceiling:
+        return
+    where = f" during {stage}" if stage else ""
+    message = (
+        f"Memory ceiling exceeded{where}: RSS {rss / MB:,.0f} MB > {ceiling / MB:,.0f} MB "
+        f"({MEMORY_CEILING_MB_ENV}), job aborted"
+    )
+    _log_top_allocations(message)
+    raise MemoryCeilingExceeded(message)
+
+
+def _log_top_allocations(message):
+    """Log the allocation sites holding the most memory, when tracemalloc is running."""
+    if not tracemalloc.is_tracing():
+        logger.error("%s", message)
+        return
+    statistics = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+    logger.error(
+        "%s. Largest Python allocations:\n%s",
+        message, "\n".join(f"  {stat.size / MB:,.1f} MB in {stat.count} blocks - {stat.traceback}" for stat in statistics)
+    )
+
+
+class _RssSampler(threading.Thread):
+    """Samples the RSS of the process in the background, keeping the highest value since the last reset."""
+
+    def __init__(self):
+        super().__init__(name="rss-sampler", daemon=True)
+        self._lock = threading.Lock()
+        self._peak = current_rss_bytes() or 0
+
+    def run(self):
+        while True:
+            time.sleep(RSS_SAMPLE_INTERVAL)
+            rss = current_rss_bytes() or 0
+            with self._lock:
+                if rss > self._peak:
+                    self._peak = rss
+
+    def peak(self):
+        """Return the highest RSS sampled since the last reset, including the current one."""
+        rss = current_rss_bytes() or 0
+        with self._lock:
+            self._peak = max(self._peak, rss)
+            return self._peak
+
+    def reset(self):
+        """Start a new high-water mark from the current RSS."""
+        rss = current_rss_bytes() or 0
+        with self._lock:
+            self._peak = rss
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = _RssSampler()
+            _sampler.start()
+        return _sampler
+
+
+class MemoryWindow:
+    """
+    The memory used by a section of code: RSS at its start and end, and the RSS and Python heap
+    high-water marks in between.
+
+    The high-water marks of the process (the RSS sampler's and tracemalloc's peak) are reset when
+    a window opens; a window opened inside another one passes its peaks on to the outer window
+    when it closes (see `open_window` and `close_window`). They are process-wide: sections running
+    in other threads at the same time are counted in.
+
+    Args:
+        python (bool): Also record the Python heap (tracemalloc must be running).
+    """
+
+    def __init__(self, python=False):
+        self.rss_start = current_rss_bytes() or 0
+        self.rss_end = None
+        self.rss_peak = self.rss_start
+        self.py_start = self.py_peak = None
+        if python and tracemalloc.is_tracing():
+            self.py_start = self.py_peak = tracemalloc.get_traced_memory()[0]
+
+    def _fold_peaks(self):
+        """Take the high-water marks reached since the last reset into the window."""
+        self.rss_peak = max(self.rss_peak, _get_sampler().peak())
+        if self.py_peak is not None and tracemalloc.is_tracing():
+            self.py_peak = max(self.py_peak, tracemalloc.get_traced_memory()[1])
+
+    def _absorb(self, inner):
+        """Take the peaks of a window closed inside this one."""
+        self.rss_peak = max(self.rss_peak, inner.rss_peak)
+        if self.py_peak is not None and inner.py_peak is not None:
+            self.py_peak = max(self.py_peak, inner.py_peak)
+
+    def as_dict(self):
+        """
+        Return the window in MB.
+
+        Returns:
+            dict: "rss_peak_mb" and "rss_end_mb", "rss_growth_mb" (end minus start), and with
+            tracemalloc "py_peak_mb" (Python heap high-water mark) and "py_growth_mb" (the part of
+            it allocated inside the window).
+        """
+        record = {
+            "rss_peak_mb": _mb(self.rss_peak),
+            "rss_end_mb": _mb(self.rss_end or 0),
+            "rss_growth_mb": _mb((self.rss_end or 0) - self.rss_start),
+        }
+        if self.py_peak is not None:
+            record["py_peak_mb"] = _mb(self.py_peak)
+            record["py_growth_mb"] = _mb(self.py_peak - self.py_start)
+        return record
+
+
+def _mb(value):
+    return round(value / MB, 1)
+
+
+def open_window(outer=None, mode=None):
+    """
+    Start recording the memory of a section of code.
+
+    Args:
+        outer (MemoryWindow): The window the section runs in, if any.
+        mode (str): The accounting mode when there is no outer window. Defaults to `memory_trace_mode()`.
+
+    Returns:
+        MemoryWindow: The window, or None when memory accounting is off.
+    """
+    if outer is not None:
+        python = outer.py_peak is not None
+        outer._fold_peaks()
+    else:
+        mode = mode or memory_trace_mode()
+        if mode is None:
+            return None
+        python = mode == MEMORY_TRACE_FULL
+        if python and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    _get_sampler().reset()
+    if python and tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    return MemoryWindow(python)
+
+
+def close_window(window, outer=None):
+    """
+    Stop recording the memory of a section of code opened with `open_window`.
+
+    Args:
+        window (MemoryWindow): The window to close.
+        outer (MemoryWindow): The window the section runs in, if any, which takes over its peaks.
+    """
+    window._fold_peaks()
+    window.rss_end = current_rss_bytes() or 0
+    if outer is not None:
+        outer._absorb(window)
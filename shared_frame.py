@@ -0,0 +1,198 @@
+#shared_frame.py
+import pickle
+import threading
+from contextlib import nullcontext
+from multiprocessing import shared_memory
+
+import pandas as pd
+
+from helper_funcs import DataFileContext
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is installed with streamlit; without it contexts are pickled to workers instead
+    pa = None
+
+# Shared memory blocks attached by this (worker) process, by name (see `attach_data_file_context`)
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+class _AttachedBlock(shared_memory.SharedMemory):
+    """A shared memory block attached by a worker, never closed behind the back of the DataFrames built on it."""
+
+    def __del__(self):
+        # At interpreter exit the block can go before the DataFrames viewing it, the mapping goes with the process
+        pass
+
+
+class SharedDataFileContext:
+    """
+    A `DataFileContext` exported once into shared memory for worker processes.
+
+    The filtered DataFrame is written column by column as an Arrow IPC stream into a
+    `multiprocessing.shared_memory` block. Pickling the export only sends the block name and a small
+    schema header (column names and dtypes, company details), so the cost of handing it to a task
+    does not depend on the size of the data. Unpickling it in a worker attaches to the block and
+    returns a `DataFileContext` whose DataFrame is a read-only, zero-copy view of it.
+
+    Object columns that would not come back unchanged from Arrow (e.g. date columns mixing text and
+    Excel dates) are pickled once, after the Arrow stream in the same block; the header only holds
+    where they are.
+
+    The exporting process owns the block: use the export as a context manager, the block is
+    unlinked on exit.
+
+    Args:
+        context (DataFileContext): The parsed data file to export.
+    """
+
+    def __init__(self, context):
+        data = context.data
+        names, arrays, object_columns = [], [], {}
+        for position, column in enumerate(data.columns):
+            series = data.iloc[:, position]
+            if series.dtype == object and not _round_trips_through_arrow(series):
+                object_columns[position] = series.tolist()
+                continue
+            names.append(str(position))
+            arrays.append(pa.Array.from_pandas(series))
+        names.append("index")
+        arrays.append(pa.Array.from_pandas(data.index.to_series()))
+        table = pa.Table.from_arrays(arrays, names=names)
+
+        # Size the stream first so it is written straight into the shared memory block
+        mock = pa.MockOutputStream()
+        with pa.ipc.new_stream(mock, table.schema) as writer:
+            writer.write_table(table)
+        stream_size = mock.size()
+        pickled_columns = pickle.dumps(object_columns, protocol=pickle.HIGHEST_PROTOCOL) if object_columns else b""
+
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(stream_size + len(pickled_columns), 1))
+        try:
+            with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(self.shared_memory.buf)), table.schema) as writer:
+                writer.write_table(table)
+            self.shared_memory.buf[stream_size:stream_size + len(pickled_columns)] = pickled_columns
+        except Exception:
+            self.close()
+            raise
+
+        self.header = {
+            "columns": list(data.columns),
+            "dtypes": [str(dtype) for dtype in data.dtypes],
+            "object_columns": (stream_size, len(pickled_columns)),  # offset and size in the block
+            "index_name": data.index.name,
+            "data_file_path": context.data_file_path,
+            "headings": context.headings,
+            "tradename": context.tradename,
+            "uif_reference": context.uif_reference,
+            "periods_claimed": context.periods_claimed,
+        }
+
+    @property
+    def name(self):
+        """str: The name of the shared memory block."""
+        return self.shared_memory.name
+
+    def __reduce__(self):
+        return (attach_data_file_context, (self.name, self.header))
+
+    def close(self):
+        """Release and unlink the shared memory block. Workers that are still attached keep their view."""
+        if self.shared_memory is None:
+            return
+        self.shared_memory.close()
+        try:
+            self.shared_memory.unlink()
+        except FileNotFoundError:
+            pass
+        self.shared_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _round_trips_through_arrow(series):
+    """Return True if an object column comes back unchanged from an Arrow column (all None, or strings without None)."""
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    return inferred == "empty" or (inferred == "string" and not series.isna().any())
+
+
+def share_data_file_context(context):
+    """
+    Export a `DataFileContext` for worker processes.
+
+    Args:
+        context (DataFileContext): The parsed data file.
+
+    Returns:
+        A context manager yielding the object to send to the workers: a `SharedDataFileContext`,
+        or `context` itself when pyarrow is not installed.
+    """
+    if pa is None:
+        return nullcontext(context)
+    return SharedDataFileContext(context)
+
+
+def attach_data_file_context(name, header):
+    """
+    Attach to a `SharedDataFileContext` exported by another process.
+
+    The block stays mapped in this process for as long as a DataFrame built on it is alive; blocks
+    no longer in use are released on the next attach.
+
+    Args:
+        name (str): The name of the shared memory block.
+        header (dict): The schema header of the export.
+
+    Returns:
+        DataFileContext: The data file, with a read-only DataFrame backed by the shared memory block.
+    """
+    with _attached_lock:
+        for attached_name in list(_attached):
+            if attached_name == name:
+                continue
+            try:
+                _attached[attached_name].close()
+            except BufferError:
+                # A DataFrame built on this block is still in use
+                continue
+            del _attached[attached_name]
+        block = _attached.get(name)
+        if block is None:
+            block = _attached[name] = _AttachedBlock(name=name)
+
+    table = pa.ipc.open_stream(pa.py_buffer(block.buf)).read_all()
+    offset, size = header["object_columns"]
+    object_columns = {}
+    if size:
+        with block.buf[offset:offset + size] as pickled_columns:
+            object_columns = pickle.loads(pickled_columns)
+    data = table.drop_columns(["index"]).to_pandas(split_blocks=True)
+    index = table.column("index").to_pandas()
+
+    # Put the Arrow columns and the pickled object columns back in their original order
+    columns = header["columns"]
+    arrow_positions = [int(position) for position in data.columns]
+    data.columns = arrow_positions
+    for position, values in object_columns.items():
+        data[position] = pd.Series(values, dtype=object, index=data.index)
+    data = data[list(range(len(columns)))]
+    data.columns = columns
+    data.index = pd.Index(index.array, name=header["index_name"])
+
+    for position in arrow_positions:
+        if str(data.dtypes.iloc[position]) != header["dtypes"][position]:
+            data.isetitem(position, data.iloc[:, position].astype(header["dtypes"][position]))
+
+    return DataFileContext(
+        header["data_file_path"],
+        data,
+        header["headings"],
+        header["tradename"],
+        header["uif_reference"],
+        header["periods_claimed"],
+    )
@@ -0,0 +1,303 @@
+#stage_trace.py
+import contextvars
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from file_utils import set_default_file_mode
+from memory_monitor import check_memory_ceiling, close_window, open_window
+
+# The stages a working paper goes through, in pipeline order. Spans with other names (e.g. "TP.1")
+# only group the stage spans below them.
+STAGES = ["load", "convert", "aggregate", "insert", "format", "populate", "save", "folders"]
+
+# The span the stage spans opened in this thread (or task) are recorded under, None when not tracing
+_current_span = contextvars.ContextVar("stage_trace_span", default=None)
+
+
+class Span:
+    """
+    A timed section of a job: wall and CPU time, row/cell counts and the spans opened inside it.
+    With memory accounting on (see `memory_monitor`), also its RSS and Python heap high-water marks.
+
+    Spans are plain objects, so the span recorded by a task in a worker process (see `traced_call`)
+    is pickled back to the caller and added to its trace.
+
+    Args:
+        name (str): A stage name (see `STAGES`) or the name of a group of stages (e.g. "TP.1").
+        **counts: Initial counts (e.g. rows=120).
+    """
+
+    def __init__(self, name, **counts):
+        self.name = name
+        self.counts = dict(counts)
+        self.children = []
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.memory = None
+
+    def count(self, **counts):
+        """Add to the counts of the span (e.g. `span.count(cells=840)`)."""
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    @property
+    def self_wall(self):
+        """float: The wall time not spent in child spans."""
+        return self.wall - sum(child.wall for child in self.children)
+
+    @property
+    def self_cpu(self):
+        """float: The CPU time not spent in child spans."""
+        return self.cpu - sum(child.cpu for child in self.children)
+
+    def stage_totals(self):
+        """
+        Add up the time and counts of the stage spans below this span, per stage.
+
+        Each stage gets the time of its spans minus the time of the stage spans nested in them, so
+        a span that opens another stage (or the same stage again, e.g. an aggregate built from
+        another one) is not counted twice. Counts are only taken from the outermost span of a stage.
+        With memory accounting on, a stage gets the highest peaks of its spans.
+
+        Returns:
+            dict: stage -> {"wall", "cpu", counts..., memory peaks...}, in `STAGES` order.
+        """
+        totals = {}
+
+        def visit(span, inside):
+            if span.name in STAGES:
+                total = totals.setdefault(span.name, {"wall": 0.0, "cpu": 0.0})
+                total["wall"] += span.self_wall
+                total["cpu"] += span.self_cpu
+                if span.name not in inside:
+                    for key, value in span.counts.items():
+                        total[key] = total.get(key, 0) + value
+                if span.memory is not None:
+                    for key, value in span.memory.as_dict().items():
+                        if key.endswith("_peak_mb"):
+                            total[key] = max(total.get(key, 0.0), value)
+                inside = inside | {span.name}
+            for child in span.children:
+                visit(child, inside)
+
+        for child in self.children:
+            visit(child, frozenset())
+        return {stage: _rounded(totals[stage]) for stage in STAGES if stage in totals}
+
+    def as_dict(self):
+        """Return the span and its children as JSON-serializable dicts."""
+        record = {"name": self.name, "wall": round(self.wall, 6), "cpu": round(self.cpu, 6)}
+        if self.counts:
+            record["counts"] = dict(self.counts)
+        if self.memory is not None:
+            record["memory"] = self.memory.as_dict()
+        if self.children:
+            record["children"] = [child.as_dict() for child in self.children]
+        return record
+
+
+class _NullSpan:
+    """Stands in for a span when no trace is active."""
+
+    def count(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _rounded(values):
+    return {key: round(value, 6) if isinstance(value, float) else value for key, value in values.items()}
+
+
+def _run_in_span(span, fn, args):
+    span.memory = open_window()
+    token = _current_span.set(span)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        return fn(*args)
+    finally:
+        span.wall += time.perf_counter() - wall
+        span.cpu += time.thread_time() - cpu
+        if span.memory is not None:
+            close_window(span.memory)
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name, **counts):
+    """
+    Time the body of the `with` block as a stage span of the active trace.
+
+    Without an active trace (see `StageTrace`), nothing is recorded and the cost is a context
+    variable lookup. In a trace, the memory ceiling is checked when the span opens and closes (see
+    `memory_monitor.check_memory_ceiling`).
+
+    Args:
+        name (str): The stage (see `STAGES`) or group name.
+        **counts: Row/cell counts known up front; more can be added with the yielded span's `count`.
+
+    Yields:
+        Span: The span, or a stand-in accepting `count` calls when not tracing.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield _NULL_SPAN
+        return
+
+    check_memory_ceiling(name)
+    child = Span(name, **counts)
+    parent.children.append(child)
+    if parent.memory is not None:
+        child.memory = open_window(parent.memory)
+    token = _current_span.set(child)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield child
+    finally:
+        child.wall += time.perf_counter() - wall
+        child.cpu += time.thread_time() - cpu
+        if child.memory is not None:
+            close_window(child.memory, parent.memory)
+        _current_span.reset(token)
+    check_memory_ceiling(name)
+
+
+def traced_call(name, fn, *args):
+    """
+    Call `fn(*args)` in a new span, whether or not a trace is active.
+
+    Used for tasks run in worker processes, which have no trace of their own: the caller adds the
+    returned span to its trace with `add_span`.
+
+    Args:
+        name (str): Name of the span (e.g. "TP.3").
+        fn (callable): The function to call.
+
+    Returns:
+        tuple: `(result, span)`.
+    """
+    task_span = Span(name)
+    result = _run_in_span(task_span, fn, args)
+    return result, task_span
+
+
+def add_span(recorded_span):
+    """Add a span recorded elsewhere (see `traced_call`) to the active trace, if any."""
+    parent = _current_span.get()
+    if parent is not None:
+        parent.children.append(recorded_span)
+
+
+class StageTrace(Span):
+    """
+    The stage trace of one data file: the root span of everything recorded while it is active.
+
+    Example:
+        trace = StageTrace("data.xlsx")
+        with trace.activate():
+            ...  # code opening `span(...)`s
+        trace.write(path)
+
+    Args:
+        name (str): Name of the traced job (e.g. the data file name).
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.started = time.time()
+
+    @contextmanager
+    def activate(self):
+        """
+        Record the spans opened in the `with` block (in this thread) into the trace, timing the whole block.
+
+        Memory is accounted for when `AUDITFLOW_TRACE_MEMORY` is set (see `memory_monitor`).
+        """
+        self.memory = open_window()
+        token = _current_span.set(self)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield self
+        finally:
+            self.wall += time.perf_counter() - wall
+            self.cpu += time.thread_time() - cpu
+            if self.memory is not None:
+                close_window(self.memory)
+            _current_span.reset(token)
+
+    def memory_peaks(self):
+        """
+        Return the memory high-water marks of the job, and the stage that reached the highest RSS.
+
+        Working papers generated in worker processes count with the peaks of their own process.
+
+        Returns:
+            dict: "rss_peak_mb", "py_peak_mb" (with tracemalloc) and "peak_stage", or an empty dict
+            when memory was not accounted for.
+        """
+        if self.memory is None:
+            return {}
+        peaks = {key: value for key, value in self.memory.as_dict().items() if key.endswith("_peak_mb")}
+        stages = self.stage_totals()
+        for key in list(peaks):
+            peaks[key] = max([peaks[key]] + [total.get(key, 0.0) for total in stages.values()])
+        peak_stages = [stage for stage in stages if "rss_peak_mb" in stages[stage]]
+        if peak_stages:
+            peaks["peak_stage"] = max(peak_stages, key=lambda stage: stages[stage]["rss_peak_mb"])
+        return peaks
+
+    def stage_seconds(self):
+        """Return the wall seconds spent per stage, in `STAGES` order."""
+        return {stage: total["wall"] for stage, total in self.stage_totals().items()}
+
+    def as_dict(self):
+        """
+        Return the trace as JSON-serializable dicts.
+
+        Returns:
+            dict: The file totals per stage ("stages"), the totals per stage of each group span such
+            as a working paper ("groups"), and the span tree ("spans").
+        """
+        return {
+            "name": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "memory": self.memory_peaks(),
+            "stages": self.stage_totals(),
+            "groups": {
+                child.name: {"wall": round(child.wall, 6), "cpu": round(child.cpu, 6), "stages": child.stage_totals()}
+                for child in self.children if child.name not in STAGES
+            },
+            "spans": [child.as_dict() for child in self.children],
+        }
+
+    def write(self, path, **details):
+        """
+        Write the trace as JSON, replacing the file atomically.
+
+        Args:
+            path (str): The file to write.
+            **details: Extra top-level entries (e.g. the job status).
+        """
+        record = self.as_dict()
+        record.update(details)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=2, default=str)
+            # Readable like the working papers next to it, not only by its owner as mkstemp leaves it
+            set_default_file_mode(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
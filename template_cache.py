@@ -0,0 +1,85 @@
+#template_cache.py
+import copyreg
+import os
+import pickle
+import threading
+
+from openpyxl.worksheet.dimensions import DimensionHolder
+
+from data_cache import file_sha256
+from helper_funcs import parse_working_paper
+
+
+def _rebuild_dimension_holder(worksheet, reference, default_factory, max_outline, dimensions):
+    holder = DimensionHolder(worksheet, reference=reference, default_factory=default_factory)
+    holder.max_outline = max_outline
+    dict.update(holder, dimensions)
+    return holder
+
+
+def _reduce_dimension_holder(holder):
+    return (
+        _rebuild_dimension_holder,
+        (holder.worksheet, holder.reference, holder.default_factory, holder.max_outline, dict(holder)),
+    )
+
+
+# Row and column dimensions are defaultdicts whose pickled form drops the worksheet binding and
+# the factory, so restore them explicitly
+copyreg.pickle(DimensionHolder, _reduce_dimension_holder)
+
+
+class TemplateCache:
+    """
+    In-process cache of parsed working paper templates.
+
+    Each template is parsed and unlocked once per process and kept as a pickled snapshot of the
+    workbook model. Every job gets its own copy by unpickling the snapshot, which is several
+    times cheaper than parsing the xlsx again. Entries are keyed on the template path and its
+    SHA-256 (re-hashed only when the file's size or modification time changes), so an edited
+    template is picked up on the next load.
+    """
+
+    def __init__(self):
+        self._entries = {}  # absolute path -> (digest, pickled workbook)
+        self._lock = threading.Lock()
+
+    def load(self, template_path):
+        """
+        Return an independent, unlocked copy of a template workbook.
+
+        Args:
+            template_path (str): Path to the working paper template.
+
+        Returns:
+            openpyxl.Workbook: A workbook the caller may modify freely.
+        """
+        abs_path = os.path.abspath(template_path)
+        digest = file_sha256(abs_path)
+
+        with self._lock:
+            entry = self._entries.get(abs_path)
+            if entry is None or entry[0] != digest:
+                snapshot = pickle.dumps(parse_working_paper(abs_path), protocol=pickle.HIGHEST_PROTOCOL)
+                entry = (digest, snapshot)
+                self._entries[abs_path] = entry
+
+        return pickle.loads(entry[1])
+
+    def clear(self):
+        """Drop every cached template."""
+        with self._lock:
+            self._entries.clear()
+
+
+_default_template_cache = TemplateCache()
+
+
+def get_template_cache():
+    """
+    Return the process-wide template cache.
+
+    Returns:
+        TemplateCache: The template cache shared by every job in this process.
+    """
+    return _default_template_cache
@@ -0,0 +1,249 @@
+#template_manifest.py
+import json
+import os
+import tempfile
+from datetime import date, datetime, time
+
+from openpyxl.utils import range_boundaries
+
+from data_cache import file_sha256
+from helper_funcs import parse_working_paper
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Bump when the manifest layout or the compiler changes, so cached manifests are rebuilt
+MANIFEST_VERSION = 3
+
+# Folder (next to the templates) holding the compiled manifests
+MANIFEST_DIR_NAME = ".manifests"
+
+# Lead sheet header cells of each working paper (TP.2 has no header block)
+HEADER_CELLS = {
+    1: {"tradename": "B1", "uif_reference": "B2", "periods": "B4", "date": "E3", "consultant": "E1"},
+    3: {"tradename": "B1", "uif_reference": "B2", "periods": "B4", "date": "E3", "consultant": "E1"},
+    4: {"tradename": "B1", "uif_reference": "B2", "periods": "B4", "date": "F3", "consultant": "F1"},
+}
+HEADER_SHEET_INDEX = 0
+HEADER_ROWS = (1, 4)  # Merged cells in these rows are unmerged while the header is written
+
+# Tables that grow with the data, per working paper:
+# - insert_row: first row of the inserted data rows; everything from here down is the table's footer
+# - reference_row: template row whose formatting and formulas are copied onto the new rows
+TABLE_LAYOUTS = {
+    2: {
+        "TP2.1": {"sheet_index": 0, "insert_row": 13, "reference_row": 12},
+        "TP2.2": {"sheet_index": 1, "insert_row": 14, "reference_row": 13},
+    },
+    3: {
+        "TP3.1": {"sheet_index": 0, "insert_row": 20, "reference_row": 19},
+        "TP3.2": {"sheet_index": 1, "insert_row": 15, "reference_row": 14},
+        "TP3.3": {"sheet_index": 2, "insert_row": 11, "reference_row": 10},
+    },
+}
+
+# (template path, template digest, wp_n) -> manifest, so each manifest is read once per process
+_manifest_memo = {}
+
+
+def _window_merges(sheet, start_row, end_row):
+    """
+    List the merged ranges that overlap a row window, with the height of their first row.
+
+    Ranges whose first row has no explicit height are skipped: `unmerge_cells_in_range` has
+    always left those merged in place, and the manifest keeps that behaviour.
+    """
+    merges = []
+    for merged_range in sheet.merged_cells.ranges:
+        min_col, min_row, max_col, max_row = range_boundaries(str(merged_range))
+        if end_row < min_row or start_row > max_row:
+            continue
+        row_dimension = sheet.row_dimensions.get(min_row)
+        row_height = row_dimension.height if row_dimension is not None else None
+        if not row_height:
+            continue
+        merges.append({"range": str(merged_range), "row_height": row_height})
+    return merges
+
+
+def _footer(sheet, insert_row):
+    """
+    Describe the block that moves down when rows are inserted: the rows from `insert_row` to the last
+    row of the sheet and the merged ranges reaching into them.
+    """
+    return {
+        "first_row": insert_row,
+        "last_row": max(sheet.max_row, insert_row),
+        "last_column": sheet.max_column,
+        "merges": [
+            str(merged_range) for merged_range in sheet.merged_cells.ranges
+            if merged_range.max_row >= insert_row
+        ],
+    }
+
+
+def _row_prototype(sheet, row):
+    """
+    Describe a template row: its height and, per column, the style ids and the value or formula.
+
+    Style ids index the template's own style tables, so they are only valid for workbooks
+    loaded from the same template (which the manifest's hash guarantees).
+    """
+    cells = []
+    for column in range(1, sheet.max_column + 1):
+        cell = sheet.cell(row=row, column=column)
+        cells.append({
+            "column": column,
+            "style": list(cell._style) if cell.has_style else None,
+            **encode_cell_value(cell.value),
+        })
+    row_dimension = sheet.row_dimensions.get(row)
+    return {
+        "row": row,
+        "height": row_dimension.height if row_dimension is not None else None,
+        "max_column": sheet.max_column,
+        "cells": cells,
+    }
+
+
+def encode_cell_value(value):
+    """Encode a cell value for JSON: {"value": ...}, plus "value_type" for dates and times (ISO strings)."""
+    for value_type, python_type in (("datetime", datetime), ("date", date), ("time", time)):
+        if isinstance(value, python_type):
+            return {"value": value.isoformat(), "value_type": value_type}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return {"value": value}
+    return {"value": str(value)}
+
+
+def decode_cell_value(entry):
+    """Decode a value written by `encode_cell_value`."""
+    value_type = entry.get("value_type")
+    if value_type is None:
+        return entry["value"]
+    return {"datetime": datetime, "date": date, "time": time}[value_type].fromisoformat(entry["value"])
+
+
+def _marker_cells(sheet):
+    """Map each text constant of a sheet to the coordinate of its first occurrence (row by row)."""
+    markers = {}
+    for row in sheet.iter_rows():
+        for cell in row:
+            value = cell.value
+            if isinstance(value, str) and not value.startswith("=") and value not in markers:
+                markers[value] = cell.coordinate
+    return markers
+
+
+def compile_template_manifest(template_path, wp_n):
+    """
+    Analyze a working paper template and describe its layout.
+
+    Args:
+        template_path (str): Path to the working paper template.
+        wp_n (int): The working paper number (1 - 4) the template belongs to.
+
+    Returns:
+        dict: The manifest, with the template's digest, the lead sheet header cells and the
+        merged ranges around them, one entry per growing table (anchor rows, the footer below
+        the insertion point and the reference row prototype) and the marker cells of every sheet.
+    """
+    workbook = parse_working_paper(template_path)
+
+    header = None
+    if wp_n in HEADER_CELLS:
+        header = {
+            "sheet_index": HEADER_SHEET_INDEX,
+            "cells": dict(HEADER_CELLS[wp_n]),
+            "merges": _window_merges(workbook.worksheets[HEADER_SHEET_INDEX], *HEADER_ROWS),
+        }
+
+    tables = {}
+    for name, layout in TABLE_LAYOUTS.get(wp_n, {}).items():
+        sheet = workbook.worksheets[layout["sheet_index"]]
+        tables[name] = {
+            "sheet_index": layout["sheet_index"],
+            "sheet_title": sheet.title,
+            "insert_row": layout["insert_row"],
+            "reference_row": layout["reference_row"],
+            "footer": _footer(sheet, layout["insert_row"]),
+            "prototype": _row_prototype(sheet, layout["reference_row"]),
+        }
+
+    return {
+        "manifest_version": MANIFEST_VERSION,
+        "template_sha256": file_sha256(template_path),
+        "template_name": os.path.basename(template_path),
+        "wp_n": wp_n,
+        "header": header,
+        "tables": tables,
+        "markers": {sheet.title: _marker_cells(sheet) for sheet in workbook.worksheets},
+    }
+
+
+def get_manifest_path(template_path):
+    """Return the path of the cached manifest of a template."""
+    template_dir, template_name = os.path.split(os.path.abspath(template_path))
+    return os.path.join(template_dir, MANIFEST_DIR_NAME, f"{os.path.splitext(template_name)[0]}.json")
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest_path, manifest):
+    manifest_dir = os.path.dirname(manifest_path)
+    os.makedirs(manifest_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=manifest_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(temp_path, manifest_path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_template_manifest(template_path, wp_n):
+    """
+    Return the layout manifest of a working paper template, compiling it if needed.
+
+    The manifest is cached as JSON in a `.manifests` folder next to the template and is
+    recompiled when the template's SHA-256 or `MANIFEST_VERSION` no longer match.
+
+    Args:
+        template_path (str): Path to the working paper template.
+        wp_n (int): The working paper number (1 - 4) the template belongs to.
+
+    Returns:
+        dict: The manifest (see `compile_template_manifest`).
+    """
+    abs_path = os.path.abspath(template_path)
+    digest = file_sha256(abs_path)
+    memo_key = (abs_path, digest, wp_n)
+
+    manifest = _manifest_memo.get(memo_key)
+    if manifest is None:
+        manifest_path = get_manifest_path(abs_path)
+        manifest = _read_manifest(manifest_path)
+        if (
+            manifest is None
+            or manifest.get("manifest_version") != MANIFEST_VERSION
+            or manifest.get("template_sha256") != digest
+            or manifest.get("wp_n") != wp_n
+        ):
+            manifest = compile_template_manifest(abs_path, wp_n)
+            try:
+                _write_manifest(manifest_path, manifest)
+            except OSError as e:
+                # A read-only template folder only costs a recompile in the next process
+                logger.warning("Could not write template manifest %s: %s", manifest_path, e)
+        _manifest_memo[memo_key] = manifest
+    return manifest
@@ -0,0 +1,44 @@
+#tests/conftest.py
+import os
+import sys
+
+import pytest
+from openpyxl import Workbook
+
+# The modules live at the repository root
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+TEMPLATES_DIR = os.path.join(REPO_DIR, "TEMPLATES", "Working_Papers_Templates")
+
+
+@pytest.fixture
+def template_paths():
+    """The TP.1 - TP.4 working paper templates, in order."""
+    from batch import get_template_paths
+    return get_template_paths()
+
+
+@pytest.fixture
+def write_data_file():
+    """Return a function writing a small synthetic data file, leaving out the columns given in `without`."""
+    from benchmarks.synthetic_data import DATA_FILE_COLUMNS, data_file_rows
+
+    def write(path, without=(), employees=10):
+        kept = [index for index, column in enumerate(DATA_FILE_COLUMNS) if column not in without]
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append([DATA_FILE_COLUMNS[index] for index in kept])
+        for row in data_file_rows(employees):
+            sheet.append([row[index] for index in kept])
+        workbook.save(path)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def no_data_cache(monkeypatch):
+    """Parse every data file rather than reading the cache of parsed data files."""
+    from data_cache import CACHE_MAX_MB_ENV
+    monkeypatch.setenv(CACHE_MAX_MB_ENV, "0")
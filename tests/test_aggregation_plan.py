@@ -0,0 +1,34 @@
+#tests/test_aggregation_plan.py
+import pandas as pd
+
+from aggregation_plan import AggregationPlan
+
+
+def test_roster_keeps_idnumber_order_between_equal_surnames():
+    ids = [f"{index:04d}" for index in range(60)]
+    data = pd.DataFrame({
+        "IDNUMBER": ids,
+        "FIRSTNAME": ids,
+        "LASTNAME": [["SMITH", "NDLOVU", "BOTHA"][index % 3] for index in range(60)],
+    })
+
+    roster = AggregationPlan(data).roster
+
+    for _, employees in roster.groupby("LASTNAME", sort=False):
+        assert employees["IDNUMBER"].tolist() == sorted(employees["IDNUMBER"])
+    assert roster["LASTNAME"].is_monotonic_increasing
+
+
+def test_roster_takes_the_first_non_empty_value_of_each_column():
+    data = pd.DataFrame({
+        "IDNUMBER": ["1", "1", "2"],
+        "FIRSTNAME": [None, "THABO", "ANNA"],
+        "LASTNAME": ["MOKOENA", "MOKOENA-SMITH", "BOTHA"],
+    })
+
+    roster = AggregationPlan(data).roster_by_id
+
+    assert roster.to_dict("records") == [
+        {"IDNUMBER": "1", "FIRSTNAME": "THABO", "LASTNAME": "MOKOENA"},
+        {"IDNUMBER": "2", "FIRSTNAME": "ANNA", "LASTNAME": "BOTHA"},
+    ]
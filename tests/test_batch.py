@@ -0,0 +1,19 @@
+#tests/test_batch.py
+import pytest
+
+from batch import process_all_for_file
+
+
+pytestmark = pytest.mark.usefixtures("no_data_cache")
+
+
+def test_every_failed_working_paper_is_reported(tmp_path, template_paths, write_data_file):
+    # TP.2 and TP.3 both list employees by name
+    data_path = write_data_file(tmp_path / "data.xlsx", without=["FIRSTNAME"])
+
+    with pytest.raises(RuntimeError) as failure:
+        process_all_for_file(data_path, template_paths, "Tester", str(tmp_path / "out"), max_workers=2)
+
+    assert str(failure.value) == (
+        "TP.2: 'Missing required columns: FIRSTNAME'; TP.3: 'Missing required columns: FIRSTNAME'"
+    )
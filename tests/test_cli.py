@@ -0,0 +1,30 @@
+#tests/test_cli.py
+import pytest
+
+import cli
+
+
+pytestmark = pytest.mark.usefixtures("no_data_cache")
+
+
+def run(data_path, output, *options):
+    return cli.main([data_path, "-o", str(output), "-c", "Tester", "-j", "1", "--log-level", "ERROR", *options])
+
+
+def test_exit_code_is_zero_when_every_file_succeeds(tmp_path, capsys, write_data_file):
+    assert run(write_data_file(tmp_path / "data.xlsx"), tmp_path / "out") == 0
+    assert "0 failed" in capsys.readouterr().out
+
+
+# Columns checked only while a working paper is generated, once the data file has loaded
+@pytest.mark.parametrize("column, options", [
+    ("MONTHLY_SALARY", ()),
+    ("FIRSTNAME", ("--tp", "2")),
+    ("PAYMENTDATE", ("--tp", "3")),
+])
+def test_missing_column_fails_the_file(tmp_path, capsys, write_data_file, column, options):
+    data_path = write_data_file(tmp_path / "data.xlsx", without=[column])
+    assert run(data_path, tmp_path / "out", *options) == 1
+    output = capsys.readouterr().out
+    assert f"data.xlsx: Failed: 'Missing required columns: {column}'" in output
+    assert "1 failed" in output
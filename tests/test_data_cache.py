@@ -0,0 +1,114 @@
+#tests/test_data_cache.py
+import logging
+import os
+import stat
+
+import pandas as pd
+import pytest
+
+from data_cache import DataFileCache, check_private_directory, file_sha256
+from helper_funcs import load_data_file_context
+from log_utils import ROOT_LOGGER_NAME
+
+
+@pytest.fixture
+def contexts(tmp_path, write_data_file):
+    """Three parsed data files of different content."""
+    return [
+        load_data_file_context(write_data_file(tmp_path / f"data_{employees}.xlsx", employees=employees))
+        for employees in (3, 4, 5)
+    ]
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache" / "data_files")
+
+
+def entry_size(cache, context):
+    return os.path.getsize(cache.entry_path(file_sha256(context.data_file_path)))
+
+
+def test_put_then_get_returns_the_parsed_data(contexts, cache_dir):
+    cache = DataFileCache(cache_dir, 10 * 1024 * 1024)
+    context = contexts[0]
+    assert cache.get(context.data_file_path) is None
+    cache.put(context)
+
+    cached = cache.get(context.data_file_path)
+    assert cached.data_file_path == context.data_file_path
+    pd.testing.assert_frame_equal(cached.data, context.data)
+    assert cached.headings == context.headings
+    assert (cached.tradename, cached.uif_reference, cached.periods_claimed) == (
+        context.tradename, context.uif_reference, context.periods_claimed
+    )
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+
+
+def test_disabled_cache_stores_nothing(contexts, cache_dir):
+    cache = DataFileCache(cache_dir, 0)
+    cache.put(contexts[0])
+    assert cache.get(contexts[0].data_file_path) is None
+    assert not os.path.exists(cache_dir)
+
+
+def test_least_recently_used_entries_are_evicted(contexts, cache_dir):
+    cache = DataFileCache(cache_dir, 10 * 1024 * 1024)
+    for age, context in zip((300, 200, 100), contexts):
+        cache.put(context)
+        entry_path = cache.entry_path(file_sha256(context.data_file_path))
+        os.utime(entry_path, (os.path.getmtime(entry_path) - age,) * 2)
+
+    # Reading the oldest entry makes it the most recently used
+    assert cache.get(contexts[0].data_file_path) is not None
+    cache.max_bytes = entry_size(cache, contexts[0]) + entry_size(cache, contexts[2])
+    cache.evict()
+
+    assert cache.get(contexts[1].data_file_path) is None
+    assert cache.get(contexts[0].data_file_path) is not None
+    assert cache.get(contexts[2].data_file_path) is not None
+
+
+def test_unreadable_entry_is_a_miss_and_removed(contexts, cache_dir):
+    cache = DataFileCache(cache_dir, 10 * 1024 * 1024)
+    cache.put(contexts[0])
+    entry_path = cache.entry_path(file_sha256(contexts[0].data_file_path))
+    with open(entry_path, "wb") as f:
+        f.write(b"not a snapshot")
+
+    assert cache.get(contexts[0].data_file_path) is None
+    assert not os.path.exists(entry_path)
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_directory_other_users_can_write_to_is_not_used(contexts, cache_dir, caplog, monkeypatch):
+    # Configuring the CLI's logging stops the package's records from reaching caplog
+    monkeypatch.setattr(logging.getLogger(ROOT_LOGGER_NAME), "propagate", True)
+    os.makedirs(cache_dir)
+    os.chmod(cache_dir, 0o777)
+    assert "other users have access" in check_private_directory(cache_dir)
+
+    cache = DataFileCache(cache_dir, 10 * 1024 * 1024)
+    with caplog.at_level(logging.WARNING, logger=ROOT_LOGGER_NAME):
+        cache.put(contexts[0])
+        assert cache.get(contexts[0].data_file_path) is None
+    assert os.listdir(cache_dir) == []
+    assert "Not using the data file cache" in caplog.text
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_symbolic_link_is_not_a_private_directory(tmp_path):
+    target = tmp_path / "target"
+    target.mkdir(mode=0o700)
+    link = tmp_path / "link"
+    link.symlink_to(target)
+    assert check_private_directory(str(target)) is None
+    assert check_private_directory(str(link)) == "it is a symbolic link"
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to give a file away")
+def test_entry_owned_by_another_user_is_not_loaded(contexts, cache_dir):
+    cache = DataFileCache(cache_dir, 10 * 1024 * 1024)
+    cache.put(contexts[0])
+    os.chown(cache.entry_path(file_sha256(contexts[0].data_file_path)), 65534, 65534)
+    assert cache.get(contexts[0].data_file_path) is None
@@ -0,0 +1,100 @@
+#tests/test_helper_funcs.py
+import zipfile
+
+import pytest
+from openpyxl import Workbook
+
+from benchmarks.synthetic_data import DATA_FILE_COLUMNS, generate_data_file
+from helper_funcs import probe_data_file_header, shift_formula_rows, shift_sqref
+
+
+def write_sheet_xml(path, sheet_data, dimension=None):
+    """Write a minimal xlsx holding one worksheet with the given <sheetData> content."""
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    relationships = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    dimension = f'<dimension ref="{dimension}"/>' if dimension else ""
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("xl/workbook.xml", (
+            f'<workbook xmlns="{main}" xmlns:r="{relationships}">'
+            '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        archive.writestr("xl/_rels/workbook.xml.rels", (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{relationships}/worksheet" Target="/xl/worksheets/export.xml"/>'
+            '</Relationships>'
+        ))
+        archive.writestr("xl/worksheets/export.xml", f'<worksheet xmlns="{main}">{dimension}<sheetData>{sheet_data}</sheetData></worksheet>')
+    return str(path)
+
+
+def test_probe_reads_the_header_of_a_data_file(tmp_path):
+    path = str(tmp_path / "data.xlsx")
+    generate_data_file(path, employees=5, periods=2)
+    # Written in write-only mode: inline strings and no <dimension>
+    assert probe_data_file_header(path) == (DATA_FILE_COLUMNS, None)
+
+
+def test_probe_reads_shared_strings_and_other_cell_types(tmp_path):
+    path = str(tmp_path / "data.xlsx")
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["IDNUMBER", None, 3, 2.5, True, "FIRSTNAME"])
+    sheet.append(["8001015009087", "x", 1, 2, 3, "Thabo"])
+    sheet.append(["7505055009081"])
+    workbook.save(path)
+    assert probe_data_file_header(path) == (["IDNUMBER", None, 3, 2.5, True, "FIRSTNAME"], 3)
+
+
+def test_probe_reads_inline_strings_and_cells_without_references(tmp_path):
+    path = write_sheet_xml(tmp_path / "data.xlsx", (
+        '<row r="1">'
+        '<c t="inlineStr"><is><t>TRADENAME</t></is></c>'
+        '<c t="inlineStr"><is><r><t>UIF</t></r><r><t>REFERENCENUMBER</t></r></is></c>'
+        '<c r="D1" t="inlineStr"><is><t>IDNUMBER</t></is></c>'
+        '</row>'
+        '<row r="2"><c r="A2" t="inlineStr"><is><t>not read</t></is></c></row>'
+    ))
+    # Without a <dimension> the row count is unknown
+    assert probe_data_file_header(path) == (["TRADENAME", "UIFREFERENCENUMBER", None, "IDNUMBER"], None)
+
+
+def test_probe_of_an_empty_sheet(tmp_path):
+    path = write_sheet_xml(tmp_path / "data.xlsx", "", dimension="A1")
+    assert probe_data_file_header(path) == ([], 1)
+
+
+# Three rows inserted at row 21 of the sheet "TP.2.1"
+@pytest.mark.parametrize("formula, expected", [
+    ("=D22-H22", "=D25-H25"),
+    ("=D21", "=D24"),
+    ("=D20", "=D20"),
+    ("=A5+B21", "=A5+B24"),
+    ("=$D$22*2", "=$D$25*2"),
+    ("=SUM(J12:L30)", "=SUM(J12:L33)"),
+    ("=SUM(J25:L30)", "=SUM(J28:L33)"),
+    ("=SUM(J12:L20)", "=SUM(J12:L20)"),
+    ("=SUM(D:D)", "=SUM(D:D)"),
+    ('="D22"&D22', '="D22"&D25'),
+    ("=Other!D22+D22", "=Other!D22+D25"),
+    ("='TP.2.1'!D22+D22", "='TP.2.1'!D25+D25"),
+])
+def test_shift_formula_rows(formula, expected):
+    assert shift_formula_rows(formula, 21, 3, "TP.2.1") == expected
+
+
+def test_shift_formula_rows_returns_unchanged_formulas_as_they_are():
+    formula = "=IF( A1 = 1 , \"x\" , B2 )"
+    assert shift_formula_rows(formula, 21, 3) is formula
+
+
+# The footer starting at row 21 moves down three rows
+@pytest.mark.parametrize("sqref, expected", [
+    ("A21", "A24"),
+    ("A25:C30", "A28:C33"),
+    ("A10:A25", "A10:A28"),
+    ("A1:B20", "A1:B20"),
+    ("B16 C13:C15", "B16 C13:C15"),
+    ("A25:C30 A1 D21:D22", "A28:C33 A1 D24:D25"),
+])
+def test_shift_sqref(sqref, expected):
+    assert shift_sqref(sqref, 21, 3) == expected
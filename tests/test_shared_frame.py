@@ -0,0 +1,40 @@
+#tests/test_shared_frame.py
+import pickle
+
+import pandas as pd
+import pytest
+
+from helper_funcs import load_data_file_context
+from shared_frame import SharedDataFileContext
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def load_context(tmp_path, write_data_file):
+    def load(employees):
+        return load_data_file_context(write_data_file(tmp_path / f"data_{employees}.xlsx", employees=employees))
+    return load
+
+
+def test_attached_context_matches_the_export(load_context):
+    context = load_context(10)
+    # The date columns mix text and Excel dates, they cannot go through Arrow
+    assert {type(value) for value in context.data["SHUTDOWN_FROM"]} > {str}
+
+    with SharedDataFileContext(context) as shared:
+        attached = pickle.loads(pickle.dumps(shared))
+        pd.testing.assert_frame_equal(attached.data, context.data)
+        for column in context.data.columns:
+            assert list(map(type, attached.data[column])) == list(map(type, context.data[column]))
+        assert (attached.tradename, attached.uif_reference, attached.periods_claimed, attached.headings) == (
+            context.tradename, context.uif_reference, context.periods_claimed, context.headings
+        )
+
+
+def test_task_payload_does_not_grow_with_the_data(load_context):
+    sizes = []
+    for employees in (10, 200):
+        with SharedDataFileContext(load_context(employees)) as shared:
+            sizes.append(len(pickle.dumps(shared)))
+    assert sizes[1] - sizes[0] < 64
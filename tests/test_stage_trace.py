@@ -0,0 +1,33 @@
+#tests/test_stage_trace.py
+import json
+import os
+import stat
+
+import pytest
+
+from file_utils import current_umask
+from stage_trace import StageTrace, span
+
+
+def test_trace_records_the_stages(tmp_path):
+    trace = StageTrace("data.xlsx")
+    with trace.activate():
+        with span("load"):
+            pass
+        with span("TP.1"):
+            with span("save"):
+                pass
+    path = str(tmp_path / "company.trace.json")
+    trace.write(path, status="Success")
+
+    with open(path, encoding="utf-8") as f:
+        record = json.load(f)
+    assert record["status"] == "Success"
+    assert {"load", "save"} <= set(trace.stage_seconds())
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_trace_has_the_permissions_of_a_new_file(tmp_path):
+    path = str(tmp_path / "company.trace.json")
+    StageTrace("data.xlsx").write(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~current_umask()
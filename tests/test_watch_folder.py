@@ -0,0 +1,62 @@
+#tests/test_watch_folder.py
+import json
+import os
+import shutil
+
+import pytest
+
+from data_cache import file_sha256
+from watch_folder import InboxWatcher
+
+pytestmark = pytest.mark.usefixtures("no_data_cache")
+
+
+def drop_and_process(watcher, data_path):
+    """Copy a data file into the inbox and process the inbox; returns the result of the file."""
+    shutil.copy(data_path, os.path.join(watcher.inbox, "data.xlsx"))
+    watcher.run(interval=0.05, once=True)
+    with open(watcher.results_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f][-1]
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    return InboxWatcher(
+        str(inbox), str(tmp_path / "out"), "Tester", settle_seconds=0, results_path=str(tmp_path / "results.jsonl")
+    )
+
+
+def test_failed_file_is_not_recorded(watcher, tmp_path, write_data_file):
+    data_path = write_data_file(tmp_path / "missing.xlsx", without=["MONTHLY_SALARY"])
+
+    result = drop_and_process(watcher, data_path)
+    assert result["status"].startswith("Failed")
+    assert result["outputs"] == []
+    assert os.path.dirname(result["path"]) == watcher.failed_dir
+    assert file_sha256(data_path) not in watcher.ledger
+    assert not os.path.exists(watcher.ledger_path)
+
+    # Dropped again, the same content is processed again rather than skipped
+    again = drop_and_process(watcher, data_path)
+    assert again["status"].startswith("Failed")
+    assert again["path"] != result["path"]
+
+
+def test_processed_file_is_recorded_and_skipped_when_dropped_again(watcher, tmp_path, write_data_file):
+    data_path = write_data_file(tmp_path / "data.xlsx")
+
+    result = drop_and_process(watcher, data_path)
+    assert result["status"] == "Success"
+    assert len(result["outputs"]) == 4 and all(os.path.isfile(output) for output in result["outputs"])
+    assert os.path.dirname(result["path"]) == watcher.done_dir
+    with open(watcher.ledger_path, encoding="utf-8") as f:
+        assert json.load(f)[file_sha256(data_path)]["outputs"] == result["outputs"]
+
+    # Dropped again, it goes to the done folder without a job
+    shutil.copy(data_path, os.path.join(watcher.inbox, "data.xlsx"))
+    watcher.run(interval=0.05, once=True)
+    with open(watcher.results_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    assert len(os.listdir(watcher.done_dir)) == 3  # both copies and the ledger
@@ -0,0 +1,34 @@
+#tests/test_worker_pool.py
+import operator
+import threading
+
+from worker_pool import WorkerPool
+
+
+def test_submit_is_not_blocked_while_a_worker_is_replaced():
+    pool = WorkerPool(1, max_tasks=1)
+    try:
+        spawning, release = threading.Event(), threading.Event()
+        start_worker = pool._start_worker
+
+        def slow_start_worker():
+            spawning.set()
+            release.wait(120)
+            return start_worker()
+
+        pool._start_worker = slow_start_worker
+        assert pool.submit("client", operator.add, 1, 2).result(timeout=20) == 3
+        assert spawning.wait(30)
+
+        # The retired worker's replacement is still starting
+        futures = []
+        submitter = threading.Thread(target=lambda: futures.append(pool.submit("client", operator.add, 2, 3)))
+        submitter.start()
+        submitter.join(5)
+        assert not submitter.is_alive()
+
+        release.set()
+        assert futures[0].result(timeout=60) == 5
+    finally:
+        release.set()
+        pool.shutdown()
@@ -0,0 +1,68 @@
+#tests/test_working_papers.py
+import glob
+import os
+import warnings
+
+import openpyxl
+import pytest
+from openpyxl.utils import get_column_letter
+
+from batch import WP_NAMES, process_file
+from benchmarks.synthetic_data import generate_data_file
+from data_cache import CACHE_MAX_MB_ENV
+from xlsx_stream import STREAM_WRITER_ENV
+
+
+@pytest.fixture(scope="module")
+def data_path(tmp_path_factory):
+    """A small synthetic data file; nearly every employee has no TERMINATIONDATE."""
+    path = str(tmp_path_factory.mktemp("data") / "data.xlsx")
+    generate_data_file(path, employees=40, periods=3, payments=2)
+    return path
+
+
+def generate(data_path, template_paths, wp_index, outdir, stream_writer, monkeypatch):
+    """Generate one working paper with the streaming writer on or off and return its path."""
+    monkeypatch.setenv(STREAM_WRITER_ENV, "1" if stream_writer else "0")
+    monkeypatch.setenv(CACHE_MAX_MB_ENV, "0")
+    result = process_file(data_path, template_paths, "Tester", str(outdir), wp_indexes=(wp_index,))
+    assert result["Status"] == "Success"
+    paths = glob.glob(os.path.join(str(outdir), "**", f"{WP_NAMES[wp_index]}_*.xlsx"), recursive=True)
+    assert len(paths) == 1
+    return paths[0]
+
+
+def dump(path):
+    """
+    The content of a working paper: per sheet the values and number formats of the cells holding a
+    value, the merged cells and the hidden rows and columns.
+
+    Column widths are left out: openpyxl splits the template's column groups and gives the columns it
+    splits off its default width, where the streaming writer keeps the template's width.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        workbook = openpyxl.load_workbook(path)
+    sheets = {}
+    for sheet in workbook.worksheets:
+        hidden_columns = set()
+        for dimension in sheet.column_dimensions.values():
+            if dimension.hidden and dimension.min:
+                hidden_columns.update(get_column_letter(column) for column in range(dimension.min, dimension.max + 1))
+        sheets[sheet.title] = {
+            "cells": {
+                cell.coordinate: (cell.value, cell.number_format)
+                for row in sheet.iter_rows() for cell in row if cell.value is not None
+            },
+            "merged": sorted(str(cell_range) for cell_range in sheet.merged_cells.ranges),
+            "hidden_rows": sorted(row for row, dimension in sheet.row_dimensions.items() if dimension.hidden),
+            "hidden_columns": sorted(hidden_columns),
+        }
+    return sheets
+
+
+@pytest.mark.parametrize("wp_index", range(len(WP_NAMES)), ids=lambda wp_index: WP_NAMES[wp_index])
+def test_stream_writer_matches_openpyxl(data_path, template_paths, wp_index, tmp_path, monkeypatch):
+    streamed = generate(data_path, template_paths, wp_index, tmp_path / "stream", True, monkeypatch)
+    written = generate(data_path, template_paths, wp_index, tmp_path / "openpyxl", False, monkeypatch)
+    assert dump(streamed) == dump(written)
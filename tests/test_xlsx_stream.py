@@ -0,0 +1,115 @@
+#tests/test_xlsx_stream.py
+import os
+import stat
+from datetime import date, datetime
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+from openpyxl.cell.rich_text import CellRichText
+
+import xlsx_stream
+from file_utils import current_umask
+from xlsx_stream import STREAM_WRITER_ENV, StreamWriterUnsupported, XlsxTemplatePatch, _bind_value, _render_value, write_working_paper
+
+
+def render(value):
+    return _render_value(*_bind_value(value))
+
+
+@pytest.mark.parametrize("value", [None, pd.NaT, float("nan"), np.float64("nan"), float("inf")])
+def test_missing_values_render_as_empty_cells(value):
+    assert render(value) == (None, "")
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1, (None, "<v>1</v>")),
+    (2.5, (None, "<v>2.5</v>")),
+    (np.int64(7), (None, "<v>7</v>")),
+    (True, ("b", "<v>1</v>")),
+    ("#N/A", ("e", "<v>#N/A</v>")),
+    ("=SUM(A1:A2)", (None, "<f>SUM(A1:A2)</f>")),
+    ("", ("inlineStr", "")),
+    ("a < b", ("inlineStr", "<is><t>a &lt; b</t></is>")),
+    (" padded ", ("inlineStr", '<is><t xml:space="preserve"> padded </t></is>')),
+    (datetime(2020, 3, 27), (None, "<v>43917</v>")),
+    (pd.Timestamp("2020-03-27 12:00"), (None, "<v>43917.5</v>")),
+    (date(2020, 3, 27), (None, "<v>43917</v>")),
+])
+def test_render_value(value, expected):
+    assert render(value) == expected
+
+
+def test_missing_values_reload_as_empty(template_paths, tmp_path):
+    output_path = str(tmp_path / "TP.2.xlsx")
+    values = {"A1": None, "B1": pd.NaT, "C1": float("nan"), "D1": np.float64("nan"), "E1": datetime(2020, 3, 27), "F1": 3}
+    with XlsxTemplatePatch(template_paths[1]) as working_paper:
+        sheet = working_paper.worksheets[1]
+        for coordinate, value in values.items():
+            sheet[coordinate] = value
+        working_paper.save(output_path)
+
+    sheet = openpyxl.load_workbook(output_path).worksheets[1]
+    for coordinate in ("A1", "B1", "C1", "D1"):
+        assert sheet[coordinate].value is None
+    assert sheet["E1"].value == datetime(2020, 3, 27)
+    assert sheet["F1"].value == 3
+
+
+@pytest.mark.parametrize("data_type, value", [("n", "text"), ("b", object()), ("x", 1)])
+def test_unrenderable_values_are_unsupported(data_type, value):
+    with pytest.raises(StreamWriterUnsupported):
+        _render_value(data_type, value)
+
+
+def load_first_cell(path):
+    return openpyxl.load_workbook(path).worksheets[1]["A1"].value
+
+
+def test_unsupported_edit_falls_back_to_openpyxl(template_paths, tmp_path):
+    output_path = str(tmp_path / "TP.2.xlsx")
+
+    def populate(working_paper):
+        working_paper.worksheets[1]["A1"] = CellRichText("rich text")
+
+    write_working_paper(template_paths[1], output_path, populate)
+    assert str(load_first_cell(output_path)) == "rich text"
+
+
+def test_unrenderable_value_falls_back_to_openpyxl(template_paths, tmp_path, monkeypatch):
+    # A date whose serial cannot be written is found when the sheet is rendered; nothing is kept of
+    # the streamed copy and the working paper is written with openpyxl
+    monkeypatch.setattr(xlsx_stream, "to_excel", lambda value: "none")
+    output_path = str(tmp_path / "TP.2.xlsx")
+
+    def populate(working_paper):
+        working_paper.worksheets[1]["A1"] = datetime(2020, 3, 27)
+
+    write_working_paper(template_paths[1], output_path, populate)
+    assert load_first_cell(output_path) == datetime(2020, 3, 27)
+    assert [p.name for p in tmp_path.iterdir()] == ["TP.2.xlsx"]
+
+
+@pytest.mark.parametrize("read", [lambda sheet: sheet.max_row, lambda sheet: sheet["A1"].comment])
+def test_unsupported_attribute_falls_back_to_openpyxl(template_paths, tmp_path, read):
+    output_path = str(tmp_path / "TP.2.xlsx")
+
+    def populate(working_paper):
+        sheet = working_paper.worksheets[1]
+        read(sheet)
+        sheet["A1"] = 5
+
+    write_working_paper(template_paths[1], output_path, populate)
+    assert load_first_cell(output_path) == 5
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_streamed_working_paper_has_the_permissions_of_a_new_file(template_paths, tmp_path, monkeypatch):
+    modes = {}
+    for stream_writer in ("1", "0"):
+        monkeypatch.setenv(STREAM_WRITER_ENV, stream_writer)
+        output_path = str(tmp_path / f"TP.2-{stream_writer}.xlsx")
+        write_working_paper(template_paths[1], output_path, lambda working_paper: None)
+        modes[stream_writer] = stat.S_IMODE(os.stat(output_path).st_mode)
+    assert modes["1"] == modes["0"] == 0o666 & ~current_umask()
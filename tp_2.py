@@ -1,30 +1,25 @@
 #tp_2.py
 from helper_funcs import (
-    load_data_file,
-    load_working_paper,
-    get_column_indexes,
-    extract_tradename_uif,
+    ensure_data_file_context,
     create_output_directory,
-    save_working_paper,
-    insert_rows,
-    copy_formatting,
-    unmerge_cells_in_range,
-    convert_to_dataframe,
-    reapply_merged_cells,
+    extend_table,
     validate_columns,
-    reset_row_heights,
     get_working_paper_path_for_all_processing
 )
 from tp_2_1 import (
-    aggregate_data_2_1,
     populate_sheet_2_1,
 )
 from tp_2_2 import (
-    aggregate_data_2_2,
     populate_sheet_2_2,
     apply_conditional_formatting_2_2
 )
+from template_manifest import load_template_manifest
+from stage_trace import span
+from xlsx_stream import write_working_paper
 from datetime import datetime
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 
 def process_files(data_file_path, working_paper_path, consultant_name, output_directory):
@@ -36,7 +31,7 @@ def process_files(data_file_path, working_paper_path, consultant_name, output_di
     working paper is then saved in the specified output directory.
 
     Args:
-        data_file_path (str): Path to the data file (Excel).
+        data_file_path (str | DataFileContext): Path to the data file (Excel), or its parsed context.
         working_paper_path (str): Path to the working paper template (Excel).
         consultant_name (str): Name of the consultant (kept for compatibility).
         output_directory (str): Directory to save the processed working paper.
@@ -50,45 +45,40 @@ def process_files(data_file_path, working_paper_path, consultant_name, output_di
         Exception: If any other unexpected error occurs.
     """
     try:
-        # Load the data file (Excel workbook and the first sheet)
-        data_wb, data_sheet = load_data_file(data_file_path)
+        # Parse the data file, or reuse the context already parsed for this file
+        data_context = ensure_data_file_context(data_file_path)
 
-        # Load the working paper template (no lead sheet needed)
-        working_paper_wb, _ = load_working_paper(working_paper_path, sh_n=0)
+        # Load the layout manifest of the working paper template (no lead sheet needed)
+        tables = load_template_manifest(working_paper_path, wp_n=2)["tables"]
 
-        # Extract column indexes from the data sheet
-        headings = get_column_indexes(data_sheet)
-        
-        # Convert the source data to a pandas DataFrame
-        data = convert_to_dataframe(data_sheet)
+        # The filtered source data as a pandas DataFrame
+        data = data_context.data
 
         # Validate necessary columns
         required_columns_0 = ["IDNUMBER", "FIRSTNAME", "LASTNAME"]
         validate_columns(data, required_columns_0)
 
-        # Populate the employee Sheet 1 with aggregated employee data (TP2.1)
-        employee_sheet_1 = working_paper_wb.worksheets[0]  # First sheet is now TP2.1
-        populate_employee_sheet_1(employee_sheet_1, data_sheet)
-        
-        # Populate the employee Sheet 2 with aggregated employee data (TP2.2)
-        employee_sheet_2 = working_paper_wb.worksheets[1]  # Second sheet is now TP2.2
-        populate_employee_sheet_2(employee_sheet_2, data_sheet)
-
         # Create an output directory and get the processed file path
-        tradename, uif_reference = extract_tradename_uif(data_sheet, headings)
-        processed_file_path = create_output_directory(output_directory, tradename, wp_n=2, uif_reference=uif_reference, data_file_path=data_file_path, template_paths=[working_paper_path])
+        tradename, uif_reference = data_context.tradename, data_context.uif_reference
+        processed_file_path = create_output_directory(output_directory, tradename, wp_n=2, uif_reference=uif_reference, data_file_path=data_context.data_file_path, template_paths=[working_paper_path])
 
-        # Save the modified working paper
-        save_working_paper(working_paper_wb, processed_file_path)
+        # Populate a copy of the template with aggregated employee data (TP2.1, TP2.2) and save it as the working paper
+        write_working_paper(
+            working_paper_path, processed_file_path,
+            lambda working_paper_wb: populate_employee_sheets(working_paper_wb, data_context.aggregation_plan, tables)
+        )
 
         return processed_file_path
 
     except FileNotFoundError as e:
-        print(f"Error: File not found - {e}")
+        logger.error("File not found - %s", e)
+        raise
     except KeyError as e:
-        print(f"Error: Missing column in data file - {e}")
+        logger.error("Missing column in data file - %s", e)
+        raise
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
+        raise
 
 
 def process_files_for_all_processing(data_file_path, working_paper_path, consultant_name, audit_working_papers_folder):
@@ -101,7 +91,7 @@ def process_files_for_all_processing(data_file_path, working_paper_path, consult
     working paper is then saved in the pre-created AUDIT WORKING PAPERS folder.
 
     Args:
-        data_file_path (str): Path to the data file (Excel).
+        data_file_path (str | DataFileContext): Path to the data file (Excel), or its parsed context.
         working_paper_path (str): Path to the working paper template (Excel).
         consultant_name (str): Name of the consultant (kept for compatibility).
         audit_working_papers_folder (str): Path to the AUDIT WORKING PAPERS subfolder.
@@ -115,48 +105,64 @@ def process_files_for_all_processing(data_file_path, working_paper_path, consult
         Exception: If any other unexpected error occurs.
     """
     try:
-        # Load the data file (Excel workbook and the first sheet)
-        data_wb, data_sheet = load_data_file(data_file_path)
+        # Parse the data file, or reuse the context already parsed for this file
+        data_context = ensure_data_file_context(data_file_path)
 
-        # Load the working paper template (no lead sheet needed)
-        working_paper_wb, _ = load_working_paper(working_paper_path, sh_n=0)
+        # Load the layout manifest of the working paper template (no lead sheet needed)
+        tables = load_template_manifest(working_paper_path, wp_n=2)["tables"]
 
-        # Extract column indexes from the data sheet
-        headings = get_column_indexes(data_sheet)
-        
-        # Convert the source data to a pandas DataFrame
-        data = convert_to_dataframe(data_sheet)
+        # The filtered source data as a pandas DataFrame
+        data = data_context.data
 
         # Validate necessary columns
         required_columns_0 = ["IDNUMBER", "FIRSTNAME", "LASTNAME"]
         validate_columns(data, required_columns_0)
 
-        # Populate the employee Sheet 1 with aggregated employee data (TP2.1)
-        employee_sheet_1 = working_paper_wb.worksheets[0]  # First sheet is now TP2.1
-        populate_employee_sheet_1(employee_sheet_1, data_sheet)
-        
-        # Populate the employee Sheet 2 with aggregated employee data (TP2.2)
-        employee_sheet_2 = working_paper_wb.worksheets[1]  # Second sheet is now TP2.2
-        populate_employee_sheet_2(employee_sheet_2, data_sheet)
-
         # Get the processed file path in the pre-created folder structure
-        tradename, uif_reference = extract_tradename_uif(data_sheet, headings)
+        tradename, uif_reference = data_context.tradename, data_context.uif_reference
         processed_file_path = get_working_paper_path_for_all_processing(audit_working_papers_folder, tradename, wp_n=2, uif_reference=uif_reference)
 
-        # Save the modified working paper
-        save_working_paper(working_paper_wb, processed_file_path)
+        # Populate a copy of the template with aggregated employee data (TP2.1, TP2.2) and save it as the working paper
+        write_working_paper(
+            working_paper_path, processed_file_path,
+            lambda working_paper_wb: populate_employee_sheets(working_paper_wb, data_context.aggregation_plan, tables)
+        )
 
         return processed_file_path
 
     except FileNotFoundError as e:
-        print(f"Error: File not found - {e}")
+        logger.error("File not found - %s", e)
+        raise
     except KeyError as e:
-        print(f"Error: Missing column in data file - {e}")
+        logger.error("Missing column in data file - %s", e)
+        raise
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
+        raise
+
 
+def populate_employee_sheets(working_paper_wb, plan, tables):
+    """
+    Populate both employee sheets of the TP.2 working paper (TP2.1 and TP2.2).
+
+    Args:
+        working_paper_wb: The working paper template (an openpyxl workbook or an `XlsxTemplatePatch`).
+        plan (AggregationPlan): The aggregation plan of the filtered source data.
+        tables (dict): The table entries of the template manifest.
 
-def populate_employee_sheet_1(employee_sheet_1, data_sheet):
+    Returns:
+        None
+    """
+    # Populate the employee Sheet 1 with aggregated employee data (TP2.1)
+    employee_sheet_1 = working_paper_wb.worksheets[tables["TP2.1"]["sheet_index"]]  # First sheet is now TP2.1
+    populate_employee_sheet_1(employee_sheet_1, plan, tables["TP2.1"])
+
+    # Populate the employee Sheet 2 with aggregated employee data (TP2.2)
+    employee_sheet_2 = working_paper_wb.worksheets[tables["TP2.2"]["sheet_index"]]  # Second sheet is now TP2.2
+    populate_employee_sheet_2(employee_sheet_2, plan, tables["TP2.2"])
+
+
+def populate_employee_sheet_1(employee_sheet_1, plan, layout):
     """
     Populate the first sheet (TP2.1) with aggregated employee data.
 
@@ -165,52 +171,39 @@ def populate_employee_sheet_1(employee_sheet_1, data_sheet):
 
     Args:
         employee_sheet_1 (openpyxl.worksheet.worksheet.Worksheet): The sheet object to populate.
-        data_sheet (openpyxl.worksheet.worksheet.Worksheet): The sheet object containing the source data.
+        plan (AggregationPlan): The aggregation plan of the filtered source data.
+        layout (dict): The TP2.1 table entry of the template manifest (anchor rows, footer and row prototype).
 
     Raises:
         KeyError: If a required column is missing in the data.
         Exception: If an unexpected error occurs during processing.
     """
     try:
-        # 1. Convert the source data to a pandas DataFrame
-        data = convert_to_dataframe(data_sheet)
-
-        # 2. Validate the presence of required columns in the DataFrame
-        required_columns_1 = [
-            "IDNUMBER", "FIRSTNAME", "LASTNAME", "EMPLOYMENTSTARTDATE", "TERMINATIONDATE", 
-            "BANK_PAY_AMOUNT", "LEAVE_INCOME", "MONTHLY_SALARY"
-        ]
-        validate_columns(data, required_columns_1)
-
-        # 3. Aggregate the data based on specific criteria 
-        aggregated = aggregate_data_2_1(data)
-
-        # 4. Prepare for row insertion
-        num_rows_to_add = len(aggregated) 
-        merged_cells_to_restore = unmerge_cells_in_range(employee_sheet_1, start_row=15, end_row=26)
-
-        # 5. Insert new rows into the target sheet
-        insert_rows(employee_sheet_1, num_rows_to_add, insert_start_row=13) 
-        start_row_1 = 13
+        # 1. Take the aggregated employee data from the plan (validates the required columns)
+        aggregated = plan.employees_2_1()
 
-        # 6. Copy formatting from existing rows to the newly inserted rows
-        copy_formatting(employee_sheet_1, start_row_1, num_rows_to_add, source_cell_n=12) 
+        # 2. Prepare for row insertion
+        num_rows_to_add = len(aggregated)
 
-        # 7. Populate the sheet with the aggregated data
-        populate_sheet_2_1(employee_sheet_1, aggregated)
+        # 3. Insert new rows into the target sheet by moving the footer down, and stamp the reference row onto them
+        start_row_1 = layout["insert_row"]
+        extend_table(employee_sheet_1, layout, num_rows_to_add)
 
-        # 8. Restore any merged cells that were temporarily unmerged
-        reapply_merged_cells(employee_sheet_1, merged_cells_to_restore, num_rows_to_add)
+        # 4. Populate the sheet with the aggregated data
+        with span("populate", rows=num_rows_to_add):
+            populate_sheet_2_1(employee_sheet_1, aggregated, start_row=start_row_1)
 
-        # 9. Hide the reference row used for copying formatting
-        reset_row_heights(employee_sheet_1, reference_row=12, target_rows=range(17, 19), hide_reference_row=True)
+        # 5. Hide the reference row used for copying formatting
+        employee_sheet_1.row_dimensions[layout["reference_row"]].hidden = True
 
     except KeyError as e:
-        print(f"Error: Missing column during employee sheet population - {e}")
+        logger.error("Missing column during employee sheet population - %s", e)
+        raise
     except Exception as e:
-        print(f"An unexpected error occurred while populating the employee sheet: {e}")
+        logger.error("An unexpected error occurred while populating the employee sheet: %s", e)
+        raise
 
-def populate_employee_sheet_2(employee_sheet_2, data_sheet):
+def populate_employee_sheet_2(employee_sheet_2, plan, layout):
     """
     Populate Employee Sheet 2 (TP2.2) with aggregated employee data.
 
@@ -219,56 +212,47 @@ def populate_employee_sheet_2(employee_sheet_2, data_sheet):
 
     Args:
         employee_sheet_2 (openpyxl.worksheet.worksheet.Worksheet): The sheet to populate.
-        data_sheet (openpyxl.worksheet.worksheet.Worksheet): The sheet containing source employee data.
+        plan (AggregationPlan): The aggregation plan of the filtered source employee data.
+        layout (dict): The TP2.2 table entry of the template manifest (anchor rows, footer and row prototype).
 
     Raises:
         KeyError: If a required column is missing in the source data.
         Exception: If an unexpected error occurs during the data processing.
     """
     try:
-        # 1. Convert the source data to a pandas DataFrame
-        data = convert_to_dataframe(data_sheet)
-
-        # 2. Validate the presence of required columns in the data
-        required_columns_2 = ["IDNUMBER", "LASTNAME", "FIRSTNAME", "EMPLOYMENTSTARTDATE"]
-        validate_columns(data, required_columns_2)
-
-        # 3. Aggregate the data based on specific criteria 
-        aggregated = aggregate_data_2_2(data)
+        # 1. Take the aggregated employee data from the plan (validates the required columns)
+        aggregated = plan.employees_2_2()
 
-        # 4. Calculate the number of rows to add to the sheet
+        # 2. Calculate the number of rows to add to the sheet
         num_rows_to_add = len(aggregated)
-        merged_cells_to_restore = unmerge_cells_in_range(employee_sheet_2, start_row=16, end_row=27)
-
-        # 5. Insert new rows into the target sheet
-        start_row_2 = 14
-        insert_rows(employee_sheet_2, num_rows_to_add, start_row_2)
-
-        # 6. Copy formatting from existing rows to newly inserted rows
-        copy_formatting(employee_sheet_2, start_row_2, num_rows_to_add, source_cell_n=13)
-
-        # 7. Populate the sheet with aggregated data using specific column mappings
-        populate_sheet_2_2(
-            employee_sheet_2,
-            aggregated,
-            mappings={
-                "A": lambda i, row: i,  # Row numbering
-                "B": lambda i, row: "",  # Blank column
-                "C": lambda i, row: row["IDNUMBER"],
-                "D": lambda i, row: row["LASTNAME"],
-                "E": lambda i, row: row["FIRSTNAME"],
-                "F": lambda i, row: f"{row['FIRSTNAME'][0]}{row['LASTNAME'][0]}",  # Initials
-                "G": lambda i, row: row["EMPLOYMENTSTARTDATE"]
-            }
-        )
-
-        # 8. Restore any merged cells that were temporarily unmerged
-        reapply_merged_cells(employee_sheet_2, merged_cells_to_restore, num_rows_to_add)
 
-        # 9. Hide the reference row used for copying formatting
-        reset_row_heights(employee_sheet_2, reference_row=13, target_rows=range(18, 20), hide_reference_row=True)
+        # 3. Insert new rows into the target sheet by moving the footer down, and stamp the reference row onto them
+        start_row_2 = layout["insert_row"]
+        extend_table(employee_sheet_2, layout, num_rows_to_add)
+
+        # 4. Populate the sheet with aggregated data using specific column mappings
+        with span("populate", rows=num_rows_to_add):
+            populate_sheet_2_2(
+                employee_sheet_2,
+                aggregated,
+                mappings={
+                    "A": lambda i, row: i,  # Row numbering
+                    "B": lambda i, row: "",  # Blank column
+                    "C": lambda i, row: row["IDNUMBER"],
+                    "D": lambda i, row: row["LASTNAME"],
+                    "E": lambda i, row: row["FIRSTNAME"],
+                    "F": lambda i, row: f"{row['FIRSTNAME'][0]}{row['LASTNAME'][0]}",  # Initials
+                    "G": lambda i, row: row["EMPLOYMENTSTARTDATE"]
+                },
+                start_row=start_row_2
+            )
+
+        # 5. Hide the reference row used for copying formatting
+        employee_sheet_2.row_dimensions[layout["reference_row"]].hidden = True
 
     except KeyError as e:
-        print(f"Error: Missing required column in data file - {e}")
+        logger.error("Missing required column in data file - %s", e)
+        raise
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
+        raise
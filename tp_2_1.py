@@ -2,6 +2,10 @@
 from openpyxl.utils import get_column_letter
 from openpyxl.formatting.rule import CellIsRule
 from openpyxl.styles import PatternFill
+from aggregation_plan import AggregationPlan
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 # Constants
 START_ROW = 13  # Starting row for employee data insertion
@@ -20,37 +24,25 @@ def aggregate_data_2_1(data):
     Returns:
         pandas.DataFrame: The aggregated data with the calculated values, sorted by last name.
     """
-    # Aggregate the data
-    aggregated_data = data.groupby("IDNUMBER").agg({
-        "FIRSTNAME": "first",
-        "LASTNAME": "first",
-        "EMPLOYMENTSTARTDATE": "first",
-        "TERMINATIONDATE": "min",
-        "BANK_PAY_AMOUNT": "sum",
-        "LEAVE_INCOME": "sum",
-        "MONTHLY_SALARY": "first"
-    }).reset_index()
-    
-    # Sort the rows by LASTNAME
-    aggregated_data = aggregated_data.sort_values(by="LASTNAME")
-    
-    return aggregated_data
-
-def populate_sheet_2_1(employee_sheet, aggregated):
+    # Take the TP2.1 view of the shared employee roster
+    return AggregationPlan(data).employees_2_1()
+
+def populate_sheet_2_1(employee_sheet, aggregated, start_row=START_ROW):
     """
     Populates the employee sheet with aggregated data.
 
     This function takes the aggregated employee data and populates the corresponding cells in the employee sheet.
-    It begins inserting data starting from the defined start row (START_ROW) and continues row by row.
+    It begins inserting data at `start_row` (START_ROW by default) and continues row by row.
 
     Args:
         employee_sheet (openpyxl.worksheet.worksheet.Worksheet): The worksheet object to populate with data.
         aggregated (pandas.DataFrame): The aggregated data to populate into the sheet.
+        start_row (int): The first data row (the table's insert row in the template manifest).
 
     Returns:
         None
     """
-    current_row = START_ROW
+    current_row = start_row
     for _, row in aggregated.iterrows():
         try:
             for col_idx, value in enumerate(row, start=1):
@@ -59,4 +51,4 @@ def populate_sheet_2_1(employee_sheet, aggregated):
                 employee_sheet[f"{col_letter}{current_row}"].value = value
             current_row += 1
         except Exception as e:
-            print(f"Error while populating aggregated data: {e}")
+            logger.error("Error while populating aggregated data: %s", e)
@@ -1,6 +1,10 @@
 #tp_2_2.py
 from openpyxl.styles import PatternFill
 from openpyxl.formatting.rule import CellIsRule
+from aggregation_plan import AggregationPlan
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 START_ROW = 14
 
@@ -17,19 +21,10 @@ def aggregate_data_2_2(data):
     Returns:
         pandas.DataFrame: The aggregated data, sorted by last name.
     """
-    # Aggregate the data
-    aggregated_data = data.groupby("IDNUMBER").agg({
-        "LASTNAME": "first",
-        "FIRSTNAME": "first",
-        "EMPLOYMENTSTARTDATE": "first"
-    }).reset_index()
-    
-    # Sort the rows by LASTNAME
-    aggregated_data = aggregated_data.sort_values(by="LASTNAME")
-    
-    return aggregated_data
+    # Take the TP2.2 view of the shared employee roster
+    return AggregationPlan(data).employees_2_2()
 
-def populate_sheet_2_2(employee_sheet, aggregated, mappings):
+def populate_sheet_2_2(employee_sheet, aggregated, mappings, start_row=START_ROW):
     """
     Populates the employee sheet with custom mappings.
 
@@ -42,18 +37,19 @@ def populate_sheet_2_2(employee_sheet, aggregated, mappings):
         aggregated (pandas.DataFrame): The aggregated data to populate into the sheet.
         mappings (dict): A dictionary where keys are column letters and values are functions 
                          that define how to populate the corresponding columns.
+        start_row (int): The first data row (the table's insert row in the template manifest).
 
     Returns:
         None
     """
-    current_row = START_ROW
+    current_row = start_row
     for i, row in enumerate(aggregated.itertuples(index=False), start=1):
         try:
             for col_letter, func in mappings.items():
                 employee_sheet[f"{col_letter}{current_row}"].value = func(i, row._asdict())
             current_row += 1
         except Exception as e:
-            print(f"Error while populating custom mapped data: {e}")
+            logger.error("Error while populating custom mapped data: %s", e)
 
 def apply_conditional_formatting_2_2(sheet, start_row, end_row, columns, condition="No", fill_color="FFCCCC"):
     """
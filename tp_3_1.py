@@ -1,6 +1,9 @@
 #tp_3_1.py
-from datetime import datetime
 import pandas as pd
+from helper_funcs import PAYMENT_DATE_FORMATS, parse_date_column
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 def aggregate_data_3_1(data):
     """
@@ -13,35 +16,12 @@ def aggregate_data_3_1(data):
     Returns:
         A DataFrame with aggregated data.
     """
-    # If PAYMENTDATE is already in datetime format, skip parsing
-    if not pd.api.types.is_datetime64_any_dtype(data['PAYMENTDATE']):
-        # Define a list of possible date formats
-        date_formats = [
-            "%d-%b-%Y",              # Example: 28-May-2020
-            "%d-%b-%Y %I:%M:%S %p",  # Example: 28-May-2020 03:11:10 PM
-            "%Y-%m-%d %H:%M:%S",     # Example: 2020-05-28 15:11:10
-            "%d/%m/%Y",              # Example: 28/05/2020
-            "%m/%d/%Y",              # Example: 05/28/2020
-            "%d-%m-%Y",              # Example: 28-05-2020
-            "%Y/%m/%d",              # Example: 2020/05/28
-            "%d %b %Y",              # Example: 28 May 2020
-        ]
-
-        def parse_date(date_str):
-            """Try to parse a date string using a list of formats."""
-            for fmt in date_formats:
-                try:
-                    return datetime.strptime(date_str, fmt)
-                except (ValueError, TypeError):
-                    continue
-            return None  # Return None if no format matches
-
-        # Apply the custom date parsing function
-        data["PAYMENTDATE"] = data["PAYMENTDATE"].apply(parse_date)
+    # Parse PAYMENTDATE (datetime values are kept as they are)
+    data["PAYMENTDATE"], failed = parse_date_column(data["PAYMENTDATE"], PAYMENT_DATE_FORMATS)
 
-        # Check if any dates could not be parsed
-        if data["PAYMENTDATE"].isnull().any():
-            print("Warning: Some dates could not be parsed and were set to None.")
+    # Check if any dates could not be parsed
+    if failed:
+        logger.warning("%d payment dates could not be parsed and were set to None.", failed)
     
     # Ensure PAYMENTDATE is in datetime format
     data["PAYMENTDATE"] = pd.to_datetime(data["PAYMENTDATE"], errors="coerce")
@@ -65,15 +45,16 @@ def aggregate_data_3_1(data):
 
     return aggregated
 
-def populate_sheet_3_1(sheet, aggregated_data):
+def populate_sheet_3_1(sheet, aggregated_data, start_row=20):
     """
     Populate the target sheet with aggregated data.
 
     Args:
         sheet: The target sheet object.
         aggregated_data: A pandas DataFrame with aggregated data.
+        start_row: The first data row (the table's insert row in the template manifest).
     """
-    for idx, row in enumerate(aggregated_data.itertuples(index=False), start=20):
+    for idx, row in enumerate(aggregated_data.itertuples(index=False), start=start_row):
         sheet[f"A{idx}"] = row.Month
         sheet[f"B{idx}"] = row.PaymentDate
         sheet[f"C{idx}"] = row.PAY_REF_ITR_1
@@ -1,44 +1,52 @@
 #tp_3_3.py
 import pandas as pd
 from openpyxl import Workbook
+from openpyxl.utils import column_index_from_string, range_boundaries
+from aggregation_plan import AggregationPlan
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 def aggregate_data_3_3(data):
     """
     Aggregate the payments data for Sheet 3.
-    Retain only the 'IDNUMBER', 'FIRSTNAME', and 'LASTNAME' columns, dropping duplicates by 'IDNUMBER'.
+    Retain only the 'IDNUMBER', 'FIRSTNAME', and 'LASTNAME' columns, one row per 'IDNUMBER', sorted by 'LASTNAME'.
     """
-    # Retain only necessary columns and drop duplicates
-    aggregated_data = data[['IDNUMBER', 'FIRSTNAME', 'LASTNAME']].drop_duplicates(subset='IDNUMBER').reset_index(drop=True)
-    
-    # Sort the rows by LASTNAME
-    aggregated_data = aggregated_data.sort_values(by="LASTNAME")
-    
-    return aggregated_data
+    # Take the TP3.3 view of the shared employee roster
+    return AggregationPlan(data).employees_3_3()
 
-def populate_sheet_3_3(payments_sheet, aggregated, mappings):
+def populate_sheet_3_3(payments_sheet, aggregated, mappings, start_row=11):
     """
     Populate the sheet with custom mappings.
-    Writes data from the aggregated DataFrame to the specified sheet starting at row 11.
+    Writes data from the aggregated DataFrame to the specified sheet starting at `start_row` (row 11 by default).
     """
-    current_row = 11
+    # Map every cell of the merged ranges in the written columns to its master cell (top-left cell) once
+    mapped_columns = [column_index_from_string(col_letter) for col_letter in mappings]
+    end_row = start_row + len(aggregated) - 1
+    master_cells = {}
+    for merged_range in payments_sheet.merged_cells.ranges:
+        min_col, min_row, max_col, max_row = range_boundaries(str(merged_range))
+        if end_row < min_row or start_row > max_row:
+            continue
+        for row_n in range(max(min_row, start_row), min(max_row, end_row) + 1):
+            for col_n in mapped_columns:
+                if min_col <= col_n <= max_col:
+                    master_cells.setdefault((row_n, col_n), (min_row, min_col))
+
+    current_row = start_row
     for i, row in enumerate(aggregated.itertuples(index=False), start=1):
         try:
             row_dict = row._asdict()
             for col_letter, func in mappings.items():
                 cell = payments_sheet[f"{col_letter}{current_row}"]
-                
-                # Check if this cell is part of a merged range
-                from openpyxl.utils import range_boundaries
-                for merged_range in payments_sheet.merged_cells.ranges:
-                    if cell.coordinate in merged_range:
-                        # If it's part of a merged range, get the master cell (top-left cell)
-                        min_col, min_row, max_col, max_row = range_boundaries(str(merged_range))
-                        master_cell = payments_sheet.cell(row=min_row, column=min_col)
-                        master_cell.value = func(i, row_dict)
-                        break
+
+                # If this cell is part of a merged range, write to the master cell instead
+                master = master_cells.get((cell.row, cell.column))
+                if master is not None:
+                    payments_sheet.cell(row=master[0], column=master[1]).value = func(i, row_dict)
                 else:
                     # If it's not part of a merged range, set the value directly
                     cell.value = func(i, row_dict)
             current_row += 1
         except Exception as e:
-            print(f"Error while populating custom mapped data: {e}")
+            logger.error("Error while populating custom mapped data: %s", e)
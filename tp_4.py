@@ -1,17 +1,19 @@
 #tp_4.py
 from helper_funcs import (
-    load_data_file, 
-    load_working_paper, 
-    get_column_indexes, 
-    extract_tradename_uif, 
+    ensure_data_file_context,
     create_output_directory, 
-    save_working_paper,
     get_working_paper_path_for_all_processing,
-    unmerge_cells_in_range,
+    unmerge_manifest_ranges,
     reapply_merged_cells
 )
 from openpyxl import load_workbook
+from template_manifest import load_template_manifest
+from stage_trace import span
+from xlsx_stream import write_working_paper
 from datetime import datetime
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 def process_files(data_file_path, working_paper_path, consultant_name, output_directory):
     """
@@ -25,7 +27,7 @@ def process_files(data_file_path, working_paper_path, consultant_name, output_di
     - Saves the updated working paper to the specified output directory.
 
     Args:
-        data_file_path (str): Path to the source data file (e.g., Excel file).
+        data_file_path (str | DataFileContext): Path to the source data file (e.g., Excel file), or its parsed context.
         working_paper_path (str): Path to the working paper file to be updated.
         consultant_name (str): Name of the consultant responsible for the working paper.
         output_directory (str): Path to the directory where the processed working paper will be saved.
@@ -37,17 +39,14 @@ def process_files(data_file_path, working_paper_path, consultant_name, output_di
         Exception: If there are any errors loading the files or extracting data.
     """
     try:
-        # Load the data file (Excel workbook and the first sheet)
-        data_wb, data_sheet = load_data_file(data_file_path)
+        # Parse the data file, or reuse the context already parsed for this file
+        data_context = ensure_data_file_context(data_file_path)
 
-        # Load the working paper template (Excel workbook and lead sheet)
-        working_paper_wb, lead_sheet = load_working_paper(working_paper_path, sh_n=0)
+        # Load the layout manifest of the working paper template
+        manifest = load_template_manifest(working_paper_path, wp_n=4)
 
-        # Extract column indexes from the data sheet
-        headings = get_column_indexes(data_sheet)
-        
-        # Extract tradename and UIF reference from the data sheet
-        tradename, uif_reference = extract_tradename_uif(data_sheet, headings)
+        # Take the tradename and UIF reference from the parsed data file
+        tradename, uif_reference = data_context.tradename, data_context.uif_reference
 
         # Use fixed string for periods
         periods_str = "Lockdown Periods"
@@ -55,19 +54,22 @@ def process_files(data_file_path, working_paper_path, consultant_name, output_di
         # Get the current date for record-keeping
         current_date = datetime.now().strftime("%Y-%m-%d")
         
-        # Populate the lead sheet with the extracted data
-        populate_working_paper(lead_sheet, tradename, uif_reference, periods_str, current_date, consultant_name)
-
         # Create an output directory and get the processed file path
-        processed_file_path = create_output_directory(output_directory, tradename, wp_n=4, uif_reference=uif_reference, data_file_path=data_file_path, template_paths=[working_paper_path])
+        processed_file_path = create_output_directory(output_directory, tradename, wp_n=4, uif_reference=uif_reference, data_file_path=data_context.data_file_path, template_paths=[working_paper_path])
 
-        # Save the modified working paper
-        save_working_paper(working_paper_wb, processed_file_path)
+        # Write the extracted data into the lead sheet of a copy of the template
+        write_working_paper(
+            working_paper_path, processed_file_path,
+            lambda working_paper_wb: populate_working_paper(
+                working_paper_wb.worksheets[manifest["header"]["sheet_index"]],
+                tradename, uif_reference, periods_str, current_date, consultant_name, manifest["header"]
+            )
+        )
 
         return processed_file_path
 
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
         raise
 
 
@@ -83,7 +85,7 @@ def process_files_for_all_processing(data_file_path, working_paper_path, consult
     - Saves the updated working paper to the pre-created AUDIT WORKING PAPERS folder.
 
     Args:
-        data_file_path (str): Path to the source data file (e.g., Excel file).
+        data_file_path (str | DataFileContext): Path to the source data file (e.g., Excel file), or its parsed context.
         working_paper_path (str): Path to the working paper file to be updated.
         consultant_name (str): Name of the consultant responsible for the working paper.
         audit_working_papers_folder (str): Path to the AUDIT WORKING PAPERS subfolder.
@@ -95,17 +97,14 @@ def process_files_for_all_processing(data_file_path, working_paper_path, consult
         Exception: If there are any errors loading the files or extracting data.
     """
     try:
-        # Load the data file (Excel workbook and the first sheet)
-        data_wb, data_sheet = load_data_file(data_file_path)
+        # Parse the data file, or reuse the context already parsed for this file
+        data_context = ensure_data_file_context(data_file_path)
 
-        # Load the working paper template (Excel workbook and lead sheet)
-        working_paper_wb, lead_sheet = load_working_paper(working_paper_path, sh_n=0)
+        # Load the layout manifest of the working paper template
+        manifest = load_template_manifest(working_paper_path, wp_n=4)
 
-        # Extract column indexes from the data sheet
-        headings = get_column_indexes(data_sheet)
-        
-        # Extract tradename and UIF reference from the data sheet
-        tradename, uif_reference = extract_tradename_uif(data_sheet, headings)
+        # Take the tradename and UIF reference from the parsed data file
+        tradename, uif_reference = data_context.tradename, data_context.uif_reference
 
         # Use fixed string for periods
         periods_str = "Lockdown Periods"
@@ -113,23 +112,26 @@ def process_files_for_all_processing(data_file_path, working_paper_path, consult
         # Get the current date for record-keeping
         current_date = datetime.now().strftime("%Y-%m-%d")
         
-        # Populate the lead sheet with the extracted data
-        populate_working_paper(lead_sheet, tradename, uif_reference, periods_str, current_date, consultant_name)
-
         # Get the processed file path in the pre-created folder structure
         processed_file_path = get_working_paper_path_for_all_processing(audit_working_papers_folder, tradename, wp_n=4, uif_reference=uif_reference)
 
-        # Save the modified working paper
-        save_working_paper(working_paper_wb, processed_file_path)
+        # Write the extracted data into the lead sheet of a copy of the template
+        write_working_paper(
+            working_paper_path, processed_file_path,
+            lambda working_paper_wb: populate_working_paper(
+                working_paper_wb.worksheets[manifest["header"]["sheet_index"]],
+                tradename, uif_reference, periods_str, current_date, consultant_name, manifest["header"]
+            )
+        )
 
         return processed_file_path
 
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
         raise
 
 
-def populate_working_paper(lead_sheet, tradename, uif_reference, periods_str, current_date, consultant_name):
+def populate_working_paper(lead_sheet, tradename, uif_reference, periods_str, current_date, consultant_name, header):
     """
     Populates the working paper with extracted data.
 
@@ -139,35 +141,37 @@ def populate_working_paper(lead_sheet, tradename, uif_reference, periods_str, cu
     before writing and then remerging them after.
 
     Args:
-        lead_sheet (openpyxl.worksheet.worksheet.Worksheet): The worksheet object to populate with data.
+        lead_sheet (Worksheet | SheetPatch): The worksheet object to populate with data.
         tradename (str): The tradename to be inserted into the working paper.
         uif_reference (str): The UIF reference to be inserted into the working paper.
         periods_str (str): The shutdown periods to be inserted into the working paper.
         current_date (str): The current date to be inserted into the working paper.
         consultant_name (str): The name of the consultant to be inserted into the working paper.
+        header (dict): The header entry of the template manifest (header cells and the merged ranges around them).
 
     Returns:
         None
     """
     try:
-        # First, unmerge any cells in the company info area (rows 1-4, columns B and F)
-        # This covers the range where company info is typically inserted
-        merged_cells_to_restore = unmerge_cells_in_range(lead_sheet, start_row=1, end_row=4)
+        with span("populate", cells=len(header["cells"])):
+            # First, unmerge any cells in the company info area (rows 1-4, columns B and F)
+            # The manifest lists the merged ranges of the area where company info is inserted
+            merged_cells_to_restore = unmerge_manifest_ranges(lead_sheet, header["merges"])
         
-        # Insert the extracted data into specific cells in the working paper
-        lead_sheet["B1"].value = tradename
-        lead_sheet["B2"].value = uif_reference
-        lead_sheet["B4"].value = periods_str
-        lead_sheet["F3"].value = current_date
-        lead_sheet["F1"].value = consultant_name  # Insert the consultant's name into F1
+            # Insert the extracted data into the header cells of the working paper
+            header_cells = header["cells"]
+            lead_sheet[header_cells["tradename"]].value = tradename
+            lead_sheet[header_cells["uif_reference"]].value = uif_reference
+            lead_sheet[header_cells["periods"]].value = periods_str
+            lead_sheet[header_cells["date"]].value = current_date
+            lead_sheet[header_cells["consultant"]].value = consultant_name  # The consultant's name goes into F1
         
-        # Reapply any merged cells that were temporarily unmerged
-        # Note: We pass 0 as num_rows_added since we're not adding rows, just unmerging for writing
-        reapply_merged_cells(lead_sheet, merged_cells_to_restore, 0)
+            # Reapply any merged cells that were temporarily unmerged
+            # Note: We pass 0 as num_rows_added since we're not adding rows, just unmerging for writing
+            reapply_merged_cells(lead_sheet, merged_cells_to_restore, 0)
         
-        print(f"DEBUG: Successfully populated company info - Company: {tradename}, UIF: {uif_reference}")
+        logger.debug("Successfully populated company info - Company: %s, UIF: %s", tradename, uif_reference)
         
     except Exception as e:
-        print(f"ERROR in populate_working_paper: {e}")
-        print(f"ERROR DETAILS - Function: populate_working_paper, Error: {type(e).__name__}")
+        logger.error("populate_working_paper failed (%s): %s", type(e).__name__, e)
         raise
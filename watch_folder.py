@@ -0,0 +1,305 @@
+#watch_folder.py
+import argparse
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Streamlit is never imported here (see cli.py)
+from batch import default_worker_count, get_batch_pool, get_template_paths, process_file
+from data_cache import file_sha256
+from log_utils import configure_logging, get_logger
+
+# Named explicitly, the module usually runs as __main__
+logger = get_logger("watch_folder")
+
+# Name of the file, in the done folder, recording the content hashes of the processed data files
+LEDGER_FILE_NAME = ".processed.json"
+
+# Client name of the watcher's jobs in the batch pool
+WATCH_CLIENT = "watch_folder"
+
+
+def is_data_file(name):
+    """Return whether an inbox entry is a data file (Excel lock files and hidden files are not)."""
+    return name.lower().endswith(".xlsx") and not name.startswith(("~$", "."))
+
+
+def move_to_folder(path, folder):
+    """
+    Move a file into a folder, adding a timestamp to its name if the folder already has a file of that name.
+
+    Args:
+        path (str): The file to move.
+        folder (str): The destination folder. Created if missing.
+
+    Returns:
+        str: The new path of the file.
+    """
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.basename(path)
+    dest = os.path.join(folder, name)
+    if os.path.exists(dest):
+        stem, ext = os.path.splitext(name)
+        dest = os.path.join(folder, f"{stem}_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}")
+    shutil.move(path, dest)
+    return dest
+
+
+class InboxWatcher:
+    """
+    Generate the working papers of data files as they arrive in an inbox folder.
+
+    The inbox is polled (no OS-specific file notifications):
+
+    - A data file is taken once its size and modification time have not changed for
+      `settle_seconds`, so files still being copied in are left alone.
+    - Files are deduplicated by content: a file whose SHA-256 matches a data file that was already
+      processed successfully (every working paper written) is moved to the done folder without
+      being processed again. A file that failed is retried when it is dropped again.
+    - Each new file is one job on the shared batch pool (see `batch.process_file`), generating
+      TP.1 - TP.4 in the `create_folder_structure_for_all_working_papers` layout.
+    - Once its job completes, the file is moved to the done or the failed folder.
+
+    Args:
+        inbox (str): The folder to watch.
+        output_directory (str): The folder the working papers are written to.
+        consultant (str): Name of the consultant.
+        done_dir (str): Folder for processed data files. Default: `<inbox>/done`.
+        failed_dir (str): Folder for data files that failed. Default: `<inbox>/failed`.
+        settle_seconds (float): How long a file must stay unchanged before it is taken.
+        max_workers (int): Maximum number of files in progress at the same time.
+        results_path (str): JSON Lines file each result is appended to (optional).
+    """
+
+    def __init__(self, inbox, output_directory, consultant, done_dir=None, failed_dir=None,
+                 settle_seconds=5.0, max_workers=1, results_path=None):
+        self.inbox = inbox
+        self.output_directory = output_directory
+        self.consultant = consultant
+        self.done_dir = done_dir or os.path.join(inbox, "done")
+        self.failed_dir = failed_dir or os.path.join(inbox, "failed")
+        self.settle_seconds = settle_seconds
+        self.max_workers = max_workers
+        self.results_path = results_path
+        self.ledger_path = os.path.join(self.done_dir, LEDGER_FILE_NAME)
+        self.ledger = self._read_ledger()
+        self._observed = {}  # path -> ((size, mtime), monotonic time the file was first seen so)
+        self._in_flight = {}  # future -> (path, digest)
+        self._stop = threading.Event()
+        self._pool = get_batch_pool(max_workers)
+
+    def _read_ledger(self):
+        try:
+            with open(self.ledger_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read %s, starting a new one - %s", self.ledger_path, e)
+            return {}
+
+    def _write_ledger(self):
+        os.makedirs(self.done_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.done_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.ledger, f, indent=2)
+            os.replace(temp_path, self.ledger_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @property
+    def busy(self):
+        """bool: Whether files are in progress or waiting to settle."""
+        return bool(self._in_flight or self._observed)
+
+    def settled_files(self):
+        """Return the inbox data files that have not changed for `settle_seconds`, oldest first."""
+        now = time.monotonic()
+        current = {}
+        try:
+            entries = list(os.scandir(self.inbox))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if not entry.is_file() or not is_data_file(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_size:
+                # Empty files are still being created
+                current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        in_progress = {path for path, _ in self._in_flight.values()}
+        observed, settled = {}, []
+        for path, signature in current.items():
+            if path in in_progress:
+                continue
+            previous = self._observed.get(path)
+            if previous is None or previous[0] != signature:
+                observed[path] = (signature, now)
+                continue
+            observed[path] = previous
+            if now - previous[1] >= self.settle_seconds:
+                settled.append((signature[1], path))
+        self._observed = observed
+        return [path for _, path in sorted(settled)]
+
+    def poll(self):
+        """Finish the completed jobs and queue the inbox files that have settled."""
+        for future in [future for future in self._in_flight if future.done()]:
+            self._finish(future)
+
+        in_progress_digests = {digest for _, digest in self._in_flight.values()}
+        for path in self.settled_files():
+            if len(self._in_flight) >= self.max_workers:
+                break
+            try:
+                digest = file_sha256(path)
+            except OSError as e:
+                logger.warning("Could not read %s - %s", path, e)
+                continue
+            if digest in in_progress_digests:
+                # Same content as a file in progress; decided once that one is done
+                continue
+            if digest in self.ledger:
+                moved = move_to_folder(path, self.done_dir)
+                logger.info("Skipped %s: same content as %s (moved to %s)", os.path.basename(path), self.ledger[digest]["file"], moved)
+                self._observed.pop(path, None)
+                continue
+
+            template_paths = get_template_paths()
+            future = self._pool.submit(
+                WATCH_CLIENT, process_file, path, template_paths, self.consultant, self.output_directory, (), True
+            )
+            self._in_flight[future] = (path, digest)
+            in_progress_digests.add(digest)
+            self._observed.pop(path, None)
+            logger.info("Queued %s", os.path.basename(path))
+
+    def _finish(self, future):
+        path, digest = self._in_flight.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            # The worker process died (process_file itself never raises)
+            result = {"File": os.path.basename(path), "Status": f"Failed: {e}", "Time": "", "Stages": {}, "Memory": {}, "Trace": None, "Outputs": []}
+
+        # Only a file whose working papers are on disk is done, and only then is its content skipped when dropped again
+        succeeded = result["Status"] == "Success" and bool(result["Outputs"]) and all(os.path.isfile(output) for output in result["Outputs"])
+        if result["Status"] == "Success" and not succeeded:
+            result["Status"] = "Failed: the working papers were not written"
+        moved = move_to_folder(path, self.done_dir if succeeded else self.failed_dir)
+        log = logger.info if succeeded else logger.error
+        log("%s: %s (%s) - moved to %s", result["File"], result["Status"], result["Time"], moved)
+        if succeeded:
+            self.ledger[digest] = {
+                "file": result["File"],
+                "processed": datetime.now().isoformat(timespec="seconds"),
+                "outputs": result["Outputs"],
+            }
+            self._write_ledger()
+        if self.results_path:
+            record = {
+                "finished": datetime.now().isoformat(timespec="seconds"),
+                "path": moved,
+                "sha256": digest,
+                "file": result["File"],
+                "status": result["Status"],
+                "time": result["Time"],
+                "stages": {name: round(seconds, 3) for name, seconds in result["Stages"].items()},
+                "memory": result["Memory"],
+                "trace": result["Trace"],
+                "outputs": result["Outputs"],
+            }
+            with open(self.results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def run(self, interval=2.0, once=False):
+        """
+        Poll the inbox until `stop` is called, then let the files in progress finish.
+
+        Args:
+            interval (float): Seconds between polls.
+            once (bool): Stop as soon as the files present in the inbox have been processed.
+        """
+        os.makedirs(self.inbox, exist_ok=True)
+        logger.info("Watching %s (every %gs, files settle after %gs)", os.path.abspath(self.inbox), interval, self.settle_seconds)
+        while not self._stop.is_set():
+            self.poll()
+            if once and not self.busy:
+                break
+            self._stop.wait(interval)
+
+        while self._in_flight:
+            for future in list(self._in_flight):
+                future.exception()
+                self._finish(future)
+
+    def stop(self):
+        """Stop polling; `run` returns once the files in progress have finished."""
+        self._stop.set()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m watch_folder",
+        description="Watch an inbox folder and generate the working papers (TP.1 - TP.4) of every data file dropped into it.",
+    )
+    parser.add_argument("inbox", help="Folder to watch for data files (.xlsx)")
+    parser.add_argument("-o", "--output", required=True, help="Directory the working papers are written to")
+    parser.add_argument("-c", "--consultant", required=True, help="Consultant name")
+    parser.add_argument("--done", help="Folder for processed data files (default: <inbox>/done)")
+    parser.add_argument("--failed", help="Folder for data files that failed (default: <inbox>/failed)")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between polls (default: %(default)s)")
+    parser.add_argument(
+        "--settle", type=float, default=5.0,
+        help="Seconds a file must stay unchanged before it is processed (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=default_worker_count(),
+        help="Number of files processed at the same time (default: %(default)s)",
+    )
+    parser.add_argument("--results", help="Append each file's result as a JSON line to this file")
+    parser.add_argument("--once", action="store_true", help="Process the files in the inbox, then exit")
+    parser.add_argument(
+        "--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], type=str.upper,
+        help="Minimum level of the log messages (default: AUDITFLOW_LOG_LEVEL or INFO)",
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    configure_logging(args.log_level)
+    os.makedirs(args.output, exist_ok=True)
+    watcher = InboxWatcher(
+        args.inbox, args.output, args.consultant,
+        done_dir=args.done, failed_dir=args.failed,
+        settle_seconds=args.settle, max_workers=args.jobs, results_path=args.results,
+    )
+    # Stop polling on Ctrl+C or SIGTERM and let the files in progress finish
+    signal.signal(signal.SIGINT, lambda signum, frame: watcher.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    watcher.run(interval=args.interval, once=args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
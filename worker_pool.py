@@ -0,0 +1,350 @@
+#worker_pool.py
+import atexit
+import collections
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import wait
+
+from log_utils import get_logger
+from memory_monitor import MemoryCeilingExceeded, current_rss_bytes, memory_ceiling_bytes
+
+logger = get_logger(__name__)
+
+# Environment variables configuring when a worker is replaced by a fresh process
+WORKER_MAX_TASKS_ENV = "AUDITFLOW_WORKER_MAX_TASKS"
+WORKER_MAX_RSS_MB_ENV = "AUDITFLOW_WORKER_MAX_RSS_MB"
+DEFAULT_WORKER_MAX_TASKS = 100
+DEFAULT_WORKER_MAX_RSS_MB = 1024
+
+# Seconds a stopping worker gets to exit before it is terminated
+WORKER_STOP_TIMEOUT = 5
+
+# True in pool worker processes, which run tasks but never submit any
+_in_worker = False
+
+
+def in_worker():
+    """Return whether this process is a `WorkerPool` worker."""
+    return _in_worker
+
+
+def _worker_main(connection, initializer, initargs, max_tasks, max_rss_bytes):
+    """Run tasks received on `connection` until told to stop, or until the worker should retire."""
+    global _in_worker
+    _in_worker = True
+    # Ctrl+C is for the parent process, which lets the running tasks finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        try:
+            initializer(*initargs)
+        except Exception as e:
+            # Warming up only saves time, the tasks load whatever is missing themselves
+            logger.warning("Worker warm-up failed - %s", e)
+    # A worker that went over the memory ceiling would abort every following task as well
+    ceiling = memory_ceiling_bytes()
+    if ceiling:
+        max_rss_bytes = min(max_rss_bytes, ceiling) if max_rss_bytes else ceiling
+
+    tasks_done = 0
+    while True:
+        try:
+            payload = connection.recv_bytes()
+        except (EOFError, OSError):
+            return
+        if not payload:
+            return
+
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            outcome = (True, fn(*args, **kwargs))
+        except (Exception, MemoryCeilingExceeded) as e:
+            outcome = (False, e)
+        del payload
+
+        tasks_done += 1
+        rss = current_rss_bytes() if max_rss_bytes else None
+        retire = bool(max_tasks and tasks_done >= max_tasks) or (rss is not None and rss > max_rss_bytes)
+        try:
+            connection.send((outcome, retire))
+        except Exception as e:
+            # The result (or the exception) could not be pickled
+            connection.send(((False, RuntimeError(f"Could not return the task result: {e!r}")), retire))
+        if retire:
+            return
+
+
+class _Worker:
+    """A worker process, and the future of the task it is running (None while idle)."""
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.future = None
+
+
+class WorkerPool:
+    """
+    A long-lived pool of worker processes shared by every job in this process.
+
+    - Workers are started with the "spawn" method as soon as the pool is created and run
+      `initializer` once, so imports and other warm-up happen before the first task arrives.
+    - A worker retires after `max_tasks` tasks, or once its RSS exceeds `max_rss_bytes` (or the
+      memory ceiling, see `memory_monitor`), and a fresh worker is started in its place. This
+      contains the memory growth of long-running workers.
+    - Tasks are queued per client and handed out round-robin across clients, so a client with many
+      queued tasks cannot hold back a client that submits a single one.
+    - A worker that dies fails the task it was running with `BrokenProcessPool` and is replaced;
+      the pool stays usable.
+
+    Args:
+        max_workers (int): Number of worker processes.
+        initializer (callable): Called in each worker with `initargs` before it takes tasks.
+        initargs (tuple): Arguments of `initializer`.
+        max_tasks (int): Tasks a worker runs before it is replaced. 0 disables the limit.
+        max_rss_bytes (int): RSS above which a worker is replaced after its task. 0 disables the limit.
+    """
+
+    def __init__(self, max_workers, initializer=None, initargs=(), max_tasks=0, max_rss_bytes=0):
+        self.max_workers = max_workers
+        self._initializer = initializer
+        self._initargs = initargs
+        self._max_tasks = max_tasks
+        self._max_rss_bytes = max_rss_bytes
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._queues = collections.OrderedDict()  # client -> deque of (future, pickled task)
+        self._idle = []
+        self._busy = []
+        self._shutdown = False
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+        for _ in range(max_workers):
+            self._idle.append(self._start_worker())
+        self._dispatcher = threading.Thread(target=self._dispatch, name="WorkerPoolDispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def _start_worker(self):
+        parent_connection, child_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_connection, self._initializer, self._initargs, self._max_tasks, self._max_rss_bytes),
+            daemon=True,
+        )
+        process.start()
+        child_connection.close()
+        return _Worker(process, parent_connection)
+
+    def _wake(self):
+        self._wakeup_writer.send_bytes(b"")
+
+    def submit(self, client, fn, /, *args, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` to run in a worker.
+
+        The task is pickled here, so a task that cannot be sent to a worker fails in the caller.
+
+        Args:
+            client (hashable): The client the task is queued for (e.g. one batch of files).
+            fn (callable): A picklable (module level) function.
+
+        Returns:
+            concurrent.futures.Future: The future of the task.
+        """
+        payload = pickle.dumps((fn, args, kwargs), protocol=pickle.HIGHEST_PROTOCOL)
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit tasks after the worker pool was shut down")
+            self._queues.setdefault(client, collections.deque()).append((future, payload))
+        self._wake()
+        return future
+
+    def _next_task(self):
+        """Take the next task, round-robin across clients. Called with the lock held."""
+        while self._queues:
+            client, queue = next(iter(self._queues.items()))
+            del self._queues[client]
+            future, payload = queue.popleft()
+            if queue:
+                # The client goes to the back of the line
+                self._queues[client] = queue
+            if future.set_running_or_notify_cancel():
+                return future, payload
+        return None
+
+    def _assign_tasks(self):
+        """
+        Pair idle workers with queued tasks. Called with the lock held.
+
+        Returns:
+            tuple: The (worker, payload) assignments, and the idle workers found dead, which the
+            caller replaces once it has released the lock.
+        """
+        assignments = []
+        dead = []
+        while self._idle and self._queues:
+            worker = self._idle.pop()
+            if not worker.process.is_alive():
+                dead.append(worker)
+                continue
+            task = self._next_task()
+            if task is None:
+                self._idle.append(worker)
+                break
+            worker.future = task[0]
+            self._busy.append(worker)
+            assignments.append((worker, task[1]))
+        return assignments, dead
+
+    def _replace(self, worker):
+        """
+        Stop a worker and start a new one in its place.
+
+        The worker must already be out of the idle and busy lists. Called without the lock, so
+        waiting for the worker to exit and spawning its replacement never block `submit`.
+        """
+        worker.connection.close()
+        worker.process.join(WORKER_STOP_TIMEOUT)
+        if worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join()
+        with self._lock:
+            if self._shutdown:
+                return
+        replacement = self._start_worker()
+        with self._lock:
+            # Stopped with the other idle workers if the pool was shut down in the meantime
+            self._idle.append(replacement)
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                assignments, dead = self._assign_tasks()
+                if self._shutdown and not self._busy and not self._queues and not dead:
+                    break
+                busy = list(self._busy)
+
+            # Send outside the lock, a worker still warming up only reads its task once it is ready
+            for worker, payload in assignments:
+                try:
+                    worker.connection.send_bytes(payload)
+                except OSError:
+                    # The worker died; _collect notices through its sentinel
+                    pass
+            for worker in dead:
+                self._replace(worker)
+            if dead:
+                # Hand the queued tasks to the replacements on the next pass
+                self._wake()
+
+            waitables = [self._wakeup_reader]
+            for worker in busy:
+                waitables += [worker.connection, worker.process.sentinel]
+            ready = set(wait(waitables))
+            if self._wakeup_reader in ready:
+                while self._wakeup_reader.poll():
+                    self._wakeup_reader.recv_bytes()
+            for worker in busy:
+                if worker.connection in ready or worker.process.sentinel in ready:
+                    self._collect(worker)
+
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            try:
+                worker.connection.send_bytes(b"")
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(WORKER_STOP_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.connection.close()
+
+    def _collect(self, worker):
+        """Receive the outcome of a busy worker's task (or notice that the worker died)."""
+        try:
+            if not worker.connection.poll():
+                raise EOFError
+            (succeeded, value), retire = worker.connection.recv()
+        except (EOFError, OSError):
+            worker.process.join()
+            succeeded, retire = False, True
+            value = BrokenProcessPool(
+                f"A worker process died while running a task (exit code {worker.process.exitcode})"
+            )
+        except Exception as e:
+            # The outcome could not be unpickled
+            succeeded, value, retire = False, e, False
+
+        future, worker.future = worker.future, None
+        with self._lock:
+            self._busy.remove(worker)
+            if not retire:
+                self._idle.append(worker)
+
+        if succeeded:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+        if retire:
+            self._replace(worker)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """
+        Stop the workers once the queued tasks have run.
+
+        Args:
+            wait (bool): Block until the workers have stopped.
+            cancel_futures (bool): Cancel the tasks that have not started instead of running them.
+        """
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for queue in self._queues.values():
+                    for future, _ in queue:
+                        future.cancel()
+                self._queues.clear()
+        self._wake()
+        if wait:
+            self._dispatcher.join()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool(max_workers, initializer=None, initargs=()):
+    """
+    Return the process-wide worker pool, starting it on first use.
+
+    The arguments only apply when the pool is started. `AUDITFLOW_WORKER_MAX_TASKS` (default: 100)
+    and `AUDITFLOW_WORKER_MAX_RSS_MB` (default: 1024) set when workers are replaced; 0 disables
+    either limit.
+
+    Args:
+        max_workers (int): Number of worker processes.
+        initializer (callable): Called in each worker with `initargs` before it takes tasks.
+        initargs (tuple): Arguments of `initializer`.
+
+    Returns:
+        WorkerPool: The shared pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_tasks = int(os.environ.get(WORKER_MAX_TASKS_ENV, DEFAULT_WORKER_MAX_TASKS))
+            max_rss_mb = float(os.environ.get(WORKER_MAX_RSS_MB_ENV, DEFAULT_WORKER_MAX_RSS_MB))
+            _pool = WorkerPool(
+                max_workers,
+                initializer=initializer,
+                initargs=initargs,
+                max_tasks=max_tasks,
+                max_rss_bytes=int(max_rss_mb * 1024 * 1024),
+            )
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
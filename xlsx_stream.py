@@ -0,0 +1,1183 @@
+#xlsx_stream.py
+import html
+import io
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import zipfile
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE, _TYPES, get_time_format, get_type
+from openpyxl.cell.rich_text import CellRichText
+from openpyxl.compat import NUMERIC_TYPES, safe_string
+from openpyxl.formatting.formatting import ConditionalFormattingList
+from openpyxl.formula.translate import Translator
+from openpyxl.styles import Alignment
+from openpyxl.styles.differential import DifferentialStyle
+from openpyxl.styles.proxy import StyleProxy
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_REVERSE, is_date_format
+from openpyxl.utils import column_index_from_string, coordinate_to_tuple, get_column_letter, range_boundaries
+from openpyxl.utils.datetime import to_excel
+from openpyxl.utils.exceptions import IllegalCharacterError
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+from openpyxl.xml.functions import tostring
+
+from data_cache import file_sha256
+from file_utils import set_default_file_mode
+from helper_funcs import (
+    _xml_local_name,
+    load_working_paper,
+    move_cell_range,
+    read_shared_strings,
+    save_working_paper,
+    shift_formula_rows,
+    shift_sqref,
+    split_formula_at_rows
+)
+from stage_trace import span
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Set to "0" to write every working paper with openpyxl
+STREAM_WRITER_ENV = "AUDITFLOW_STREAM_WRITER"
+
+# Rows are written to the archive in batches of this many rows
+ROW_BATCH_SIZE = 1000
+
+RELATIONSHIP_TYPES = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+# Worksheet elements that follow <mergeCells> and <conditionalFormatting> (ECMA-376 CT_Worksheet order)
+_AFTER_CONDITIONAL_FORMATTING = (
+    "dataValidations", "hyperlinks", "printOptions", "pageMargins", "pageSetup", "headerFooter",
+    "rowBreaks", "colBreaks", "customProperties", "cellWatches", "ignoredErrors", "smartTags",
+    "drawing", "legacyDrawing", "legacyDrawingHF", "drawingHF", "picture", "oleObjects", "controls",
+    "webPublishItems", "tableParts", "extLst",
+)
+_AFTER_MERGE_CELLS = ("phoneticPr", "conditionalFormatting") + _AFTER_CONDITIONAL_FORMATTING
+
+_ROW = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_CELL = re.compile(r'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+_ATTRIBUTE = re.compile(r'([\w:]+)="([^"]*)"')
+_FORMULA = re.compile(r'<f\b([^>]*?)(?:/>|>(.*?)</f>)', re.S)
+_VALUE = re.compile(r'<v>(.*?)</v>', re.S)
+_TEXT = re.compile(r'<t\b[^>]*>(.*?)</t>', re.S)
+_XF = re.compile(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', re.S)
+_DXF = re.compile(r'<dxf\b[^>]*?(?:/>|>.*?</dxf>)', re.S)
+_MERGE_CELL = re.compile(r'<mergeCell ref="([^"]*)"\s*/>')
+_MERGE_CELLS = re.compile(r'<mergeCells\b[^>]*?(?:/>|>.*?</mergeCells>)', re.S)
+_PRIORITY = re.compile(r'<cfRule\b[^>]*\bpriority="(\d+)"')
+_SHEET_PROTECTION = re.compile(r'<sheetProtection\b[^>]*\bsheet="(?:1|true)"[^>]*/>')
+
+
+class StreamWriterUnsupported(Exception):
+    """A template or an edit the streaming writer cannot reproduce; the working paper is written with openpyxl instead."""
+
+
+def stream_writer_enabled():
+    """Return whether working papers may be written with the streaming writer (see `STREAM_WRITER_ENV`)."""
+    return os.environ.get(STREAM_WRITER_ENV, "1") != "0"
+
+
+def write_working_paper(working_paper_path, processed_file_path, populate):
+    """
+    Fill a working paper template and save the result.
+
+    The template is opened as an `XlsxTemplatePatch`: `populate` records its edits on the sheets it
+    touches, and only those sheets are rewritten when the copy of the template is saved. If the
+    streaming writer is disabled, or cannot reproduce the template or one of the edits, the template
+    is loaded with openpyxl, populated again and saved with `save_working_paper`.
+
+    Args:
+        working_paper_path (str): Path to the working paper template.
+        processed_file_path (str): Path of the working paper to write.
+        populate (callable): Called with the workbook (an `XlsxTemplatePatch` or an openpyxl
+            workbook) and fills it.
+
+    Returns:
+        None
+    """
+    if stream_writer_enabled():
+        try:
+            with XlsxTemplatePatch(working_paper_path) as working_paper:
+                populate(working_paper)
+                # The streaming writer stamps the inserted rows and writes the recorded cells here
+                with span("save") as save_span:
+                    working_paper.save(processed_file_path)
+                    save_span.count(bytes=os.path.getsize(processed_file_path))
+            return
+        except StreamWriterUnsupported as e:
+            logger.warning("Writing %s with openpyxl - %s", os.path.basename(processed_file_path), e)
+
+    with span("load"):
+        working_paper_wb, _ = load_working_paper(working_paper_path, sh_n=0)
+    populate(working_paper_wb)
+    save_working_paper(working_paper_wb, processed_file_path)
+
+
+def _render_attributes(attributes):
+    return "".join(f' {name}="{value}"' for name, value in attributes.items())
+
+
+def _quote(value):
+    return escape(value, {'"': "&quot;"})
+
+
+def _insert_element(xml, element, following_tags):
+    """Insert an element before the first of `following_tags` (or before the closing root tag)."""
+    match = re.search(r'<(?:%s)\b' % "|".join(following_tags), xml)
+    position = match.start() if match else xml.rfind("</")
+    return xml[:position] + element + xml[position:]
+
+
+def _set_count(xml, tag, count):
+    return re.sub(r'(<%s\b[^>]*?\bcount=")\d+(")' % tag, rf'\g<1>{count}\g<2>', xml, count=1)
+
+
+def _parse_row(row_xml):
+    """Split a <row> element into its attributes and its cells ({column: [attributes, inner xml]})."""
+    open_end = row_xml.index(">")
+    attributes = dict(_ATTRIBUTE.findall(row_xml[4:open_end]))
+    cells = {}
+    if row_xml[open_end - 1] != "/":
+        for match in _CELL.finditer(row_xml, open_end + 1):
+            cell_attributes = dict(_ATTRIBUTE.findall(match.group(1)))
+            if "r" not in cell_attributes:
+                raise StreamWriterUnsupported("a cell without a reference")
+            column = column_index_from_string(cell_attributes["r"].rstrip("0123456789"))
+            cells[column] = [cell_attributes, match.group(2) or ""]
+    return attributes, cells
+
+
+def _render_row(attributes, cells):
+    parts = [f"<row{_render_attributes(attributes)}>"]
+    for column in sorted(cells):
+        cell_attributes, inner = cells[column]
+        parts.append(f"<c{_render_attributes(cell_attributes)}>{inner}</c>" if inner else f"<c{_render_attributes(cell_attributes)}/>")
+    parts.append("</row>")
+    return "".join(parts)
+
+
+def _check_string(value):
+    # The checks of openpyxl's Cell.check_string
+    if not isinstance(value, str):
+        value = str(value, "utf-8")
+    value = str(value)[:32767]
+    if next(ILLEGAL_CHARACTERS_RE.finditer(value), None):
+        raise IllegalCharacterError(f"{value} cannot be used in worksheets.")
+    return value
+
+
+def _bind_value(value):
+    """
+    Infer the data type of a value assigned to a cell, as openpyxl does.
+
+    Raises the errors openpyxl raises on assignment; returns (None, reason) for values the streaming
+    writer does not write.
+
+    Returns:
+        tuple: (data type, value).
+    """
+    if value is None:
+        return "n", None
+    value_class = type(value)
+    data_type = _TYPES.get(value_class) or get_type(value_class, value)
+    if data_type is None:
+        raise ValueError("Cannot convert {0!r} to Excel".format(value))
+    if data_type == "s":
+        if isinstance(value, CellRichText):
+            return None, "rich text"
+        value = _check_string(value)
+        if len(value) > 1 and value.startswith("="):
+            data_type = "f"
+        elif value in ERROR_CODES:
+            data_type = "e"
+    elif data_type == "f":
+        return None, "array and data table formulas"
+    elif data_type == "d" and getattr(value, "tzinfo", None) is not None:
+        return None, "dates with a timezone"
+    elif data_type not in ("n", "b", "d"):
+        return None, f"cell values of type {value_class.__name__}"
+    return data_type, value
+
+
+def _render_value(data_type, value):
+    """
+    Return the type attribute and the content of a cell holding a value, as openpyxl writes them.
+
+    Raises:
+        StreamWriterUnsupported: For a value the writer has no rendering for, so the working paper is
+            written with openpyxl rather than saved with a cell Excel cannot read.
+    """
+    if data_type == "f":
+        return None, f"<f>{escape(value[1:])}</f>"
+    if data_type == "s":
+        if value == "":
+            return "inlineStr", ""
+        space = ' xml:space="preserve"' if value != value.strip() else ""
+        return "inlineStr", f"<is><t{space}>{escape(value)}</t></is>"
+    if value is None:
+        return None, ""
+    if data_type == "d":
+        # Not a Time (pandas NaT) has no serial and is written as an empty cell, as openpyxl does
+        value = to_excel(value)
+        if value is None:
+            return None, ""
+        data_type = "n"
+    if data_type == "e":
+        return "e", f"<v>{escape(value)}</v>"
+    if data_type not in ("n", "b") or not isinstance(value, NUMERIC_TYPES):
+        raise StreamWriterUnsupported(f"a cell value of type {type(value).__name__}")
+    text = safe_string(value)
+    if not text:
+        # NaN and infinity
+        return None, ""
+    return (data_type if data_type != "n" else None), f"<v>{text}</v>"
+
+
+class _StylesPatch:
+    """
+    The styles part of a template, with the cell formats and differential formats added while the
+    working paper is written. The template's own formats keep their ids.
+    """
+
+    def __init__(self, xml):
+        self.xml = xml
+        cell_xfs = re.search(r'<cellXfs\b[^>]*>(.*?)</cellXfs>', xml, re.S)
+        if cell_xfs is None:
+            raise StreamWriterUnsupported("the template has no cell formats")
+        self.cell_xfs = _XF.findall(cell_xfs.group(1))
+        self.template_xf_count = len(self.cell_xfs)
+        dxfs = re.search(r'<dxfs\b[^>]*>(.*?)</dxfs>', xml, re.S)
+        self.dxfs = _DXF.findall(dxfs.group(1)) if dxfs else []
+        self.template_dxf_count = len(self.dxfs)
+        self.number_formats = {
+            int(attributes["numFmtId"]): html.unescape(attributes["formatCode"])
+            for attributes in (dict(_ATTRIBUTE.findall(m)) for m in re.findall(r'<numFmt\b([^>]*)/>', xml))
+        }
+        self.new_number_formats = {}
+        self._derived = {}
+        self._alignments = {}
+
+    @property
+    def changed(self):
+        return len(self.cell_xfs) > self.template_xf_count or len(self.dxfs) > self.template_dxf_count
+
+    def _xf(self, style_id):
+        try:
+            return self.cell_xfs[style_id]
+        except IndexError:
+            raise StreamWriterUnsupported(f"unknown cell format {style_id}")
+
+    def number_format(self, style_id):
+        """Return the number format code of a cell format."""
+        number_format_id = int(dict(_ATTRIBUTE.findall(self._xf(style_id).split(">", 1)[0])).get("numFmtId", 0))
+        if number_format_id in self.number_formats:
+            return self.number_formats[number_format_id]
+        return BUILTIN_FORMATS.get(number_format_id, "General")
+
+    def alignment(self, style_id):
+        """Return the alignment of a cell format (shared between calls; not to be modified)."""
+        alignment = self._alignments.get(style_id)
+        if alignment is None:
+            alignment_xml = re.search(r'<alignment\b[^>]*/>', self._xf(style_id))
+            alignment = Alignment() if alignment_xml is None else Alignment.from_tree(ElementTree.fromstring(alignment_xml.group(0)))
+            self._alignments[style_id] = alignment
+        return alignment
+
+    def derive(self, style_id, alignment=None, number_format=None):
+        """
+        Return the id of a cell format equal to `style_id` except for its alignment or number format,
+        adding it to the cell formats if needed.
+        """
+        if alignment is not None and alignment == self.alignment(style_id):
+            alignment = None
+        if number_format is not None and number_format == self.number_format(style_id):
+            number_format = None
+        if alignment is None and number_format is None:
+            return style_id
+
+        key = (style_id, repr(alignment), number_format)
+        derived_id = self._derived.get(key)
+        if derived_id is None:
+            xf = self._xf(style_id)
+            open_tag, _, children = xf.partition(">")
+            if open_tag.endswith("/"):
+                open_tag, children = open_tag[:-1], ""
+            else:
+                children = children[:-len("</xf>")]
+            attributes = dict(_ATTRIBUTE.findall(open_tag))
+            if alignment is not None:
+                children = re.sub(r'<alignment\b[^>]*/>', "", children)
+                alignment_xml = tostring(alignment.to_tree()).decode("utf-8")
+                children = alignment_xml + children
+                attributes["applyAlignment"] = "1"
+            if number_format is not None:
+                attributes["numFmtId"] = str(self._number_format_id(number_format))
+                attributes["applyNumberFormat"] = "1"
+            self.cell_xfs.append(f"<xf{_render_attributes(attributes)}>{children}</xf>" if children else f"<xf{_render_attributes(attributes)}/>")
+            derived_id = len(self.cell_xfs) - 1
+            self._derived[key] = derived_id
+        return derived_id
+
+    def _number_format_id(self, number_format):
+        if number_format in BUILTIN_FORMATS_REVERSE:
+            return BUILTIN_FORMATS_REVERSE[number_format]
+        for number_format_id, code in self.number_formats.items():
+            if code == number_format:
+                return number_format_id
+        number_format_id = max([163, *self.number_formats]) + 1
+        self.number_formats[number_format_id] = number_format
+        self.new_number_formats[number_format_id] = number_format
+        return number_format_id
+
+    def add_dxf(self, dxf):
+        """Add a differential format (of a conditional formatting rule) and return its id."""
+        self.dxfs.append(tostring(dxf.to_tree()).decode("utf-8"))
+        return len(self.dxfs) - 1
+
+    def render(self):
+        """Return the styles part with the added formats."""
+        xml = self.xml
+        if self.new_number_formats:
+            number_formats = "".join(
+                f'<numFmt numFmtId="{number_format_id}" formatCode="{_quote(code)}"/>'
+                for number_format_id, code in self.new_number_formats.items()
+            )
+            if re.search(r'<numFmts\b', xml):
+                xml = xml.replace("</numFmts>", number_formats + "</numFmts>", 1)
+                xml = _set_count(xml, "numFmts", len(self.number_formats))
+            else:
+                root_end = xml.index(">", xml.index("<styleSheet")) + 1
+                xml = xml[:root_end] + f'<numFmts count="{len(self.new_number_formats)}">{number_formats}</numFmts>' + xml[root_end:]
+        if len(self.cell_xfs) > self.template_xf_count:
+            xml = xml.replace("</cellXfs>", "".join(self.cell_xfs[self.template_xf_count:]) + "</cellXfs>", 1)
+            xml = _set_count(xml, "cellXfs", len(self.cell_xfs))
+        if len(self.dxfs) > self.template_dxf_count:
+            new_dxfs = "".join(self.dxfs[self.template_dxf_count:])
+            if "</dxfs>" in xml:
+                xml = xml.replace("</dxfs>", new_dxfs + "</dxfs>", 1)
+                xml = _set_count(xml, "dxfs", len(self.dxfs))
+            else:
+                dxfs = f'<dxfs count="{len(self.dxfs)}">{new_dxfs}</dxfs>'
+                empty_dxfs = re.search(r'<dxfs\b[^>]*/>', xml)
+                if empty_dxfs:
+                    xml = xml[:empty_dxfs.start()] + dxfs + xml[empty_dxfs.end():]
+                else:
+                    xml = _insert_element(xml, dxfs, ("tableStyles", "colors", "extLst"))
+        return xml
+
+
+class _TemplateSheet:
+    """
+    The XML of a template worksheet, split into the part before its rows, its rows (kept as text
+    until they are changed) and the part after them. Shared formulas are expanded to plain formulas,
+    so every row can be moved or copied on its own.
+    """
+
+    def __init__(self, xml):
+        start = xml.find("<sheetData")
+        if start < 0:
+            raise StreamWriterUnsupported("a worksheet without cell data")
+        open_end = xml.index(">", start)
+        if xml[open_end - 1] == "/":
+            self.head, body, self.tail = xml[:start] + "<sheetData>", "", "</sheetData>" + xml[open_end + 1:]
+        else:
+            close = xml.index("</sheetData>", open_end)
+            self.head, body, self.tail = xml[:open_end + 1], xml[open_end + 1:close], xml[close:]
+
+        self.rows = {}
+        for match in _ROW.finditer(body):
+            row_number = re.search(r'\br="(\d+)"', match.group(0)[:match.group(0).index(">")])
+            if row_number is None:
+                raise StreamWriterUnsupported("a row without a row number")
+            self.rows[int(row_number.group(1))] = match.group(0)
+        self.expanded = {}  # row -> parsed row, for the rows whose shared formulas were expanded
+        self._parsed = {}  # row -> parsed row, for the rows read so far
+        self._expand_shared_formulas()
+
+    def _expand_shared_formulas(self):
+        masters = {}
+        for row, row_xml in self.rows.items():
+            if 't="shared"' not in row_xml:
+                continue
+            attributes, cells = _parse_row(row_xml)
+            for cell in cells.values():
+                formula = _FORMULA.search(cell[1])
+                if formula is None or dict(_ATTRIBUTE.findall(formula.group(1))).get("t") != "shared":
+                    continue
+                shared_index = dict(_ATTRIBUTE.findall(formula.group(1))).get("si")
+                coordinate = cell[0]["r"]
+                if formula.group(2):
+                    text = html.unescape(formula.group(2))
+                    masters[shared_index] = (f"={text}", coordinate)
+                elif shared_index in masters:
+                    master_formula, master_coordinate = masters[shared_index]
+                    text = Translator(master_formula, origin=master_coordinate).translate_formula(coordinate)[1:]
+                else:
+                    raise StreamWriterUnsupported(f"the shared formula of {coordinate} has no master cell")
+                cell[1] = f"{cell[1][:formula.start()]}<f>{escape(text)}</f>{cell[1][formula.end():]}"
+            self.expanded[row] = (attributes, cells)
+
+    def parsed_row(self, row):
+        """Return the parsed template row (attributes, cells), or None if the row is not in the template. Not to be modified."""
+        parsed = self.expanded.get(row) or self._parsed.get(row)
+        if parsed is None and row in self.rows:
+            parsed = self._parsed[row] = _parse_row(self.rows[row])
+        return parsed
+
+    def row(self, row):
+        """Return a parsed copy of a template row (attributes, cells), or None if the row is not in the template."""
+        parsed = self.parsed_row(row)
+        if parsed is None:
+            return None
+        attributes, cells = parsed
+        return dict(attributes), {column: [dict(cell[0]), cell[1]] for column, cell in cells.items()}
+
+
+class _DimensionPatch:
+    """The changes to a row or column dimension (None leaves the template's setting)."""
+
+    def __init__(self):
+        self.hidden = None
+        self.height = None
+
+
+class _DimensionPatches(dict):
+    def __missing__(self, key):
+        dimension = self[key] = _DimensionPatch()
+        return dimension
+
+
+class PatchCell:
+    """A cell of a `SheetPatch`: reads the template (or the recorded edits) and records writes."""
+
+    __slots__ = ("parent", "row", "column")
+
+    def __init__(self, parent, row, column):
+        self.parent = parent
+        self.row = row
+        self.column = column
+
+    @property
+    def coordinate(self):
+        return f"{get_column_letter(self.column)}{self.row}"
+
+    @property
+    def value(self):
+        return self.parent._get_value(self.row, self.column)
+
+    @value.setter
+    def value(self, value):
+        self.parent._set_value(self.row, self.column, value)
+
+    @property
+    def alignment(self):
+        return StyleProxy(self.parent._workbook.styles.alignment(self.parent._style_id(self.row, self.column)))
+
+    @alignment.setter
+    def alignment(self, alignment):
+        self.parent._set_style(self.row, self.column, alignment=alignment)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        # Raised rather than AttributeError, so write_working_paper writes the working paper with openpyxl
+        self.parent._workbook.defer_unsupported(f"cell attribute {name!r}")
+        raise StreamWriterUnsupported(f"cell attribute {name!r}")
+
+
+class SheetPatch:
+    """
+    A template worksheet opened for streaming, with the part of the openpyxl worksheet API the TP
+    modules use (cells, merged cells, row and column dimensions, conditional formatting).
+
+    Edits are recorded rather than applied. When the workbook is saved the sheet XML is written in
+    one pass: the template rows above the table as they are, the table's new rows stamped from the
+    reference row, then the footer rows with their row numbers and formulas moved down. Merged cells,
+    conditional formatting, data validations and the dimension are moved along with the footer.
+
+    Args:
+        workbook (XlsxTemplatePatch): The workbook the sheet belongs to.
+        title (str): The sheet title.
+        part_name (str): The archive path of the sheet XML.
+        template (_TemplateSheet): The template's XML of the sheet (shared, never modified).
+    """
+
+    def __init__(self, workbook, title, part_name, template):
+        self._workbook = workbook
+        self.title = title
+        self.part_name = part_name
+        self._template = template
+        self._values = {}  # row -> {column: (data type, value)}
+        self._styles = {}  # row -> {column: cell format id}
+        self._table = None  # (insert row, reference row, number of inserted rows)
+        self._merged_cells = None  # parsed on first access
+        self.row_dimensions = _DimensionPatches()
+        self.column_dimensions = _DimensionPatches()
+        self.conditional_formatting = ConditionalFormattingList()
+
+    @property
+    def merged_cells(self):
+        if self._merged_cells is None:
+            self._merged_cells = MultiCellRange(_MERGE_CELL.findall(self._template.tail))
+        return self._merged_cells
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        # Raised rather than AttributeError, so write_working_paper writes the working paper with openpyxl
+        self._workbook.defer_unsupported(f"worksheet attribute {name!r}")
+        raise StreamWriterUnsupported(f"worksheet attribute {name!r}")
+
+    def __getitem__(self, coordinate):
+        row, column = coordinate_to_tuple(coordinate)
+        return PatchCell(self, row, column)
+
+    def __setitem__(self, coordinate, value):
+        self[coordinate].value = value
+
+    def cell(self, row, column, value=None):
+        cell = PatchCell(self, row, column)
+        if value is not None:
+            cell.value = value
+        return cell
+
+    def merge_cells(self, range_string=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        self.merged_cells.add(CellRange(range_string, min_col=start_column, min_row=start_row, max_col=end_column, max_row=end_row))
+
+    def unmerge_cells(self, range_string=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        cell_range = CellRange(range_string, min_col=start_column, min_row=start_row, max_col=end_column, max_row=end_row)
+        if cell_range not in self.merged_cells:
+            raise ValueError(f"Cell range {cell_range.coord} is not merged")
+        self.merged_cells.remove(cell_range)
+
+    def extend_table(self, layout, num_rows_to_add):
+        """
+        Grow a template table by `num_rows_to_add` rows (see `helper_funcs.extend_table`).
+
+        The rows are only numbered here; they are stamped and the footer is moved when the sheet is written.
+
+        Args:
+            layout (dict): The table entry of the template manifest.
+            num_rows_to_add (int): The number of rows to insert.
+        """
+        if num_rows_to_add <= 0:
+            return
+        if self._table is not None:
+            self._workbook.defer_unsupported(f"a second table on {self.title}")
+            return
+        insert_row, reference_row = layout["insert_row"], layout["reference_row"]
+        for row, row_xml in self._template.rows.items():
+            if row >= insert_row and re.search(r'<f\b[^>]*\bt="(?:array|dataTable)"', row_xml):
+                self._workbook.defer_unsupported(f"an array formula below the table on {self.title}")
+        self._table = (insert_row, reference_row, num_rows_to_add)
+
+        # Move what was already recorded at or below the insert row, and the merged ranges
+        for records in (self._values, self._styles, self.row_dimensions):
+            for row in sorted((row for row in records if row >= insert_row), reverse=True):
+                records[row + num_rows_to_add] = records.pop(row)
+        for merged_range in [merged_range for merged_range in self.merged_cells.ranges if merged_range.max_row >= insert_row]:
+            self.merged_cells.remove(merged_range)
+            move_cell_range(merged_range, insert_row, num_rows_to_add)
+            self.merged_cells.add(merged_range)
+
+    # Cell values and formats
+
+    def _source(self, row):
+        """Return (template row, True if the row is stamped from the reference row) for a row of the written sheet."""
+        if self._table is None:
+            return row, False
+        insert_row, reference_row, num_rows = self._table
+        if row < insert_row:
+            return row, False
+        if row < insert_row + num_rows:
+            return reference_row, True
+        return row - num_rows, False
+
+    def _template_cell(self, row, column):
+        source_row, stamped = self._source(row)
+        parsed = self._template.parsed_row(source_row)
+        cell = parsed[1].get(column) if parsed is not None else None
+        return cell, stamped
+
+    def _style_id(self, row, column):
+        style_id = self._styles.get(row, {}).get(column)
+        if style_id is not None:
+            return style_id
+        cell, _ = self._template_cell(row, column)
+        return int(cell[0].get("s", 0)) if cell is not None else 0
+
+    def _get_value(self, row, column):
+        values = self._values.get(row)
+        if values is not None and column in values:
+            return values[column][1]
+        cell, stamped = self._template_cell(row, column)
+        if cell is None:
+            return None
+        value = self._workbook.decode_cell(*cell)
+        if stamped:
+            if isinstance(value, str) and value.startswith("="):
+                return str(row).join(split_formula_at_rows(value))
+            return value or None
+        return value
+
+    def _set_value(self, row, column, value):
+        data_type, value = _bind_value(value)
+        if data_type is None:
+            self._workbook.defer_unsupported(value)
+            return
+        if data_type == "d":
+            # openpyxl gives dates without a date format one
+            style_id = self._style_id(row, column)
+            if not is_date_format(self._workbook.styles.number_format(style_id)):
+                self._set_style(row, column, number_format=get_time_format(type(value)))
+        self._values.setdefault(row, {})[column] = (data_type, value)
+
+    def _set_style(self, row, column, alignment=None, number_format=None):
+        style_id = self._workbook.styles.derive(self._style_id(row, column), alignment=alignment, number_format=number_format)
+        self._styles.setdefault(row, {})[column] = style_id
+
+    # Writing
+
+    def _prototype(self):
+        """
+        Compile the reference row: the attributes of the new rows and, per column, the attributes of the
+        new cells, their content and the parts of their formula (split where the row number goes).
+        """
+        insert_row, reference_row, _ = self._table
+        row_attributes, cells = self._template.parsed_row(reference_row) or ({}, {})
+        prototype = []
+        for column in sorted(cells):
+            cell_attributes, inner = cells[column]
+            attributes = {"s": cell_attributes["s"]} if cell_attributes.get("s", "0") != "0" else {}
+            formula = _FORMULA.search(inner)
+            if formula is not None and formula.group(2):
+                parts = split_formula_at_rows("=" + html.unescape(formula.group(2)))
+                parts[0] = parts[0][1:]
+                prototype.append((column, attributes, None, [escape(part) for part in parts]))
+            elif self._workbook.decode_cell(cell_attributes, inner):
+                # A constant is copied as it is (shared strings keep their index)
+                if "t" in cell_attributes:
+                    attributes["t"] = cell_attributes["t"]
+                prototype.append((column, attributes, inner, None))
+            elif attributes:
+                prototype.append((column, attributes, "", None))
+
+        attributes = {}
+        if "ht" in row_attributes:
+            attributes["ht"] = row_attributes["ht"]
+            attributes["customHeight"] = "1"
+        return attributes, prototype
+
+    def _apply_dimension(self, attributes, row):
+        dimension = self.row_dimensions.get(row)
+        if dimension is None:
+            return
+        if dimension.hidden is not None:
+            if dimension.hidden:
+                attributes["hidden"] = "1"
+            else:
+                attributes.pop("hidden", None)
+        if dimension.height is not None:
+            attributes["ht"] = safe_string(dimension.height)
+            attributes["customHeight"] = "1"
+
+    def _apply_cells(self, row, cells):
+        """Apply the recorded formats and values of a row to its parsed cells."""
+        for column, style_id in self._styles.get(row, {}).items():
+            cell = cells.setdefault(column, [{"r": f"{get_column_letter(column)}{row}"}, ""])
+            if style_id:
+                cell[0]["s"] = str(style_id)
+            else:
+                cell[0].pop("s", None)
+        for column, (data_type, value) in self._values.get(row, {}).items():
+            cell = cells.get(column)
+            attributes = {"r": f"{get_column_letter(column)}{row}"}
+            if cell is not None and "s" in cell[0]:
+                attributes["s"] = cell[0]["s"]
+            cell_type, inner = _render_value(data_type, value)
+            if cell_type:
+                attributes["t"] = cell_type
+            cells[column] = [attributes, inner]
+
+    def _render_template_row(self, source_row, row):
+        row_xml = self._template.rows[source_row]
+        moved = source_row != row
+        if not (moved or row in self._values or row in self._styles or row in self.row_dimensions or source_row in self._template.expanded):
+            return row_xml
+
+        attributes, cells = self._template.row(source_row)
+        attributes["r"] = str(row)
+        attributes.pop("spans", None)
+        if moved:
+            insert_row, _, num_rows = self._table
+            for column, cell in cells.items():
+                cell[0]["r"] = f"{get_column_letter(column)}{row}"
+                formula = _FORMULA.search(cell[1])
+                if formula is not None and formula.group(2):
+                    # The cached result is dropped with the moved formula; the workbook is recalculated on load
+                    shifted = shift_formula_rows("=" + html.unescape(formula.group(2)), insert_row, num_rows, self.title)
+                    cell[1] = f"<f{formula.group(1)}>{escape(shifted[1:])}</f>"
+                    cell[0].pop("t", None)
+        self._apply_dimension(attributes, row)
+        self._apply_cells(row, cells)
+        return _render_row(attributes, cells)
+
+    def _render_new_row(self, row):
+        attributes = {"r": str(row)}
+        self._apply_dimension(attributes, row)
+        cells = {}
+        self._apply_cells(row, cells)
+        return _render_row(attributes, cells)
+
+    def _stamped_rows(self, row_attributes, prototype):
+        insert_row, _, num_rows = self._table
+
+        # The cells of rows without edits are formatted straight from these templates
+        cell_templates = []
+        for column, attributes, inner, parts in prototype:
+            head = f'<c r="{get_column_letter(column)}'
+            tail = f'"{_render_attributes(attributes)}'
+            if parts is not None:
+                cell_templates.append((head, tail + "><f>", parts))
+            else:
+                cell_templates.append((head, f"{tail}>{inner}</c>" if inner else f"{tail}/>", None))
+        row_tail = _render_attributes(row_attributes)
+
+        for row in range(insert_row, insert_row + num_rows):
+            row_number = str(row)
+            if row not in self._values and row not in self._styles and row not in self.row_dimensions:
+                cells = "".join(
+                    f"{head}{row_number}{tail}{row_number.join(parts)}</f></c>" if parts is not None else f"{head}{row_number}{tail}"
+                    for head, tail, parts in cell_templates
+                )
+                yield f'<row r="{row_number}"{row_tail}>{cells}</row>'
+                continue
+
+            attributes = dict(r=row_number, **row_attributes)
+            self._apply_dimension(attributes, row)
+            cells = {}
+            for column, cell_attributes, inner, parts in prototype:
+                inner = f"<f>{row_number.join(parts)}</f>" if parts is not None else inner
+                cells[column] = [dict(r=f"{get_column_letter(column)}{row_number}", **cell_attributes), inner]
+            self._apply_cells(row, cells)
+            yield _render_row(attributes, cells)
+
+    def _render_rows(self, row_attributes, prototype):
+        """Yield the rows of the written sheet, in order."""
+        insert_row, _, num_rows = self._table or (None, None, 0)
+        entries = []
+        for source_row in self._template.rows:
+            entries.append((self._target_row(source_row), source_row))
+        if self._table is not None:
+            entries.append((insert_row, None))
+        covered = {row for row, _ in entries}
+        for row in set(self._values) | set(self._styles) | set(self.row_dimensions):
+            if row not in covered and not (self._table is not None and insert_row <= row < insert_row + num_rows):
+                entries.append((row, 0))
+        entries.sort(key=lambda entry: entry[0])
+
+        for row, source_row in entries:
+            if source_row is None:
+                yield from self._stamped_rows(row_attributes, prototype)
+            elif source_row == 0:
+                yield self._render_new_row(row)
+            else:
+                yield self._render_template_row(source_row, row)
+
+    def _target_row(self, source_row):
+        if self._table is None or source_row < self._table[0]:
+            return source_row
+        return source_row + self._table[2]
+
+    def _render_head(self):
+        head = self._template.head
+
+        # The dimension grows with the table and the written cells
+        dimension = re.search(r'<dimension ref="([^"]*)"\s*/>', head)
+        if dimension is not None:
+            min_col, min_row, max_col, max_row = range_boundaries(dimension.group(1))
+            max_row = max([max_row or min_row, *(self._target_row(row) for row in self._template.rows), *self._values])
+            if self._table is not None:
+                max_row = max(max_row, self._table[0] + self._table[2] - 1)
+            max_col = max([max_col or min_col, *(max(values) for values in self._values.values() if values)])
+            ref = f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}"
+            head = f"{head[:dimension.start()]}<dimension ref=\"{ref}\"/>{head[dimension.end():]}"
+
+        hidden_columns = {
+            column_index_from_string(letter): dimension.hidden
+            for letter, dimension in self.column_dimensions.items() if dimension.hidden is not None
+        }
+        if hidden_columns:
+            head = self._render_columns(head, hidden_columns)
+        return _SHEET_PROTECTION.sub("", head)
+
+    @staticmethod
+    def _render_columns(head, hidden_columns):
+        """Set the hidden flag of columns, splitting the <col> spans that cover them."""
+        cols = re.search(r'<cols>(.*?)</cols>', head, re.S)
+        spans = [dict(_ATTRIBUTE.findall(attributes)) for attributes in re.findall(r'<col\b([^>]*?)/>', cols.group(1))] if cols else []
+
+        columns = []
+        for span in spans:
+            start, end = int(span["min"]), int(span["max"])
+            for column in sorted(column for column in hidden_columns if start <= column <= end):
+                if column > start:
+                    columns.append(dict(span, min=str(start), max=str(column - 1)))
+                columns.append(dict(span, min=str(column), max=str(column)))
+                start = column + 1
+            if start <= end:
+                columns.append(dict(span, min=str(start), max=str(end)))
+        for column, hidden in hidden_columns.items():
+            if hidden and not any(int(span["min"]) <= column <= int(span["max"]) for span in spans):
+                columns.append({"min": str(column), "max": str(column)})
+
+        for span in columns:
+            if span["min"] == span["max"] and int(span["min"]) in hidden_columns:
+                if hidden_columns[int(span["min"])]:
+                    span["hidden"] = "1"
+                else:
+                    span.pop("hidden", None)
+        columns.sort(key=lambda span: int(span["min"]))
+        cols_xml = "<cols>" + "".join(f"<col{_render_attributes(span)}/>" for span in columns) + "</cols>"
+        if cols:
+            return head[:cols.start()] + cols_xml + head[cols.end():]
+        position = head.rindex("<sheetData")
+        return head[:position] + cols_xml + head[position:]
+
+    def prepare(self):
+        """Register the differential formats of the new conditional formatting rules (before the styles part is written)."""
+        tail = self._template.tail
+        priority = max((int(priority) for priority in _PRIORITY.findall(tail)), default=0)
+        empty_dxf = DifferentialStyle()
+        elements = []
+        for conditional_formatting in self.conditional_formatting:
+            for rule in conditional_formatting.rules:
+                priority += 1
+                rule.priority = priority
+                if rule.dxf and rule.dxf != empty_dxf:
+                    rule.dxfId = self._workbook.styles.add_dxf(rule.dxf)
+            elements.append(tostring(conditional_formatting.to_tree()).decode("utf-8"))
+        self._new_conditional_formatting = "".join(elements)
+
+    def _render_tail(self):
+        tail = self._template.tail
+        if self._table is not None:
+            insert_row, _, num_rows = self._table
+
+            def shift(match):
+                return f"{match.group(1)}{shift_sqref(match.group(2), insert_row, num_rows)}{match.group(3)}"
+
+            tail = re.sub(r'(<conditionalFormatting\b[^>]*?\bsqref=")([^"]*)(")', shift, tail)
+            tail = re.sub(r'(<dataValidation\b[^>]*?\bsqref=")([^"]*)(")', shift, tail)
+            tail = re.sub(r'(<xm:sqref>)([^<]*)(</xm:sqref>)', shift, tail)
+
+        # The template's merged cells stand unless they were read or changed
+        if self._merged_cells is not None:
+            merge_cells = ""
+            if self._merged_cells.ranges:
+                ranges = sorted(self._merged_cells.ranges, key=lambda cell_range: (cell_range.min_row, cell_range.min_col))
+                merge_cells = f'<mergeCells count="{len(ranges)}">' + "".join(f'<mergeCell ref="{cell_range.coord}"/>' for cell_range in ranges) + "</mergeCells>"
+            existing = _MERGE_CELLS.search(tail)
+            if existing is not None:
+                tail = tail[:existing.start()] + merge_cells + tail[existing.end():]
+            elif merge_cells:
+                tail = _insert_element(tail, merge_cells, _AFTER_MERGE_CELLS)
+
+        if self._new_conditional_formatting:
+            tail = _insert_element(tail, self._new_conditional_formatting, _AFTER_CONDITIONAL_FORMATTING)
+        return _SHEET_PROTECTION.sub("", tail)
+
+    def write(self, stream):
+        """Write the sheet XML to a binary stream."""
+        stream.write(self._render_head().encode("utf-8"))
+        row_attributes, prototype = self._prototype() if self._table is not None else ({}, [])
+        batch = []
+        for row_xml in self._render_rows(row_attributes, prototype):
+            batch.append(row_xml)
+            if len(batch) >= ROW_BATCH_SIZE:
+                stream.write("".join(batch).encode("utf-8"))
+                batch.clear()
+        stream.write("".join(batch).encode("utf-8"))
+        stream.write(self._render_tail().encode("utf-8"))
+
+
+class _Worksheets:
+    """The worksheets of an `XlsxTemplatePatch`, opened on first access."""
+
+    def __init__(self, workbook):
+        self._workbook = workbook
+
+    def __len__(self):
+        return len(self._workbook.sheet_parts)
+
+    def __getitem__(self, index):
+        return self._workbook.open_sheet(index)
+
+
+class _TemplatePackage:
+    """
+    The parts of a working paper template, read once per process and shared by every
+    `XlsxTemplatePatch` opened on it. Nothing here is modified after it is read.
+
+    Args:
+        template_path (str): Path to the working paper template.
+    """
+
+    def __init__(self, template_path):
+        with zipfile.ZipFile(template_path) as archive:
+            self.infos = [info for info in archive.infolist() if not info.is_dir()]
+            self.parts = {info.filename: archive.read(info) for info in self.infos}
+        self._sheets = {}
+        self._shared_strings = None
+        self._base_archives = {}  # frozenset of rewritten parts -> zip of every other part
+        self._lock = threading.Lock()
+        try:
+            self._read_workbook()
+        except (KeyError, ValueError, StopIteration, ElementTree.ParseError) as e:
+            raise StreamWriterUnsupported(f"unexpected package layout ({e!r})")
+
+    def _read_workbook(self):
+        package_rels = ElementTree.fromstring(self.parts["_rels/.rels"])
+        self.workbook_part = next(
+            rel.get("Target").lstrip("/") for rel in package_rels if rel.get("Type", "").endswith("/officeDocument")
+        )
+        workbook_dir, workbook_name = posixpath.split(self.workbook_part)
+        self.workbook_rels_part = posixpath.join(workbook_dir, "_rels", f"{workbook_name}.rels")
+
+        targets, self.related_parts = {}, {}
+        for rel in ElementTree.fromstring(self.parts[self.workbook_rels_part]):
+            target = rel.get("Target")
+            part = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(workbook_dir, target))
+            targets[rel.get("Id")] = part
+            self.related_parts[rel.get("Type", "").rsplit("/", 1)[-1]] = part
+
+        self.sheet_parts = []
+        for element in ElementTree.fromstring(self.parts[self.workbook_part]).iter():
+            if _xml_local_name(element.tag) == "sheet":
+                self.sheet_parts.append((element.get("name"), targets[element.get(f"{{{RELATIONSHIP_TYPES}}}id")]))
+
+    def sheet(self, part_name):
+        """Return the split XML of a worksheet (see `_TemplateSheet`)."""
+        sheet = self._sheets.get(part_name)
+        if sheet is None:
+            sheet = self._sheets[part_name] = _TemplateSheet(self.parts[part_name].decode("utf-8"))
+        return sheet
+
+    def shared_strings(self):
+        """Return the text of the shared strings, by index."""
+        if self._shared_strings is None:
+            shared_strings_part = self.related_parts.get("sharedStrings")
+            shared_strings = []
+            if shared_strings_part is not None:
+                shared_strings = read_shared_strings(io.BytesIO(self.parts[shared_strings_part]))
+            self._shared_strings = shared_strings
+        return self._shared_strings
+
+    def _patch_part(self, name, data):
+        """Return the bytes of an untouched part, adjusted where the package or the workbook settings require it."""
+        if name == self.workbook_part:
+            xml = data.decode("utf-8")
+            calculation = re.search(r'<calcPr\b[^>]*?/>', xml)
+            if calculation is None:
+                xml = _insert_element(xml, '<calcPr fullCalcOnLoad="1"/>', ("oleSize", "customWorkbookViews", "pivotCaches", "smartTagPr", "smartTagTypes", "webPublishing", "fileRecoveryPr", "webPublishObjects", "extLst"))
+            elif "fullCalcOnLoad" not in calculation.group(0):
+                xml = xml[:calculation.end() - 2] + ' fullCalcOnLoad="1"/>' + xml[calculation.end():]
+            return xml.encode("utf-8")
+        calc_chain = self.related_parts.get("calcChain")
+        if calc_chain is not None and name == self.workbook_rels_part:
+            return re.sub(rb'<Relationship\b[^>]*/calcChain"[^>]*/>', b"", data)
+        if calc_chain is not None and name == "[Content_Types].xml":
+            return re.sub(rb'<Override\b[^>]*PartName="/%s"[^>]*/>' % re.escape(calc_chain.encode("utf-8")), b"", data)
+        if name in (part for _, part in self.sheet_parts) and b"<sheetProtection" in data:
+            return _SHEET_PROTECTION.sub("", data.decode("utf-8")).encode("utf-8")
+        return data
+
+    def base_archive(self, rewritten_parts):
+        """
+        Return a zip archive (bytes) of every part except `rewritten_parts` and the calculation chain.
+
+        The archive is built once per set of rewritten parts, so the untouched parts are compressed
+        once per process rather than once per working paper.
+        """
+        with self._lock:
+            archive = self._base_archives.get(rewritten_parts)
+            if archive is None:
+                calc_chain = self.related_parts.get("calcChain")
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as target:
+                    for info in self.infos:
+                        if info.filename != calc_chain and info.filename not in rewritten_parts:
+                            target.writestr(info, self._patch_part(info.filename, self.parts[info.filename]))
+                archive = self._base_archives[rewritten_parts] = buffer.getvalue()
+        return archive
+
+
+# absolute template path -> (template digest, _TemplatePackage)
+_packages = {}
+_packages_lock = threading.Lock()
+
+
+def _load_package(template_path):
+    """Return the parts of a template, reading them again only when the template's SHA-256 changes."""
+    abs_path = os.path.abspath(template_path)
+    digest = file_sha256(abs_path)
+    with _packages_lock:
+        entry = _packages.get(abs_path)
+    if entry is None or entry[0] != digest:
+        entry = (digest, _TemplatePackage(abs_path))
+        with _packages_lock:
+            _packages[abs_path] = entry
+    return entry[1]
+
+
+def preload_template(template_path):
+    """
+    Read a template ahead of its first job, so the first working paper written from it starts warm.
+
+    The template's parts, worksheets and shared strings are parsed into the process-wide package
+    cache. If the streaming writer is disabled or cannot handle the template, the openpyxl template
+    cache is filled instead.
+
+    Args:
+        template_path (str): Path to the working paper template.
+
+    Returns:
+        None
+    """
+    if stream_writer_enabled():
+        try:
+            package = _load_package(template_path)
+            for _, part_name in package.sheet_parts:
+                package.sheet(part_name)
+            package.shared_strings()
+            return
+        except StreamWriterUnsupported:
+            pass
+    load_working_paper(template_path, sh_n=0)
+
+
+class XlsxTemplatePatch:
+    """
+    A working paper template opened for the streaming writer.
+
+    Worksheets are opened on first access (see `SheetPatch`); `save` writes a copy of the template
+    in which only those worksheets are rewritten. The styles part is rewritten only when formats were
+    added, the calculation chain is dropped and the workbook is set to recalculate when it is opened.
+    Every other part is copied unchanged. Sheet protection is removed, as `parse_working_paper` does.
+
+    The template's parts are read once per process and shared between jobs (see `_TemplatePackage`).
+
+    Args:
+        template_path (str): Path to the working paper template.
+    """
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self._package = _load_package(template_path)
+        self._sheets = {}
+        self._styles = None
+        self._unsupported = []
+        self.related_parts = self._package.related_parts
+        self.sheet_parts = self._package.sheet_parts
+        self.worksheets = _Worksheets(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Drop the recorded edits."""
+        self._sheets.clear()
+        self._styles = None
+
+    def defer_unsupported(self, reason):
+        """Record an edit the streaming writer cannot reproduce; `save` then raises `StreamWriterUnsupported`."""
+        self._unsupported.append(reason)
+
+    @property
+    def styles(self):
+        if self._styles is None:
+            styles_part = self.related_parts.get("styles")
+            if styles_part is None:
+                raise StreamWriterUnsupported("the template has no styles part")
+            self._styles = _StylesPatch(self._package.parts[styles_part].decode("utf-8"))
+        return self._styles
+
+    def open_sheet(self, index):
+        title, part_name = self.sheet_parts[index]
+        sheet = self._sheets.get(part_name)
+        if sheet is None:
+            sheet = self._sheets[part_name] = SheetPatch(self, title, part_name, self._package.sheet(part_name))
+        return sheet
+
+    def decode_cell(self, attributes, inner):
+        """Return the value of a template cell as openpyxl reads it (formulas as "=..." strings)."""
+        formula = _FORMULA.search(inner)
+        if formula is not None and formula.group(2):
+            return "=" + html.unescape(formula.group(2))
+        cell_type = attributes.get("t", "n")
+        if cell_type == "inlineStr":
+            return html.unescape("".join(_TEXT.findall(inner)))
+        value = _VALUE.search(inner)
+        if value is None:
+            return None
+        value = html.unescape(value.group(1))
+        if cell_type == "s":
+            return self._package.shared_strings()[int(value)]
+        if cell_type == "b":
+            return value == "1"
+        if cell_type in ("str", "e"):
+            return value
+        return float(value) if any(c in value for c in ".eE") else int(value)
+
+    def save(self, output_path):
+        """
+        Write the working paper: a copy of the template with the opened worksheets rewritten.
+
+        The archive is written next to `output_path` and moved into place once complete, with the
+        permissions of a newly created file (see `set_default_file_mode`).
+
+        Args:
+            output_path (str): Path of the working paper to write.
+
+        Raises:
+            StreamWriterUnsupported: If an edit could not be recorded (nothing is written).
+        """
+        if self._unsupported:
+            raise StreamWriterUnsupported(", ".join(dict.fromkeys(self._unsupported)))
+        for sheet in self._sheets.values():
+            sheet.prepare()
+        styles_part = self.related_parts.get("styles")
+        rewritten_styles = self._styles is not None and self._styles.changed
+        rewritten_parts = frozenset(self._sheets) | ({styles_part} if rewritten_styles else set())
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix=".tmp")
+        try:
+            # The untouched parts are copied as one pre-built archive and the rewritten parts appended to it
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._package.base_archive(rewritten_parts))
+            with zipfile.ZipFile(temp_path, "a", zipfile.ZIP_DEFLATED) as target:
+                for info in self._package.infos:
+                    name = info.filename
+                    if name in self._sheets:
+                        sheet_info = zipfile.ZipInfo(name, date_time=info.date_time)
+                        sheet_info.compress_type = zipfile.ZIP_DEFLATED
+                        with target.open(sheet_info, "w") as stream:
+                            self._sheets[name].write(stream)
+                    elif name == styles_part and rewritten_styles:
+                        target.writestr(info, self._styles.render().encode("utf-8"))
+            set_default_file_mode(temp_path)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise